@@ -0,0 +1,244 @@
+"""
+End-to-end pipeline benchmark, driven by the dummy instrument with zero latency and a fixed seed.
+
+Measures, against sweep length and repeat count:
+pipeline     points per second through MeasurementHandler -> DataHandler, from the start signal to the last array being sent for saving
+accumulate   the DataHandler np.vstack accumulation, including the live preview rebuilds every 333 ms
+plot         the PlotRenderer frame: drawing the JV figure on an Agg canvas and copying it to a QImage
+save         DataSaver write time, with and without the sweep catalogue
+
+python -m benchmarks.pipeline_benchmark --output bench.json
+python -m benchmarks.pipeline_benchmark --quick --compare bench.json
+python -m benchmarks.pipeline_benchmark --only pipeline --simulation loadTest.json
+python -m benchmarks.pipeline_benchmark --only pipeline --simulation loadTest.json --point-retries 2 --failed-points Skip
+
+Results are written as JSON, one entry per benchmark and size with the median and minimum of several rounds, so runs can be compared for regressions.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+import numpy as np
+from PyQt5.QtCore import *
+
+from threaded_objects.instruments import dummyInstrument as inst
+from threaded_objects.measurement_handler import MeasurementHandler
+from threaded_objects.data_handler import DataHandler
+from threaded_objects.data_saver import DataSaver
+from threaded_objects.recipe_queue import buildRecipe, FAILED_POINT_POLICIES
+from threaded_objects.instruments.dummy_simulation import loadSimulationSettings
+
+def timeRounds(function, rounds):
+    """Runs function rounds times, returns the list of wall clock times in seconds."""
+    _times = []
+    for _ in range(rounds):
+        _start = time.perf_counter()
+        function()
+        _times.append(time.perf_counter() - _start)
+    return _times
+
+def summarise(benchmark, parameters, times, items):
+    _median = statistics.median(times)
+    return {
+        "benchmark": benchmark,
+        **parameters,
+        "rounds": len(times),
+        "medianSeconds": _median,
+        "minimumSeconds": min(times),
+        "itemsPerSecond": items / _median if _median > 0 else None,
+    }
+
+class PipelineHarness(QObject):
+    """The measurement and data threads wired as in MainWindow, with the saving end replaced by a counter."""
+    startRecipeQueueSignal = pyqtSignal(list)
+
+    def __init__(self):
+        super().__init__()
+        self.THREAD_Measurement = QThread()
+        self.measurementHandler = MeasurementHandler(QMutex())
+        self.measurementHandler.moveToThread(self.THREAD_Measurement)
+        self.THREAD_Data = QThread()
+        self.dataHandler = DataHandler()
+        self.dataHandler.moveToThread(self.THREAD_Data)
+
+        self.measurementHandler.sendSweepPointSignal.connect(self.dataHandler.buildArrayFromSweepPoints, Qt.QueuedConnection)
+        self.measurementHandler.finaliseSweepArraySignal.connect(self.dataHandler.finaliseArray, Qt.QueuedConnection)
+        self.measurementHandler.abortMeasurementSignal.connect(self.dataHandler.abortMeasurement, Qt.QueuedConnection)
+        self.measurementHandler.sweepSetFinishedSignal.connect(self.dataHandler.finaliseRun, Qt.QueuedConnection)
+        self.measurementHandler.recipeStartedSignal.connect(self.dataHandler.setRecipe, Qt.QueuedConnection)
+        self.startRecipeQueueSignal.connect(self.measurementHandler.runRecipeQueue, Qt.QueuedConnection)
+
+        self.arraysReceived = 0
+        self.loop = QEventLoop()
+        self.dataHandler.sendDataArrayForSavingSingal.connect(self.countArray, Qt.QueuedConnection)
+        self.dataHandler.runFinishedSignal.connect(self.loop.quit, Qt.QueuedConnection)
+
+        self.THREAD_Measurement.start()
+        self.THREAD_Data.start()
+
+    @pyqtSlot(np.ndarray, dict)
+    def countArray(self, dataArray, recipe):
+        self.arraysReceived += 1
+
+    def run(self, points, repeats, failurePolicy=None, expectComplete=True):
+        """failurePolicy: (dict or None) "Point Retries" and "Failed Points" sweep settings, see recipe_queue.DEFAULT_RECIPE."""
+        self.arraysReceived = 0
+        _recipe = buildRecipe({"Sweep Settings": {"Points": points, "Repeats": repeats, **(failurePolicy or {})}})
+        self.startRecipeQueueSignal.emit([_recipe])
+        self.loop.exec()
+        if expectComplete and self.arraysReceived != repeats:
+            raise RuntimeError(f"Expected {repeats} sweeps, received {self.arraysReceived}")
+
+    def close(self):
+        for _thread in (self.THREAD_Measurement, self.THREAD_Data):
+            _thread.quit()
+            _thread.wait()
+
+def benchmarkPipeline(sweepLengths, repeatCounts, rounds, failurePolicy=None, expectComplete=True):
+    """expectComplete is False for simulations whose injected failures abort runs part way ("Failed Points": "Abort")."""
+    _results = []
+    _harness = PipelineHarness()
+    try:
+        for _points in sweepLengths:
+            for _repeats in repeatCounts:
+                _times = timeRounds(lambda: _harness.run(_points, _repeats, failurePolicy, expectComplete), rounds)
+                _results.append(summarise("pipeline", {"points": _points, "repeats": _repeats}, _times, _points * _repeats))
+    finally:
+        _harness.close()
+    return _results
+
+def benchmarkAccumulate(sweepLengths, rounds, previewEvery=7):
+    """
+    Repeats what DataHandler does with a sweep: one append per point, a full np.vstack for the live preview every previewEvery points
+    (the 333 ms timer at the dummy instrument's ~20 points per second), and a final np.vstack.
+    """
+    _results = []
+    for _points in sweepLengths:
+        _sweepPoints = [np.array([[_i, _i]], dtype=float) for _i in range(_points)]
+
+        def accumulate():
+            _workingArray = []
+            for _i, _sweepPoint in enumerate(_sweepPoints):
+                _workingArray.append(_sweepPoint)
+                if previewEvery and _i % previewEvery == 0:
+                    np.vstack(_workingArray)
+            np.vstack(_workingArray)
+
+        _results.append(summarise("accumulate", {"points": _points, "previewEvery": previewEvery}, timeRounds(accumulate, rounds), _points))
+    return _results
+
+def benchmarkPlot(sweepLengths, rounds):
+    """The render step of PlotRenderer alone (drawSweep, Agg draw and QImage copy), at the default frame size."""
+    from threaded_objects.plot_renderer import PlotRenderer
+
+    _renderer = PlotRenderer()
+    _results = []
+    for _points in sweepLengths:
+        _dataToPlot = np.column_stack((np.linspace(1.05, -0.05, _points), np.random.default_rng(0).random(_points)))
+        _results.append(summarise("plot", {"points": _points}, timeRounds(lambda: _renderer.render(("sweep", _dataToPlot, 0.0)), rounds), 1))
+    return _results
+
+def benchmarkSave(sweepLengths, rounds):
+    _results = []
+    _folder = tempfile.mkdtemp(prefix="sweepBenchmark")
+    _mutex = QMutex()
+    try:
+        for _catalogue in (False, True):
+            _cataloguePath = os.path.join(_folder, "catalogue.sqlite") if _catalogue else None
+            for _points in sweepLengths:
+                _dataArray = np.column_stack((np.linspace(1.05, -0.05, _points), np.random.default_rng(0).random(_points)))
+                _sweepSettings = np.array([[1.05, -0.05, 1, 10.0]])
+                _analysisSettings = np.array([[0.05, 100.0]])
+                _save = lambda: DataSaver(_mutex, _dataArray, _sweepSettings, _analysisSettings, f"Bench{_points}", _folder, _cataloguePath).run()
+                _results.append(summarise("save", {"points": _points, "catalogue": _catalogue}, timeRounds(_save, rounds), 1))
+    finally:
+        shutil.rmtree(_folder, ignore_errors=True)
+    return _results
+
+def resultKey(result):
+    return tuple(sorted((_key, _value) for _key, _value in result.items() if _key not in ("rounds", "medianSeconds", "minimumSeconds", "itemsPerSecond")))
+
+def compareResults(results, baselinePath):
+    """Prints the median time of every result relative to the same benchmark and size in a previous run."""
+    with open(baselinePath, "r") as file:
+        _baseline = {resultKey(_result): _result for _result in json.load(file)["results"]}
+
+    print(f"\nCompared with {baselinePath} (ratio > 1 is slower):")
+    for _result in results:
+        _previous = _baseline.get(resultKey(_result))
+        if _previous:
+            _ratio = _result["medianSeconds"] / _previous["medianSeconds"]
+            print(f"{_ratio:6.2f}x  {dict(resultKey(_result))}")
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description="Pipeline benchmark with the zero-latency dummy instrument.")
+    _parser.add_argument("--output", help="Write the results to this JSON file.")
+    _parser.add_argument("--compare", help="Compare with the results of a previous run.")
+    _parser.add_argument("--quick", action="store_true", help="Fewer sizes and rounds.")
+    _parser.add_argument("--rounds", type=int, help="Rounds per measurement (default 5, 2 with --quick).")
+    _parser.add_argument("--seed", type=int, default=0)
+    _parser.add_argument("--simulation", help="Dummy instrument simulation settings (JSON) to use instead of zero latency, to load test with realistic or replayed timing.")
+    _parser.add_argument("--point-retries", type=int, default=0, help="Times a failed point is measured again (pipeline benchmark).")
+    _parser.add_argument("--failed-points", choices=FAILED_POINT_POLICIES, default="Abort", help="What a point that failed every retry does to the run (pipeline benchmark).")
+    _parser.add_argument("--only", nargs="+", choices=["pipeline", "accumulate", "plot", "save"], help="Run only these benchmarks.")
+    _arguments = _parser.parse_args(argv)
+
+    _rounds = _arguments.rounds or (2 if _arguments.quick else 5)
+    _sweepLengths = [250, 2500] if _arguments.quick else [250, 1000, 5000, 20000]
+    _repeatCounts = [1, 10] if _arguments.quick else [1, 10, 100]
+    _benchmarks = _arguments.only or ["pipeline", "accumulate", "plot", "save"]
+
+    app = QCoreApplication(sys.argv[:1])
+    if _arguments.simulation:
+        inst.configureSimulation(seed=_arguments.seed, settings=loadSimulationSettings(_arguments.simulation))
+    else:
+        inst.configureSimulation(zeroLatency=True, seed=_arguments.seed)
+
+    _results = []
+    if "pipeline" in _benchmarks:
+        _failurePolicy = {"Point Retries": _arguments.point_retries, "Failed Points": _arguments.failed_points}
+        _expectComplete = not _arguments.simulation or _arguments.failed_points == "Skip" # Skipped points still complete every sweep
+        _results += benchmarkPipeline(_sweepLengths, _repeatCounts, _rounds, _failurePolicy, _expectComplete)
+    if "accumulate" in _benchmarks:
+        _results += benchmarkAccumulate(_sweepLengths, _rounds)
+    if "plot" in _benchmarks:
+        _results += benchmarkPlot(_sweepLengths, _rounds)
+    if "save" in _benchmarks:
+        _results += benchmarkSave(_sweepLengths, _rounds)
+
+    for _result in _results:
+        _parameters = ", ".join(f"{_key}={_value}" for _key, _value in resultKey(_result) if _key != "benchmark")
+        _rate = f"{_result['itemsPerSecond']:12.1f}/s" if _result["itemsPerSecond"] else ""
+        print(f"{_result['benchmark']:<11} {_parameters:<40} {_result['medianSeconds']*1000:10.2f} ms {_rate}")
+
+    _report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "qt": QT_VERSION_STR,
+            "platform": platform.platform(),
+            "seed": _arguments.seed,
+            "simulation": _arguments.simulation,
+            "pointRetries": _arguments.point_retries,
+            "failedPoints": _arguments.failed_points,
+            "rounds": _rounds,
+        },
+        "results": _results,
+    }
+    if _arguments.output:
+        with open(_arguments.output, "w") as file:
+            json.dump(_report, file, indent=4)
+    if _arguments.compare:
+        compareResults(_results, _arguments.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import numpy as np
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+
+from threaded_objects.pipeline_telemetry import LATENCY_STAGES
+from .plot_view import PlotView
+
+class DiagnosticsView(QWidget):
+    """
+    Diagnostics tab: a summary table of every stage latency and queue depth histogram of a PipelineTelemetry, and the latency histograms themselves.
+
+    Refreshed once a second, only while the tab is shown, so it costs nothing during a measurement unless someone is looking at it. The histograms
+    are drawn by a PlotRenderer on the plot thread (connected by MainWindow), the GUI thread only collects the bucket counts.
+    """
+    latencyCurvesSignal = pyqtSignal(list) # (stage, bucket edges (ms), counts) of every stage with samples, see plot_renderer.drawLatencies
+
+    headers = ["Count", "Mean", "p50", "p90", "p99", "Max", "Unit"]
+
+    def __init__(self, telemetry, parent=None, refreshInterval=1000):
+        super().__init__(parent)
+        self.telemetry = telemetry
+
+        self.layoutDiagnostics = QVBoxLayout(self)
+
+        self.displaySummary = QTableWidget(0, len(self.headers), self)
+        self.displaySummary.setHorizontalHeaderLabels(self.headers)
+        self.displaySummary.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.displaySummary.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
+        self.plotView = PlotView(self)
+
+        self.masterControls = QWidget(self)
+        self.layoutControls = QHBoxLayout(self.masterControls)
+        self.controlExportButton = QPushButton("Export...", self.masterControls)
+        self.controlResetButton = QPushButton("Reset", self.masterControls)
+        self.labelSince = QLabel("", self.masterControls)
+        self.layoutControls.addWidget(self.controlExportButton)
+        self.layoutControls.addWidget(self.controlResetButton)
+        self.layoutControls.addWidget(self.labelSince)
+        self.layoutControls.addStretch()
+
+        self.layoutDiagnostics.addWidget(self.displaySummary)
+        self.layoutDiagnostics.addWidget(self.plotView, 1)
+        self.layoutDiagnostics.addWidget(self.masterControls)
+
+        self.controlExportButton.clicked.connect(self.exportTelemetry)
+        self.controlResetButton.clicked.connect(self.resetTelemetry)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(refreshInterval)
+        self.refreshTimer.timeout.connect(self.refresh)
+        self.refreshTimer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh() # Up to date as soon as the tab is opened, not a second later
+
+    @pyqtSlot()
+    def refresh(self):
+        if not self.isVisible():
+            return
+
+        _histograms = self.telemetry.histograms()
+        self.displaySummary.setRowCount(len(_histograms))
+        self.displaySummary.setVerticalHeaderLabels([_name for _name, _ in _histograms])
+        for _row, (_name, _histogram) in enumerate(_histograms):
+            _summary = _histogram.summary()
+            _values = [str(_summary["count"])] + [f"{_summary[_key]:.3g}" for _key in ("mean", "p50", "p90", "p99", "max")] + [_summary["unit"]]
+            for _column, _text in enumerate(_values):
+                self.displaySummary.setItem(_row, _column, QTableWidgetItem(_text))
+
+        self.labelSince.setText(f"Recording since {self.telemetry.startTime.strftime('%Y-%m-%d %H:%M:%S')}")
+        self.plotLatencies()
+
+    def plotLatencies(self):
+        _latencyCurves = []
+        for _stage in LATENCY_STAGES:
+            _histogram = self.telemetry.latencies[_stage]
+            _counts = _histogram.snapshot()
+            if not _counts.any():
+                continue
+            _edges = _histogram.upperEdges()[:-1] # The overflow bucket has no upper edge, it is drawn at the maximum
+            _latencyCurves.append((_stage, np.append(_edges, _edges[-1] * 10 ** (1 / _histogram.bucketsPerDecade)), _counts))
+        self.latencyCurvesSignal.emit(_latencyCurves)
+
+    @pyqtSlot()
+    def exportTelemetry(self):
+        _exportPath, _ = QFileDialog.getSaveFileName(self, "Export Diagnostics", "pipelineTelemetry.json", "JSON Files (*.json)")
+        if not _exportPath:
+            return
+
+        try:
+            self.telemetry.export(_exportPath)
+        except OSError as error:
+            QMessageBox.warning(self, "Warning!", f"The diagnostics could not be exported:\n{error}")
+
+    @pyqtSlot()
+    def resetTelemetry(self):
+        self.telemetry.reset()
+        self.refresh()
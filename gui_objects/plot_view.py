@@ -0,0 +1,41 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtWidgets import *
+
+class PlotView(QWidget):
+    """
+    Shows the frames drawn by a PlotRenderer. Painting is a single image copy, so the GUI thread never waits for matplotlib.
+
+    The renderer draws at the size reported by resizedSignal. Until a frame at the new size arrives the last one is stretched to fit.
+    """
+    resizedSignal = pyqtSignal(int, int, float) # Width, height (device independent pixels) and device pixel ratio
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.frame = QImage()
+        self.setMinimumSize(200, 150)
+        self.setAttribute(Qt.WA_OpaquePaintEvent) # Every pixel is covered by the frame, Qt need not clear the background first
+
+    def sizeHint(self):
+        return QSize(640, 480) # Default matplotlib figure size, as the canvas this replaces
+
+    @pyqtSlot(QImage)
+    def showFrame(self, frame):
+        self.frame = frame
+        self.update()
+
+    def paintEvent(self, event):
+        _painter = QPainter(self)
+        if self.frame.isNull():
+            _painter.fillRect(self.rect(), Qt.white)
+        else:
+            _painter.drawImage(QRectF(self.rect()), self.frame)
+        _painter.end()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.announceSize()
+
+    def announceSize(self):
+        """Emits the current size, also CALLED FROM: MainWindow once the renderer is connected, the window is laid out before that."""
+        self.resizedSignal.emit(self.width(), self.height(), self.devicePixelRatioF())
@@ -0,0 +1,211 @@
+import numpy as np
+from PyQt5.QtCore import *
+
+class ResultsTableModel(QAbstractTableModel):
+    """
+    Table model for the figures of merit of every finished sweep, stored as columnar NumPy arrays.
+
+    Cell names are stored once in self.cellNames and referenced per row by an integer code, the figures of merit are one float column each.
+    The view only asks for the rows it draws, sorting and filtering work on whole columns at once, and rows are appended in batches with
+    beginInsertRows()/endInsertRows() (one per batch, or per run of neighbouring rows in a sorted view), so the table stays responsive with hundreds of
+    thousands of rows.
+    """
+    headers = ["Cell Name", "Voc", "Jsc", "FF", "Efficiency"]
+    valueFormats = ["{:.3f}", "{:.3f}", "{:.3f}", "{:.2f}"]
+
+    def __init__(self, parent=None, batchInterval=250):
+        super().__init__(parent)
+
+        self.cellNames = []          # Unique cell names, index = code
+        self.cellNameCodes = {}      # Name -> code
+        self.codes = np.empty(1024, dtype=np.int32)
+        self.values = np.empty((1024, 4))
+        self.rowsStored = 0
+
+        self.viewRows = np.empty(0, dtype=np.int64) # Stored row shown at each view position, after filtering and sorting
+        self.sortColumn = -1
+        self.sortOrder = Qt.AscendingOrder
+        self.filterText = ""
+        self.valueRanges = {}
+
+        # Rows queued with queueRow() are appended together
+        self.pendingNames = []
+        self.pendingValues = []
+        self.batchTimer = QTimer(self)
+        self.batchTimer.setSingleShot(True)
+        self.batchTimer.setInterval(batchInterval)
+        self.batchTimer.timeout.connect(self.flushPendingRows)
+
+    # Qt model interface
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.viewRows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        _row = self.viewRows[index.row()]
+        _column = index.column()
+
+        if role == Qt.DisplayRole:
+            if _column == 0:
+                return self.cellNames[self.codes[_row]]
+            _value = self.values[_row, _column-1]
+            return "" if np.isnan(_value) else self.valueFormats[_column-1].format(_value)
+
+        if role == Qt.TextAlignmentRole and _column > 0:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sortColumn = column
+        self.sortOrder = order
+
+        self.layoutAboutToBeChanged.emit()
+        _persistentIndexes = self.persistentIndexList()
+        _persistentRows = [self.viewRows[_index.row()] for _index in _persistentIndexes]
+
+        self.viewRows = self.sortedRows(self.viewRows)
+
+        # Keep selections and the current index on the same stored rows
+        _positions = np.full(self.rowsStored, -1, dtype=np.int64)
+        _positions[self.viewRows] = np.arange(len(self.viewRows))
+        self.changePersistentIndexList(_persistentIndexes,
+            [self.index(int(_positions[_row]), _index.column()) for _row, _index in zip(_persistentRows, _persistentIndexes)])
+        self.layoutChanged.emit()
+
+    # Data
+    @pyqtSlot(str, np.ndarray)
+    def queueRow(self, cellName, figuresOfMerit):
+        """Queues one row, the queue is appended as one batch after batchInterval ms."""
+        self.pendingNames.append(cellName)
+        self.pendingValues.append(figuresOfMerit)
+        if not self.batchTimer.isActive():
+            self.batchTimer.start()
+
+    @pyqtSlot()
+    def flushPendingRows(self):
+        if self.pendingNames:
+            self.appendRows(self.pendingNames, np.vstack(self.pendingValues))
+            self.pendingNames = []
+            self.pendingValues = []
+
+    def appendRows(self, cellNames, values):
+        """
+        Appends a batch of rows.
+
+        cellNames: (list) one name per row.
+        values: (np.ndarray) shape (rows, 4), [Voc, Jsc, FF, Efficiency] per row.
+        """
+        _count = len(cellNames)
+        if _count == 0:
+            return
+
+        # Grow the columns geometrically, so appending stays cheap on average
+        _required = self.rowsStored + _count
+        if _required > len(self.codes):
+            _capacity = max(_required, 2 * len(self.codes))
+            self.codes = np.resize(self.codes, _capacity)
+            _values = np.empty((_capacity, 4))
+            _values[:self.rowsStored] = self.values[:self.rowsStored]
+            self.values = _values
+
+        for _offset, _name in enumerate(cellNames):
+            _code = self.cellNameCodes.get(_name)
+            if _code is None:
+                _code = len(self.cellNames)
+                self.cellNameCodes[_name] = _code
+                self.cellNames.append(_name)
+            self.codes[self.rowsStored + _offset] = _code
+        self.values[self.rowsStored:_required] = values
+
+        _newRows = np.arange(self.rowsStored, _required)
+        self.rowsStored = _required
+        _newRows = _newRows[self.filterMask(_newRows)]
+
+        if self.sortColumn >= 0 and len(_newRows):
+            # New rows can land anywhere in a sorted view. The sort is stable and the rows shown are already in order, so merging keeps them in the
+            # same order and the new rows are inserted at their sorted positions, one insert per run of neighbouring new rows.
+            _merged = self.sortedRows(np.concatenate((self.viewRows, _newRows)))
+            _isNew = _merged >= _newRows[0] # New rows are stored after every row already shown
+            _newPositions = np.flatnonzero(_isNew)
+            _runEnds = np.append(np.flatnonzero(np.diff(_newPositions) > 1), len(_newPositions) - 1)
+            _runStart = 0
+            for _runEnd in _runEnds:
+                _first, _last = _newPositions[_runStart], _newPositions[_runEnd]
+                self.beginInsertRows(QModelIndex(), int(_first), int(_last))
+                self.viewRows = _merged[~_isNew | (np.arange(len(_merged)) <= _last)]
+                self.endInsertRows()
+                _runStart = _runEnd + 1
+        elif len(_newRows):
+            _first = len(self.viewRows)
+            self.beginInsertRows(QModelIndex(), _first, _first + len(_newRows) - 1)
+            self.viewRows = np.concatenate((self.viewRows, _newRows))
+            self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.rowsStored = 0
+        self.viewRows = np.empty(0, dtype=np.int64)
+        self.cellNames = []
+        self.cellNameCodes = {}
+        self.endResetModel()
+
+    # Sorting and filtering
+    def setFilter(self, filterText="", valueRanges=None):
+        """
+        Shows only the rows whose cell name contains filterText (case insensitive) and whose values are inside valueRanges.
+
+        valueRanges: (dict) column -> (minimum, maximum), e.g. {3: (0.7, 1)} for FF > 0.7. Either limit can be None.
+        """
+        self.filterText = filterText.lower()
+        self.valueRanges = valueRanges or {}
+
+        self.beginResetModel()
+        _rows = np.arange(self.rowsStored)
+        self.viewRows = self.sortedRows(_rows[self.filterMask(_rows)])
+        self.endResetModel()
+
+    def filterMask(self, rows):
+        _mask = np.ones(len(rows), dtype=bool)
+
+        if self.filterText:
+            # Only the unique names are compared as strings, the rows are matched by code
+            _matchingCodes = [_code for _code, _name in enumerate(self.cellNames) if self.filterText in _name.lower()]
+            _mask &= np.isin(self.codes[rows], _matchingCodes)
+
+        for _column, (_minimum, _maximum) in self.valueRanges.items():
+            _columnValues = self.values[rows, _column-1]
+            if _minimum is not None:
+                _mask &= _columnValues >= _minimum
+            if _maximum is not None:
+                _mask &= _columnValues <= _maximum
+
+        return _mask
+
+    def sortedRows(self, rows):
+        if self.sortColumn < 0 or len(rows) == 0:
+            return rows
+
+        if self.sortColumn == 0:
+            _nameRanks = np.argsort(np.argsort(np.array(self.cellNames, dtype=object)))
+            _keys = _nameRanks[self.codes[rows]]
+        else:
+            _keys = self.values[rows, self.sortColumn-1]
+
+        # Descending sorts the negated keys rather than reversing, so equal keys keep their order (and empty values stay last) either way
+        if self.sortOrder == Qt.DescendingOrder:
+            _keys = -_keys
+        _order = np.argsort(_keys, kind="stable")
+        return rows[_order]
@@ -0,0 +1,298 @@
+import os
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import *
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+from threaded_objects.data_archiver import readSweepFile
+from threaded_objects.sweep_index import THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, FolderScanner, ThumbnailLoader, ThumbnailCachePruner
+
+class SweepBrowserModel(QAbstractTableModel):
+    """
+    Table model of the sweeps in a folder, listed from file metadata only (see sweep_index.listSweepFiles).
+
+    Thumbnails are only asked for by the view for the rows it draws. Requests are collected and sent to the loader pool once scrolling pauses,
+    newest first and at most maximumBatch at a time, so rows that were only scrolled past cost no I/O. Loaded thumbnails are kept in a bounded
+    in-memory LRU cache in front of the disk cache.
+    """
+    headers = ["Preview", "Sweep", "Archive", "Modified", "Size (kB)"]
+
+    def __init__(self, cacheFolder, parent=None, memoryCacheSize=1000, maximumBatch=40, requestDelay=100):
+        super().__init__(parent)
+        self.cacheFolder = cacheFolder
+        self.folderPath = ""
+        self.entries = []
+        self.rowOfPath = {}
+        self.generation = 0 # Results of scans and loads started for an earlier folder listing are ignored
+        self.sortColumn = 3
+        self.sortOrder = Qt.DescendingOrder
+
+        self.thumbnails = OrderedDict() # Sweep path -> QPixmap, least recently used first. A null pixmap marks an unreadable sweep.
+        self.memoryCacheSize = memoryCacheSize
+        self.requested = set() # Paths sent to the loader pool
+        self.wanted = OrderedDict() # Paths drawn since the last batch, in the order they were drawn
+        self.maximumBatch = maximumBatch
+        self.requestCount = 0
+
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(2)
+        self.requestTimer = QTimer(self)
+        self.requestTimer.setSingleShot(True)
+        self.requestTimer.setInterval(requestDelay)
+        self.requestTimer.timeout.connect(self.requestWantedThumbnails)
+
+    # Qt model interface
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        _entry = self.entries[index.row()]
+        _column = index.column()
+
+        if _column == 0:
+            if role == Qt.DecorationRole:
+                return self.thumbnail(_entry)
+            if role == Qt.SizeHintRole:
+                return QSize(THUMBNAIL_WIDTH + 8, THUMBNAIL_HEIGHT + 4)
+            return None
+
+        if role == Qt.DisplayRole:
+            if _column == 1:
+                return _entry.name
+            if _column == 2:
+                return _entry.container
+            if _column == 3:
+                return datetime.fromtimestamp(_entry.modified).strftime("%Y-%m-%d %H:%M:%S")
+            return f"{_entry.size / 1024:.1f}"
+
+        if role == Qt.TextAlignmentRole and _column == 4:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+
+        if role == Qt.ToolTipRole:
+            return _entry.path
+
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if not 0 <= column < len(self.headers):
+            return
+        self.sortColumn = column
+        self.sortOrder = order
+        self.layoutAboutToBeChanged.emit()
+        _persistentIndexes = self.persistentIndexList()
+        _persistentPaths = [self.entries[_index.row()].path for _index in _persistentIndexes]
+
+        self.sortEntries()
+
+        # Keep selections and the current index on the same sweeps
+        self.changePersistentIndexList(_persistentIndexes,
+            [self.index(self.rowOfPath[_path], _index.column()) for _path, _index in zip(_persistentPaths, _persistentIndexes)])
+        self.layoutChanged.emit()
+
+    def sortEntries(self):
+        _keys = [
+            lambda entry: entry.modified, # Preview, by age
+            lambda entry: entry.name,
+            lambda entry: (entry.container, entry.name),
+            lambda entry: entry.modified,
+            lambda entry: entry.size,
+        ]
+        self.entries.sort(key=_keys[self.sortColumn], reverse=self.sortOrder == Qt.DescendingOrder)
+        self.rowOfPath = {_entry.path: _row for _row, _entry in enumerate(self.entries)}
+
+    # Folder listing
+    def setFolder(self, folderPath):
+        """Lists folderPath on a pool thread, the rows are replaced once the listing is done."""
+        self.folderPath = folderPath
+        self.generation += 1
+        self.threadpool.clear() # Loads not yet started are for the previous listing
+        self.requested.clear()
+        self.wanted.clear()
+        if not folderPath or not os.path.isdir(folderPath):
+            self.respondFolderScanned(self.generation, [])
+            return
+
+        _scanner = FolderScanner(folderPath, self.generation)
+        _scanner.signals.folderScannedSignal.connect(self.respondFolderScanned, Qt.QueuedConnection)
+        self.threadpool.start(_scanner)
+
+    @pyqtSlot(int, list)
+    def respondFolderScanned(self, generation, entries):
+        if generation != self.generation:
+            return
+        self.beginResetModel()
+        self.entries = entries
+        self.sortEntries() # In the order last chosen in the view, a new listing is not sorted by the view itself
+        self.endResetModel()
+
+    def entry(self, row):
+        return self.entries[row]
+
+    # Thumbnails
+    def thumbnail(self, entry):
+        _pixmap = self.thumbnails.get(entry.path)
+        if _pixmap is not None:
+            self.thumbnails.move_to_end(entry.path)
+            return None if _pixmap.isNull() else _pixmap
+
+        if entry.path not in self.requested:
+            self.wanted[entry.path] = entry
+            self.wanted.move_to_end(entry.path)
+            self.requestTimer.start() # Restarted on every new row, so nothing is loaded while the view is still scrolling
+        return None
+
+    @pyqtSlot()
+    def requestWantedThumbnails(self):
+        """Sends the most recently drawn rows to the loader pool, the newest with the highest priority."""
+        _batch = list(self.wanted.values())[-self.maximumBatch:]
+        self.wanted.clear() # Rows left out are asked for again if they are drawn again
+        for _entry in _batch:
+            self.requested.add(_entry.path)
+            self.requestCount += 1
+            _loader = ThumbnailLoader(_entry, self.cacheFolder, self.generation)
+            _loader.signals.thumbnailLoadedSignal.connect(self.respondThumbnailLoaded, Qt.QueuedConnection)
+            self.threadpool.start(_loader, self.requestCount) # Higher priority runs first, so the rows drawn last load first
+
+    @pyqtSlot(int, str, QImage)
+    def respondThumbnailLoaded(self, generation, path, image):
+        if generation != self.generation:
+            return
+        self.requested.discard(path)
+        self.thumbnails[path] = QPixmap.fromImage(image) # Null for an unreadable sweep, so it is not asked for again
+        while len(self.thumbnails) > self.memoryCacheSize:
+            self.thumbnails.popitem(last=False) # Evicted thumbnails come back from the disk cache
+
+        _row = self.rowOfPath.get(path)
+        if _row is not None:
+            _index = self.index(_row, 0)
+            self.dataChanged.emit(_index, _index, [Qt.DecorationRole])
+
+class SweepBrowserView(QWidget):
+    """
+    Browser tab: the sweeps of the working folder with thumbnails, and the full curve and file header of the sweep that is opened.
+
+    The folder is listed again when the tab is opened after the folder changed or a run was saved (markStale), or with Refresh.
+    """
+    def __init__(self, cacheFolder, parent=None):
+        super().__init__(parent)
+        self.folderPath = ""
+        self.stale = True
+        self.cacheFolder = cacheFolder
+        self.cachePruned = False
+
+        self.layoutBrowser = QVBoxLayout(self)
+
+        self.masterControls = QWidget(self)
+        self.layoutControls = QHBoxLayout(self.masterControls)
+        self.controlRefreshButton = QPushButton("Refresh", self.masterControls)
+        self.labelFolder = QLabel("", self.masterControls)
+        self.layoutControls.addWidget(self.controlRefreshButton)
+        self.layoutControls.addWidget(self.labelFolder, 1)
+
+        self.browserModel = SweepBrowserModel(cacheFolder, self)
+        self.tableView = QTableView(self)
+        self.tableView.setModel(self.browserModel)
+        self.tableView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tableView.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tableView.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableView.setIconSize(QSize(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+        self.tableView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed) # As the results table
+        self.tableView.verticalHeader().setDefaultSectionSize(THUMBNAIL_HEIGHT + 4)
+        self.tableView.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.tableView.setColumnWidth(0, THUMBNAIL_WIDTH + 8)
+        self.tableView.setSortingEnabled(True)
+        self.tableView.sortByColumn(3, Qt.DescendingOrder) # Newest first
+
+        # Opened sweep
+        self.figure = Figure()
+        self.canvasWidget = FigureCanvas(self.figure)
+        self.displayHeader = QPlainTextEdit(self)
+        self.displayHeader.setReadOnly(True)
+        self.displayHeader.setMaximumHeight(120)
+
+        self.splitterBrowser = QSplitter(Qt.Vertical, self)
+        self.splitterBrowser.addWidget(self.tableView)
+        self.masterPreview = QWidget(self.splitterBrowser)
+        self.layoutPreview = QVBoxLayout(self.masterPreview)
+        self.layoutPreview.setContentsMargins(0, 0, 0, 0)
+        self.layoutPreview.addWidget(self.canvasWidget, 1)
+        self.layoutPreview.addWidget(self.displayHeader)
+        self.splitterBrowser.addWidget(self.masterPreview)
+
+        self.layoutBrowser.addWidget(self.masterControls)
+        self.layoutBrowser.addWidget(self.splitterBrowser, 1)
+
+        self.controlRefreshButton.clicked.connect(self.refresh)
+        self.tableView.activated.connect(self.openSweep)
+
+    def setFolder(self, folderPath):
+        """
+        CALLED FROM: MainWindow (loadProgramSettings, folderBrowse), whenever the working folder is set. Lists the folder straight away if the tab is
+        open and the folder changed or is stale, otherwise when the tab is next opened.
+        """
+        if folderPath != self.folderPath:
+            self.folderPath = folderPath
+            self.stale = True
+        if self.stale and self.isVisible():
+            self.refresh()
+
+    @pyqtSlot()
+    def markStale(self):
+        """SLOT CALLED FROM: SaveService, new sweeps were saved. Listed again straight away if the tab is open, otherwise when it is opened."""
+        self.stale = True
+        if self.isVisible():
+            self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.cachePruned:
+            self.cachePruned = True
+            QThreadPool.globalInstance().start(ThumbnailCachePruner(self.cacheFolder)) # Not on the model's pool, a new listing clears that
+        if self.stale:
+            self.refresh()
+
+    @pyqtSlot()
+    def refresh(self):
+        self.stale = False
+        self.labelFolder.setText(self.folderPath or "No working folder selected.")
+        self.browserModel.setFolder(self.folderPath)
+
+    @pyqtSlot(QModelIndex)
+    def openSweep(self, index):
+        """Reads the sweep of the activated row, the only time the browser reads a sweep's data."""
+        _entry = self.browserModel.entry(index.row())
+        try:
+            _settings, _dataArray = readSweepFile(_entry.path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as _error:
+            self.displayHeader.setPlainText(f"Could not read {_entry.path}: {_error}")
+            return
+        if _dataArray.ndim != 2 or _dataArray.shape[1] < 2:
+            self.displayHeader.setPlainText(f"Could not read {_entry.path}: not a sweep file (no voltage and current columns).")
+            return
+
+        self.displayHeader.setPlainText("\n".join(f"{_key}: {_value}" for _key, _value in _settings.items()))
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        ax.plot(_dataArray[:,0], _dataArray[:,1], "kx-")
+        ax.grid()
+        ax.set_xlabel("Voltage (V)")
+        ax.set_ylabel("Current (A)")
+        ax.set_title(_entry.name)
+        self.canvasWidget.draw()
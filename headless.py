@@ -0,0 +1,221 @@
+"""
+Headless measurement runner.
+
+Runs the same MeasurementHandler -> DataHandler -> SaveService pipeline as the GUI under a plain QCoreApplication, with no widgets or plotting.
+Settings come from a programSettings.json style file (or a recipe queue file) and can be overridden on the command line, e.g.
+
+python headless.py --settings programSettings.json --cell-name CellA --repeats 10
+python headless.py --settings overnightQueue.json
+python headless.py --settings programSettings.json --simulation loadTest.json
+python headless.py --settings programSettings.json --cell-name CellA --track 86400
+python headless.py --settings programSettings.json --separate-process
+python headless.py --settings programSettings.json --sweep-type Hysteresis --repeats 5
+"""
+import os
+import sys
+import signal
+import argparse
+from datetime import datetime
+
+from PyQt5.QtCore import *
+
+from threaded_objects.measurement_handler import MeasurementHandler, inst
+from threaded_objects.acquisition_process import AcquisitionProcessProxy
+from threaded_objects.data_handler import DataHandler
+from threaded_objects.save_service import SaveService
+from threaded_objects.recipe_queue import loadRecipeQueue, checkRecipe
+from threaded_objects.voltage_sampler import SAMPLING_MODES
+from threaded_objects.sweep_plan import SWEEP_TYPES, compileRecipePlan
+from threaded_objects.sweep_catalogue import CATALOGUE_FILE_NAME
+from threaded_objects.instruments.dummy_simulation import loadSimulationSettings
+
+class HeadlessRunner(QObject):
+    startRecipeQueueSignal = pyqtSignal(list)
+    startTrackingSignal = pyqtSignal(dict)
+    abortMeasurementSignal = pyqtSignal()
+
+    def __init__(self, recipes, cataloguePath=None, tracking=False, separateProcess=False, simulationSettings=None):
+        super().__init__()
+        self.recipes = recipes
+        self.tracking = tracking # Track the maximum power point with the first recipe instead of measuring the queue
+        self.separateProcess = separateProcess # Measure in a child process, simulationSettings are applied to the dummy instrument there
+        self.aborted = False
+
+        # Mutex objects
+        self.mutexMeasurement = QMutex()
+        self.mutexFileSaving = QMutex()
+
+        # Measurement Thread
+        self.THREAD_Measurement = QThread()
+        if self.separateProcess:
+            self.measurementHandler = AcquisitionProcessProxy(simulationSettings=simulationSettings)
+            self.THREAD_Measurement.started.connect(self.measurementHandler.startPolling)
+            self.measurementHandler.initialisedSignal.connect(self.updateConsole, Qt.QueuedConnection) # Commands sent before it wait in the pipe
+        else:
+            self.measurementHandler = MeasurementHandler(self.mutexMeasurement)
+        self.measurementHandler.moveToThread(self.THREAD_Measurement)
+        self.THREAD_Measurement.start()
+
+        # Data Handler Thread, nothing to plot so no live preview
+        self.THREAD_Data = QThread()
+        self.dataHandler = DataHandler(livePreview=False)
+        self.dataHandler.moveToThread(self.THREAD_Data)
+        self.THREAD_Data.start()
+
+        self.saveService = SaveService(self.mutexFileSaving, cataloguePath)
+
+        # Measurement Handler to Data Handler
+        self.measurementHandler.sendSweepPointSignal.connect(self.dataHandler.buildArrayFromSweepPoints, Qt.QueuedConnection)
+        self.measurementHandler.finaliseSweepArraySignal.connect(self.dataHandler.finaliseArray, Qt.QueuedConnection)
+        self.measurementHandler.abortMeasurementSignal.connect(self.dataHandler.abortMeasurement, Qt.QueuedConnection)
+        self.measurementHandler.sweepSetFinishedSignal.connect(self.dataHandler.finaliseRun, Qt.QueuedConnection)
+        self.measurementHandler.recipeStartedSignal.connect(self.dataHandler.setRecipe, Qt.QueuedConnection)
+        self.measurementHandler.trackingStartedSignal.connect(self.dataHandler.startTracking, Qt.QueuedConnection)
+        self.measurementHandler.sendTrackingSamplesSignal.connect(self.dataHandler.addTrackingSamples, Qt.QueuedConnection)
+
+        # Data Handler to Save Service
+        self.dataHandler.sendDataArrayForSavingSingal.connect(self.saveService.saveData, Qt.QueuedConnection)
+        self.dataHandler.runFinishedSignal.connect(self.saveService.requestArchive, Qt.QueuedConnection)
+        self.saveService.runSavedSignal.connect(self.respondRunSaved, Qt.QueuedConnection)
+
+        # Runner to Measurement Handler
+        self.startRecipeQueueSignal.connect(self.measurementHandler.runRecipeQueue, Qt.QueuedConnection)
+        self.startTrackingSignal.connect(self.measurementHandler.trackMPP, Qt.QueuedConnection)
+        self.abortMeasurementSignal.connect(self.measurementHandler.abortMeasurement, Qt.DirectConnection) # Direct, the measurement thread is busy in the sweep loop
+        self.measurementHandler.abortMeasurementSignal.connect(self.respondAborted, Qt.DirectConnection) # Direct, a queued call could arrive after the quit of runSavedSignal
+
+        # Console
+        self.measurementHandler.sendConsoleUpdateSignal.connect(self.updateConsole, Qt.QueuedConnection)
+        self.dataHandler.sendConsoleUpdateSignal.connect(self.updateConsole, Qt.QueuedConnection)
+        self.saveService.sendConsoleUpdateSignal.connect(self.updateConsole)
+        self.updateConsole(self.measurementHandler.initialisationMessage)
+
+    @pyqtSlot()
+    def start(self):
+        if self.tracking:
+            self.startTrackingSignal.emit(self.recipes[0])
+        else:
+            self.startRecipeQueueSignal.emit(self.recipes)
+
+    @pyqtSlot()
+    def abort(self):
+        self.abortMeasurementSignal.emit()
+
+    @pyqtSlot()
+    def respondAborted(self):
+        """Called in the measurement thread (see the connection), it only sets a flag."""
+        self.aborted = True
+
+    @pyqtSlot()
+    def respondRunSaved(self):
+        QCoreApplication.quit()
+
+    @pyqtSlot(str)
+    def updateConsole(self, message):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print(f"[{timestamp}]: {message}", flush=True)
+
+    def shutdown(self):
+        self.saveService.waitForDone() # Unlike the GUI, a headless run waits for its archives
+        if self.separateProcess:
+            QMetaObject.invokeMethod(self.measurementHandler, "stop", Qt.BlockingQueuedConnection)
+        self.THREAD_Measurement.quit()
+        self.THREAD_Measurement.wait()
+        self.THREAD_Data.quit()
+        self.THREAD_Data.wait()
+
+def parseArguments(argv):
+    _parser = argparse.ArgumentParser(description="Run JV sweeps without the GUI.")
+    _parser.add_argument("--settings", default="programSettings.json", help="programSettings.json style file, or a recipe queue (list of settings or {\"Recipes\": [...]}).")
+    _parser.add_argument("--cell-name", help="Cell name, overrides the settings file.")
+    _parser.add_argument("--folder", help="Working folder to save to, overrides the settings file.")
+    _parser.add_argument("--start", type=float, help="Start voltage (V).")
+    _parser.add_argument("--end", type=float, help="End voltage (V).")
+    _parser.add_argument("--rate", type=float, help="Scan rate (mV/s).")
+    _parser.add_argument("--repeats", type=int, help="Number of repeats.")
+    _parser.add_argument("--sweep-type", choices=SWEEP_TYPES, help="Sweep direction, or start -> end -> start for hysteresis. Multi-Segment takes \"Segment Voltages\" from the settings file.")
+    _parser.add_argument("--sampling", choices=SAMPLING_MODES, help="Evenly spaced or adaptive voltage sampling.")
+    _parser.add_argument("--track", type=float, metavar="SECONDS", help="Track the maximum power point for this long (0 until Ctrl+C) instead of measuring sweeps.")
+    _parser.add_argument("--area", type=float, help="Cell area (cm2).")
+    _parser.add_argument("--power", type=float, help="Power input.")
+    _parser.add_argument("--catalogue", default=CATALOGUE_FILE_NAME, help=f"Sweep catalogue file (default: {CATALOGUE_FILE_NAME}), \"\" to disable.")
+    _parser.add_argument("--separate-process", action="store_true", help="Run the measurement loop and the instrument library in a child process, isolated from the rest of the program.")
+    _parser.add_argument("--simulation", help="Dummy instrument simulation settings (JSON): latency distribution, failure injection, seed and recorded sweeps to replay.")
+    return _parser.parse_args(argv)
+
+def applyOverrides(recipe, arguments):
+    """Command line values override the same value in every recipe."""
+    _overrides = [
+        ("File I/O Settings", "Cell Name", arguments.cell_name),
+        ("File I/O Settings", "Working Folder Path", arguments.folder),
+        ("Sweep Settings", "Start Voltage", arguments.start),
+        ("Sweep Settings", "End Voltage", arguments.end),
+        ("Sweep Settings", "Scan Rate", arguments.rate),
+        ("Sweep Settings", "Repeats", arguments.repeats),
+        ("Sweep Settings", "Sweep Type", arguments.sweep_type),
+        ("Sweep Settings", "Sampling", arguments.sampling),
+        ("Analysis Settings", "Cell Area", arguments.area),
+        ("Analysis Settings", "Power", arguments.power),
+        ("Tracking Settings", "Duration", arguments.track),
+    ]
+    for _section, _key, _value in _overrides:
+        if _value is not None:
+            recipe[_section][_key] = _value
+
+def main(argv=None):
+    _arguments = parseArguments(sys.argv[1:] if argv is None else argv)
+
+    try:
+        _recipes = loadRecipeQueue(_arguments.settings)
+    except (OSError, ValueError) as error:
+        print(f"Could not load settings: {error}", file=sys.stderr)
+        return 2
+
+    if _arguments.simulation:
+        if not hasattr(inst, "configureSimulation"):
+            print("--simulation only applies to the dummy instrument.", file=sys.stderr)
+            return 2
+        try:
+            _simulationSettings = loadSimulationSettings(_arguments.simulation)
+            inst.configureSimulation(settings=_simulationSettings) # Also checks the settings before a child process is started with them
+        except (OSError, ValueError) as error:
+            print(f"Could not load simulation settings: {error}", file=sys.stderr)
+            return 2
+    else:
+        _simulationSettings = None
+
+    for _recipeNumber, _recipe in enumerate(_recipes, start=1):
+        applyOverrides(_recipe, _arguments)
+        try:
+            checkRecipe(_recipe, f"Recipe {_recipeNumber}") # Again, the command line values are not checked by loadRecipeQueue()
+        except ValueError as error:
+            print(f"Invalid settings: {error}", file=sys.stderr)
+            return 2
+        _workingFolderPath = _recipe["File I/O Settings"]["Working Folder Path"]
+        if not os.path.isdir(_workingFolderPath):
+            print(f"Working folder \"{_workingFolderPath}\" does not exist.", file=sys.stderr)
+            return 2
+        try:
+            compileRecipePlan(_recipe) # Checked before anything is measured, and cached for the measurement
+        except (ValueError, TypeError, KeyError) as error:
+            print(f"Invalid sweep settings for \"{_recipe['File I/O Settings']['Cell Name']}\": {error}", file=sys.stderr)
+            return 2
+
+    app = QCoreApplication(sys.argv[:1])
+    runner = HeadlessRunner(_recipes, os.path.abspath(_arguments.catalogue) if _arguments.catalogue else None, tracking=_arguments.track is not None,
+                            separateProcess=_arguments.separate_process, simulationSettings=_simulationSettings)
+
+    # Ctrl+C aborts the measurement, the data already measured is still saved. The timer hands control back to Python regularly so the handler can run.
+    signal.signal(signal.SIGINT, lambda *_: runner.abort())
+    _signalTimer = QTimer()
+    _signalTimer.timeout.connect(lambda: None)
+    _signalTimer.start(200)
+
+    QTimer.singleShot(0, runner.start)
+    app.exec()
+    runner.shutdown()
+
+    return 1 if runner.aborted else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,19 +6,35 @@ import json
 import numpy as np
 
 from PyQt5.QtCore import *
+from PyQt5.QtGui import QImage
 from PyQt5.QtWidgets import *
-from matplotlib.figure import Figure
-from datetime import datetime
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-
-from threaded_objects.measurement_handler import MeasurementHandler
+from threaded_objects.measurement_handler import MeasurementHandler, inst
+from threaded_objects.acquisition_process import AcquisitionProcessProxy, SEPARATE_PROCESS_SETTING
 from threaded_objects.data_handler import DataHandler
 from threaded_objects.analysis_handler import AnalysisHandler
-from threaded_objects.data_saver import DataSaver
+from threaded_objects.save_service import SaveService
+from threaded_objects.sweep_catalogue import CATALOGUE_FILE_NAME
+from threaded_objects.console_logger import ConsoleLogger
+from threaded_objects.recipe_queue import buildRecipe, loadRecipeQueue, checkRecipe
+from threaded_objects.voltage_sampler import SAMPLING_MODES
+from threaded_objects.sweep_plan import SWEEP_TYPES, FILE_ONLY_SETTINGS, compileRecipePlan
+from threaded_objects.remote_control_server import RemoteControlServer, REMOTE_CONTROL_SETTING, DEFAULT_REMOTE_CONTROL
+from threaded_objects.pipeline_telemetry import PipelineTelemetry
+from threaded_objects.plot_renderer import PlotRenderer
+from threaded_objects.sweep_index import THUMBNAIL_CACHE_FOLDER
+from threaded_objects.instruments.dummy_simulation import SIMULATION_SETTING
+from gui_objects.results_table_model import ResultsTableModel
+from gui_objects.diagnostics_view import DiagnosticsView
+from gui_objects.plot_view import PlotView
+from gui_objects.sweep_browser import SweepBrowserView
 
 class MainWindow(QMainWindow):
-    startSweepMeasurementSignal = pyqtSignal(np.ndarray)
+    startSweepMeasurementSignal = pyqtSignal(dict)
+    startRecipeQueueSignal = pyqtSignal(list)
+    startTrackingSignal = pyqtSignal(dict)
+    sendRemoteStartResultSignal = pyqtSignal(int, str)
+    requestShutdownSignal = pyqtSignal()
     abortMeasurementSignal = pyqtSignal()
 
     def __init__(self):
@@ -30,6 +46,16 @@ class MainWindow(QMainWindow):
         # Setting default path for data analysis
         self.programFolderPath = os.path.abspath(__file__)
         self.workingFolderPath = ""
+        self.trackingSettings = {} # Only set in programSettings.json, the defaults are in recipe_queue.DEFAULT_RECIPE
+        self.sweepPlanSettings = {} # Segment voltages, pre-bias hold and the failed point policy, also only set in programSettings.json
+        self.cataloguePath = os.path.abspath(CATALOGUE_FILE_NAME) # Next to programSettings.json
+        self.thumbnailCachePath = os.path.abspath(THUMBNAIL_CACHE_FOLDER)
+        self.separateAcquisitionProcess = self.readSeparateProcessSetting() # Read before the other settings, it decides how the Measurement Handler is created
+        self.remoteControlSettings = self.readRemoteControlSetting() # Likewise, decides if the remote control server is created
+        self.simulationSettings = self.readSimulationSetting() # Dummy instrument simulation, applied before the instrument is initialised
+
+        # Stage latencies and queue depths of the measurement pipeline, shown in the Diagnostics tab
+        self.telemetry = PipelineTelemetry()
                 
         # Sub-widgets
         self.createInstrumentSettings()
@@ -48,26 +74,63 @@ class MainWindow(QMainWindow):
         self.mutexMeasurement = QMutex()
         self.mutexFileSaving = QMutex()
 
+        # Checked here either way, a child process is only started with valid settings
+        _simulationSettings = None
+        _simulationMessage = None
+        if self.simulationSettings is not None:
+            try:
+                inst.configureSimulation(settings=self.simulationSettings)
+                _simulationSettings = self.simulationSettings
+                _simulationMessage = "Dummy instrument simulation settings loaded from programSettings.json"
+            except (ValueError, TypeError) as error:
+                _simulationMessage = f"WARNING: The simulation settings in programSettings.json are not valid, they are not used: {error}"
+
         # Measurement Thread
         self.THREAD_Measurement = QThread()
-        self.measurementHandler = MeasurementHandler(self.mutexMeasurement)
+        if self.separateAcquisitionProcess:
+            # Same signals and slots, the measurement loop and the instrument run in a child process (see acquisition_process.py)
+            self.measurementHandler = AcquisitionProcessProxy(self.telemetry, simulationSettings=_simulationSettings)
+            self.THREAD_Measurement.started.connect(self.measurementHandler.startPolling) # Starts the child process, its result arrives with initialisedSignal
+            self.measurementHandler.initialisedSignal.connect(self.respondAcquisitionInitialised, Qt.QueuedConnection)
+        else:
+            self.measurementHandler = MeasurementHandler(self.mutexMeasurement, self.telemetry)
         self.measurementHandler.moveToThread(self.THREAD_Measurement)
 
         self.THREAD_Measurement.start()
 
         # Data Handler Thread
         self.THREAD_Data = QThread()
-        self.dataHandler = DataHandler()
+        self.dataHandler = DataHandler(telemetry=self.telemetry)
         self.dataHandler.moveToThread(self.THREAD_Data)
         self.THREAD_Data.start()
 
-        # Threadpool
-        self.threadpool = QThreadPool()
+        # Plot Render Thread, matplotlib draws here so the GUI thread only shows finished frames
+        self.THREAD_Plot = QThread()
+        self.plotRenderer = PlotRenderer(self.telemetry)
+        self.plotRenderer.moveToThread(self.THREAD_Plot)
+        self.diagnosticsRenderer = PlotRenderer() # Latency histograms of the diagnostics tab, not a measurement frame so not timed
+        self.diagnosticsRenderer.moveToThread(self.THREAD_Plot)
+        self.THREAD_Plot.start()
+
+        # Remote Control Thread, local socket API for automation and the live point stream. Only when enabled in programSettings.json.
+        self.remoteServer = None
+        if self.remoteControlSettings["Enabled"]:
+            self.THREAD_Remote = QThread()
+            self.remoteServer = RemoteControlServer(self.remoteControlSettings["Port"])
+            self.remoteServer.moveToThread(self.THREAD_Remote)
+            self.THREAD_Remote.started.connect(self.remoteServer.start)
+
+        # Saving and archiving, the file writing runs on thread pools owned by the save service
+        self.saveService = SaveService(self.mutexFileSaving, self.cataloguePath, self.telemetry)
 
         # Measurement Handler to Data Handler:
         self.measurementHandler.sendSweepPointSignal.connect(self.dataHandler.buildArrayFromSweepPoints, Qt.QueuedConnection)
         self.measurementHandler.finaliseSweepArraySignal.connect(self.dataHandler.finaliseArray, Qt.QueuedConnection)
         self.measurementHandler.abortMeasurementSignal.connect(self.dataHandler.abortMeasurement)
+        self.measurementHandler.sweepSetFinishedSignal.connect(self.dataHandler.finaliseRun, Qt.QueuedConnection)
+        self.measurementHandler.recipeStartedSignal.connect(self.dataHandler.setRecipe, Qt.QueuedConnection)
+        self.measurementHandler.trackingStartedSignal.connect(self.dataHandler.startTracking, Qt.QueuedConnection)
+        self.measurementHandler.sendTrackingSamplesSignal.connect(self.dataHandler.addTrackingSamples, Qt.QueuedConnection)
 
         # Measurement Handler to Main GUI Thread
         self.measurementHandler.sweepSetStartedSingal.connect(self.respondMeausurementStarted, Qt.QueuedConnection)
@@ -78,11 +141,27 @@ class MainWindow(QMainWindow):
         self.measurementHandler.measurementVOCStartedSignal.connect(self.respondForMeasurementFinished, Qt.QueuedConnection)
 
         # Data Handler to Main GUI Thread
-        self.dataHandler.updateGraphSignal.connect(self.plotData, Qt.QueuedConnection)
-        self.dataHandler.sendDataArrayForSavingSingal.connect(self.startSaveDataThread, Qt.QueuedConnection)
+        self.dataHandler.updateGraphSignal.connect(self.plotRenderer.submitSweep, Qt.DirectConnection) # Only stores the array, see PlotRenderer
+        self.dataHandler.updateTrackingSignal.connect(self.plotRenderer.submitTracking, Qt.DirectConnection)
+        self.dataHandler.sendDataArrayForSavingSingal.connect(self.saveService.saveData, Qt.QueuedConnection)
+        self.dataHandler.runFinishedSignal.connect(self.saveService.requestArchive, Qt.QueuedConnection)
+        self.saveService.figuresOfMeritSignal.connect(self.resultsTableModel.queueRow)
+        self.saveService.runSavedSignal.connect(self.sweepBrowserTab.markStale)
+        self.saveService.sendConsoleUpdateSignal.connect(self.updateConsole)
+
+        # Plot Renderer to and from Main GUI Thread
+        self.plotRenderer.frameRenderedSignal.connect(self.showPlotFrame, Qt.QueuedConnection)
+        self.plotView.resizedSignal.connect(self.plotRenderer.setFrameSize, Qt.QueuedConnection)
+        self.plotView.announceSize()
+        self.diagnosticsTab.latencyCurvesSignal.connect(self.diagnosticsRenderer.submitLatencies, Qt.DirectConnection)
+        self.diagnosticsRenderer.frameRenderedSignal.connect(self.diagnosticsTab.plotView.showFrame, Qt.QueuedConnection)
+        self.diagnosticsTab.plotView.resizedSignal.connect(self.diagnosticsRenderer.setFrameSize, Qt.QueuedConnection)
+        self.diagnosticsTab.plotView.announceSize()
 
         # Main GUI Self Connections
         self.controlStartButton.clicked.connect(self.gatekeeperSweepMeasurement, Qt.QueuedConnection)
+        self.controlRunQueueButton.clicked.connect(self.gatekeeperRecipeQueue, Qt.QueuedConnection)
+        self.controlTrackButton.clicked.connect(self.gatekeeperTrackMPP, Qt.QueuedConnection)
         self.inputFetchFolderPath.clicked.connect(self.folderBrowse, Qt.QueuedConnection)
         self.inputCellArea.valueChanged.connect(self.gatekeeperAnalysisVariables, Qt.QueuedConnection)
         self.inputPower.valueChanged.connect(self.gatekeeperAnalysisVariables, Qt.QueuedConnection)
@@ -90,6 +169,8 @@ class MainWindow(QMainWindow):
         # Main GUI to Measurement Handler
         self.controlMeasureVoc.clicked.connect(self.measurementHandler.measureVOC, Qt.QueuedConnection)
         self.startSweepMeasurementSignal.connect(self.measurementHandler.measureSweep, Qt.QueuedConnection)
+        self.startRecipeQueueSignal.connect(self.measurementHandler.runRecipeQueue, Qt.QueuedConnection)
+        self.startTrackingSignal.connect(self.measurementHandler.trackMPP, Qt.QueuedConnection)
         self.controlsStopButton.clicked.connect(self.measurementHandler.abortMeasurement, Qt.DirectConnection) # Direct to interrupt any current processes and set measurement consent to false
         self.abortMeasurementSignal.connect(self.measurementHandler.abortMeasurement, Qt.DirectConnection)
 
@@ -99,7 +180,32 @@ class MainWindow(QMainWindow):
         self.dataHandler.sendConsoleUpdateSignal.connect(self.updateConsole, Qt.QueuedConnection)
         self.dataHandler.sendStatusUpdateSignal.connect(self.updateStatus, Qt.QueuedConnection)
 
+        if self.remoteServer is not None:
+            # Measurement Handler to Remote Control Thread
+            self.measurementHandler.sendSweepPointSignal.connect(self.remoteServer.publishPoint, Qt.QueuedConnection)
+            self.measurementHandler.sweepSetStartedSingal.connect(self.remoteServer.respondMeasurementStarted, Qt.QueuedConnection)
+            self.measurementHandler.finaliseSweepArraySignal.connect(self.remoteServer.respondSweepFinished, Qt.QueuedConnection)
+            self.measurementHandler.sweepSetFinishedSignal.connect(self.remoteServer.respondMeasurementFinished, Qt.QueuedConnection)
+            self.measurementHandler.abortMeasurementSignal.connect(self.remoteServer.respondMeasurementAborted, Qt.QueuedConnection)
+            self.measurementHandler.sendVocValueSignal.connect(self.remoteServer.respondVocValue, Qt.QueuedConnection)
+
+            # Remote Control Thread to Main GUI and Measurement Handler
+            self.remoteServer.startRequestedSignal.connect(self.remoteStartMeasurement, Qt.QueuedConnection)
+            self.remoteServer.abortRequestedSignal.connect(self.measurementHandler.abortMeasurement, Qt.DirectConnection) # Direct, same as the stop button
+            self.remoteServer.measureVocRequestedSignal.connect(self.measurementHandler.measureVOC, Qt.QueuedConnection)
+            self.remoteServer.sendConsoleUpdateSignal.connect(self.updateConsole, Qt.QueuedConnection) # Including a port that could not be opened
+            self.sendRemoteStartResultSignal.connect(self.remoteServer.respondStartResult, Qt.QueuedConnection)
+
+        # Shutdown handshake, Main GUI -> Measurement Handler -> Data Handler -> Main GUI, each step queued behind the work already sent to that thread
+        self.requestShutdownSignal.connect(self.measurementHandler.acknowledgeShutdown, Qt.QueuedConnection)
+        self.measurementHandler.shutdownAcknowledgedSignal.connect(self.dataHandler.acknowledgeShutdown, Qt.QueuedConnection)
+
         self.loadProgramSettings()
+        if _simulationMessage:
+            self.updateConsole(_simulationMessage)
+        self.updateConsole(self.measurementHandler.initialisationMessage)
+        if self.remoteServer is not None:
+            self.THREAD_Remote.start()
 
     def createInstrumentSettings(self):
 
@@ -125,7 +231,7 @@ class MainWindow(QMainWindow):
 
         self.SweepSettings = QGroupBox("Sweep Settings")
         self.SweepSettings.setMaximumWidth(200)
-        self.SweepSettings.setMaximumHeight(250) # Minimum height of QGroupBox, considering the space needed for it's child widgets
+        self.SweepSettings.setMaximumHeight(300) # Minimum height of QGroupBox, considering the space needed for it's child widgets
         self.layoutSweepSettings = QVBoxLayout(self.SweepSettings)
 
         self.labelStartVoltage = QLabel("Start Voltage (V)", self.SweepSettings)
@@ -151,8 +257,11 @@ class MainWindow(QMainWindow):
 
         self.labelSweepType = QLabel("Sweep Type", self.SweepSettings)
         self.inputSweepType = QComboBox(self.SweepSettings)
-        self.inputSweepType.addItem("Standard")
-        self.inputSweepType.addItem("Hysteresis")
+        self.inputSweepType.addItems(SWEEP_TYPES) # Multi-Segment takes its voltages from "Segment Voltages" in programSettings.json
+
+        self.labelSampling = QLabel("Sampling", self.SweepSettings)
+        self.inputSampling = QComboBox(self.SweepSettings)
+        self.inputSampling.addItems(SAMPLING_MODES) # Adaptive concentrates the points on the knee and the Voc region
 
         self.layoutSweepSettings.addWidget(self.labelStartVoltage)
         self.layoutSweepSettings.addWidget(self.inputStartVoltage)
@@ -164,6 +273,8 @@ class MainWindow(QMainWindow):
         self.layoutSweepSettings.addWidget(self.inputRepeats)
         self.layoutSweepSettings.addWidget(self.labelSweepType)
         self.layoutSweepSettings.addWidget(self.inputSweepType)
+        self.layoutSweepSettings.addWidget(self.labelSampling)
+        self.layoutSweepSettings.addWidget(self.inputSampling)
         
     def createAnalysisSettings(self):
 
@@ -233,6 +344,8 @@ class MainWindow(QMainWindow):
         self.controlStartButton = QPushButton("Start Measurement", self.MeasurementControls)
         self.controlsStopButton = QPushButton("Stop Measurement", self.MeasurementControls)
         self.controlMeasureVoc = QPushButton("Measure Voc", self.MeasurementControls)
+        self.controlRunQueueButton = QPushButton("Run Recipe Queue...", self.MeasurementControls)
+        self.controlTrackButton = QPushButton("Track MPP", self.MeasurementControls)
         self.labelVocValue = QLabel("Voc: NaN", self.MeasurementControls)
 
         self.controlsStopButton.setEnabled(False)
@@ -240,6 +353,8 @@ class MainWindow(QMainWindow):
         self.layoutMeasurementControls.addWidget(self.controlStartButton)
         self.layoutMeasurementControls.addWidget(self.controlsStopButton)
         self.layoutMeasurementControls.addWidget(self.controlMeasureVoc)
+        self.layoutMeasurementControls.addWidget(self.controlRunQueueButton)
+        self.layoutMeasurementControls.addWidget(self.controlTrackButton)
         self.layoutMeasurementControls.addWidget(self.labelVocValue)
     
     def createDataDisplayTab(self):
@@ -247,17 +362,24 @@ class MainWindow(QMainWindow):
         # Graph Tab Layout
         self.graphTab = QWidget()
         self.layoutGraphTab = QVBoxLayout(self.graphTab)
-        self.figure = Figure()
-        self.canvasWidget = FigureCanvas(self.figure)
-        self.layoutGraphTab.addWidget(self.canvasWidget)
+        self.plotView = PlotView(self.graphTab)
+        self.layoutGraphTab.addWidget(self.plotView)
 
         # Table Tab Layout
         self.tableTab = QWidget()
         self.layoutTableTab = QVBoxLayout(self.tableTab)
-        self.tableWidget = QTableWidget(self.tableTab)
-        self.tableWidget.setColumnCount(5)
-        self.tableWidget.setHorizontalHeaderLabels(["Cell Name", "Voc", "Jsc", "FF", "Efficiency"])
-        self.layoutTableTab.addWidget(self.tableWidget)
+        self.inputTableFilter = QLineEdit(self.tableTab)
+        self.inputTableFilter.setPlaceholderText("Filter by cell name...")
+        self.resultsTableModel = ResultsTableModel(self.tableTab)
+        self.tableView = QTableView(self.tableTab)
+        self.tableView.setModel(self.resultsTableModel)
+        self.tableView.setSortingEnabled(True)
+        self.tableView.sortByColumn(-1, Qt.AscendingOrder) # Unsorted (arrival order) until a header is clicked
+        self.tableView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed) # Fixed row heights, so the view never measures rows it does not draw
+        self.tableView.verticalHeader().setDefaultSectionSize(self.tableView.fontMetrics().height() + 6)
+        self.layoutTableTab.addWidget(self.inputTableFilter)
+        self.layoutTableTab.addWidget(self.tableView)
+        self.inputTableFilter.textChanged.connect(self.resultsTableModel.setFilter)
 
         # Console Tab Layout
         self.consoleTab = QWidget()
@@ -265,12 +387,21 @@ class MainWindow(QMainWindow):
         self.console = QPlainTextEdit(self.consoleTab)
         self.console.setReadOnly(True)
         self.layoutConsoleTab.addWidget(self.console)
+        self.consoleLogger = ConsoleLogger(self.console)
+
+        # Diagnostics Tab Layout
+        self.diagnosticsTab = DiagnosticsView(self.telemetry)
+
+        # Browser Tab Layout, past sweeps of the working folder
+        self.sweepBrowserTab = SweepBrowserView(self.thumbnailCachePath)
 
         # Tab layout (with graph and console)
         self.tabControl = QTabWidget()
         self.tabControl.addTab(self.graphTab, "Graph")
         self.tabControl.addTab(self.tableTab, "Table")
         self.tabControl.addTab(self.consoleTab, "Console")
+        self.tabControl.addTab(self.sweepBrowserTab, "Browser")
+        self.tabControl.addTab(self.diagnosticsTab, "Diagnostics")
 
     def buildMainUI(self):
 
@@ -289,7 +420,8 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.mainWidget)
         self.show()
 
-    def saveProgramSettings(self, _savePath="programSettings.json"):
+    def collectProgramSettings(self):
+        """Returns the current GUI settings, in the same shape as programSettings.json."""
 
         # Instrument Settings
         _terminalSetting = self.inputTerminalSettings.currentText()
@@ -301,6 +433,7 @@ class MainWindow(QMainWindow):
         _scanRate = self.inputScanRate.value()
         _repeats = self.inputRepeats.value()
         _sweepType = self.inputSweepType.currentText()
+        _sampling = self.inputSampling.currentText()
 
         # Analysis settings
         _cellArea = self.inputCellArea.value()
@@ -320,7 +453,9 @@ class MainWindow(QMainWindow):
                 "End Voltage": _endVoltage,
                 "Scan Rate": _scanRate,
                 "Repeats": _repeats,
-                "Sweep Type": _sweepType
+                "Sweep Type": _sweepType,
+                "Sampling": _sampling,
+                **self.sweepPlanSettings
             },
             "Analysis Settings": {
                 "Cell Area": _cellArea,
@@ -329,12 +464,56 @@ class MainWindow(QMainWindow):
             "File I/O Settings": {
                 "Cell Name": _cellName, 
                 "Working Folder Path": _workingFolderPath
-            }
+            },
+            "Tracking Settings": self.trackingSettings,
+            SEPARATE_PROCESS_SETTING: self.separateAcquisitionProcess,
+            REMOTE_CONTROL_SETTING: self.remoteControlSettings
         }
+        if self.simulationSettings is not None:
+            _settings[SIMULATION_SETTING] = self.simulationSettings # Written back as it was loaded
+
+        return _settings
+
+    def saveProgramSettings(self, _savePath="programSettings.json"):
+        _settings = self.collectProgramSettings()
 
         with open(_savePath, "w") as file:
             json.dump(_settings, file, indent=4)
 
+    def readSeparateProcessSetting(self):
+        """Returns the SEPARATE_PROCESS_SETTING of programSettings.json, False if it is not set. Takes effect when the program starts."""
+        try:
+            with open("programSettings.json", "r") as file:
+                return bool(json.load(file).get(SEPARATE_PROCESS_SETTING, False))
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    def readRemoteControlSetting(self):
+        """Returns the REMOTE_CONTROL_SETTING of programSettings.json, off (DEFAULT_REMOTE_CONTROL) if it is not set or not valid. Takes effect when the program starts."""
+        try:
+            with open("programSettings.json", "r") as file:
+                _setting = json.load(file).get(REMOTE_CONTROL_SETTING, {})
+            _port = int(_setting.get("Port", DEFAULT_REMOTE_CONTROL["Port"]))
+            if not 0 < _port < 65536:
+                return dict(DEFAULT_REMOTE_CONTROL)
+            return {"Enabled": bool(_setting.get("Enabled", False)), "Port": _port}
+        except (OSError, ValueError, AttributeError, TypeError):
+            return dict(DEFAULT_REMOTE_CONTROL)
+
+    def readSimulationSetting(self):
+        """
+        Returns the SIMULATION_SETTING of programSettings.json (see dummy_simulation.DEFAULT_SIMULATION), None if it is not set or the instrument
+        library has no simulation. Takes effect when the program starts.
+        """
+        if not hasattr(inst, "configureSimulation"):
+            return None
+        try:
+            with open("programSettings.json", "r") as file:
+                _setting = json.load(file).get(SIMULATION_SETTING)
+        except (OSError, ValueError, AttributeError):
+            return None
+        return _setting if isinstance(_setting, dict) else None
+
     def loadProgramSettings(self):
         try:
             with open("programSettings.json", "r") as file:
@@ -350,6 +529,7 @@ class MainWindow(QMainWindow):
             self.inputScanRate.setValue(_settings["Sweep Settings"]["Scan Rate"])
             self.inputRepeats.setValue(_settings["Sweep Settings"]["Repeats"])
             self.inputSweepType.setCurrentText(_settings["Sweep Settings"]["Sweep Type"])
+            self.inputSampling.setCurrentText(_settings["Sweep Settings"].get("Sampling", "Uniform")) # Not in settings files from before adaptive sampling
 
             # Analysis settings
             self.inputCellArea.setValue(_settings["Analysis Settings"]["Cell Area"])
@@ -359,6 +539,11 @@ class MainWindow(QMainWindow):
             self.inputCellName.setText(_settings["File I/O Settings"]["Cell Name"])
             self.workingFolderPath = _settings["File I/O Settings"]["Working Folder Path"]
             self.displayWorkingFolderPath.setPlainText(self.workingFolderPath)
+            self.sweepBrowserTab.setFolder(self.workingFolderPath)
+
+            # Tracking settings, edited in the file only
+            self.trackingSettings = _settings.get("Tracking Settings", {})
+            self.sweepPlanSettings = {_key: _settings["Sweep Settings"][_key] for _key in FILE_ONLY_SETTINGS if _key in _settings["Sweep Settings"]}
 
         except:
             self.updateConsole("WARNING: Error reading programSettings.json, the file likely does not exist or has invalid values, setting default values.")
@@ -369,21 +554,6 @@ class MainWindow(QMainWindow):
             self.inputScanRate.setValue(10)
             self.inputRepeats.setValue(1)
 
-    @pyqtSlot(np.ndarray)
-    def startSaveDataThread(self, dataArray):
-        """
-        CALLED FROM: DataHandler
-        CALL PATH: MainWindow (gatekeeperStartMeasurement) -> MeasurementHandler (measureSweep) -> DataHandler (finaliseArray) -> Here
-        """
-
-        _analysisSettings = np.empty([1, 2])
-        _analysisSettings[0, 0] = self.inputCellArea.value()
-        _analysisSettings[0, 1] = self.inputPower.value()
-
-        saveDataTask = DataSaver(self.mutexFileSaving, dataArray, self.sweepProperties, _analysisSettings, self.inputCellName.text(), self.workingFolderPath)
-        self.threadpool.start(saveDataTask)
-        self.threadpool.waitForDone()
-
     @pyqtSlot()
     def respondMeausurementStarted(self):
         """
@@ -396,6 +566,8 @@ class MainWindow(QMainWindow):
         self.controlStartButton.setEnabled(False)
         self.controlsStopButton.setEnabled(True)
         self.controlMeasureVoc.setEnabled(False)
+        self.controlRunQueueButton.setEnabled(False)
+        self.controlTrackButton.setEnabled(False)
         
         # Analysis variables
         self.inputCellArea.setEnabled(False)
@@ -407,6 +579,7 @@ class MainWindow(QMainWindow):
         self.inputScanRate.setEnabled(False)
         self.inputRepeats.setEnabled(False)
         self.inputSweepType.setEnabled(False)
+        self.inputSampling.setEnabled(False)
 
         # Folder I/O setting
         self.inputFetchFolderPath.setEnabled(False)
@@ -425,6 +598,8 @@ class MainWindow(QMainWindow):
         self.controlStartButton.setEnabled(True)
         self.controlsStopButton.setEnabled(False)
         self.controlMeasureVoc.setEnabled(True)
+        self.controlRunQueueButton.setEnabled(True)
+        self.controlTrackButton.setEnabled(True)
         
         # Analysis variables
         self.inputCellArea.setEnabled(True)
@@ -436,6 +611,7 @@ class MainWindow(QMainWindow):
         self.inputScanRate.setEnabled(True)
         self.inputRepeats.setEnabled(True)
         self.inputSweepType.setEnabled(True)
+        self.inputSampling.setEnabled(True)
 
         # Folder I/O setting
         self.inputFetchFolderPath.setEnabled(True)
@@ -447,42 +623,75 @@ class MainWindow(QMainWindow):
     
     @pyqtSlot(str)
     def updateConsole(self, message):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        formatted_message = f"[{timestamp}]:\n{message}\n"
-        self.console.appendPlainText(formatted_message)
+        self.consoleLogger.log(message) # Batched into the console and written to the log file
 
     @pyqtSlot(str)
     def updateStatus(self, message):
         self.statusBar().showMessage(message)
 
+    @pyqtSlot(str, bool)
+    def respondAcquisitionInitialised(self, message, validState):
+        """SLOT CALLED FROM: AcquisitionProcessProxy, once the acquisition process is ready or has failed to start."""
+        self.updateConsole(message)
+        self.updateStatus("Ready to measure." if validState else "Instrument is not initialised.")
+
     @pyqtSlot(float)
     def updateVocValue(self, value):
         self.valueVoc = value * 1000
         self.labelVocValue.setText(f"Voc: {self.valueVoc:.0f} mV")
 
-    @pyqtSlot(np.ndarray)
-    def plotData(self, dataToPlot):
-        self.figure.clear()
-        
-        ax = self.figure.add_subplot(111)
-        ax.plot(dataToPlot[:,0], dataToPlot[:,1], "kx-")
-        ax.grid()
-        ax.set_xlabel("Voltage (V)")
-        ax.set_ylabel("Current (A)")
-        self.canvasWidget.draw()
+    @pyqtSlot(QImage, float)
+    def showPlotFrame(self, frame, acquisitionTime):
+        """SLOT CALLED FROM: PlotRenderer, for every frame it has drawn. Only hands the finished image to the plot, no drawing is done here."""
+        self.plotView.showFrame(frame)
+        self.telemetry.frameShown(acquisitionTime)
 
     @pyqtSlot()    
-    def shutdown(self):
+    def shutdown(self, timeout=10000):
+        """
+        Shuts the threads down without losing data, taking only as long as the outstanding work needs.
+
+        1. Abort, the measurement loop exits within milliseconds (see MeasurementHandler.abortMeasurement).
+        2. Handshake, the Measurement Handler and then the Data Handler acknowledge. Each acknowledgement is queued behind the work already sent to
+           that thread, so once the Data Handler acknowledges every finished sweep has been sent for saving. The save requests are handled by the
+           local event loop while waiting.
+        3. The save service flushes, every started save is written.
+        4. The threads are joined.
+        Every wait has a timeout, so a hung instrument cannot stop the program from closing. Anything that timed out is written to the log.
+        """
+        _shutdownStart = time.perf_counter()
 
         self.saveProgramSettings()
+        if self.remoteServer is not None:
+            self.remoteServer.startRequestedSignal.disconnect() # No new measurements from remote clients from here on
+            self.remoteServer.measureVocRequestedSignal.disconnect()
         self.abortMeasurementSignal.emit()
-        time.sleep(1) # Saftey wait, paranoid step to give threads time to recieve signals to quit
 
-        self.THREAD_Measurement.quit()
-        self.THREAD_Measurement.wait()
-        self.THREAD_Data.quit()
-        self.THREAD_Data.wait()
-        time.sleep(0.5) # Saftey wait, paranoid step to give everything time to fully shut down.
+        _handshakeLoop = QEventLoop()
+        _acknowledged = []
+        self.dataHandler.shutdownAcknowledgedSignal.connect(lambda: (_acknowledged.append(True), _handshakeLoop.quit()), Qt.QueuedConnection)
+        QTimer.singleShot(timeout, _handshakeLoop.quit)
+        self.requestShutdownSignal.emit()
+        _handshakeLoop.exec()
+        if not _acknowledged:
+            self.updateConsole(f"WARNING: The measurement and data threads did not acknowledge the shutdown within {timeout} ms, unsaved data may be lost.")
+
+        if not self.saveService.flush(timeout):
+            self.updateConsole(f"WARNING: Saving did not finish within {timeout} ms.")
+
+        _threads = [(self.THREAD_Measurement, "Measurement"), (self.THREAD_Data, "Data"), (self.THREAD_Plot, "Plot Render")]
+        if self.remoteServer is not None:
+            QMetaObject.invokeMethod(self.remoteServer, "stop", Qt.BlockingQueuedConnection)
+            _threads.append((self.THREAD_Remote, "Remote Control"))
+        if self.separateAcquisitionProcess:
+            QMetaObject.invokeMethod(self.measurementHandler, "stop", Qt.BlockingQueuedConnection) # Ends the child process and releases the shared memory
+        for _thread, _name in _threads:
+            _thread.quit()
+            if not _thread.wait(timeout):
+                self.updateConsole(f"WARNING: {_name} thread did not stop within {timeout} ms.")
+
+        self.updateConsole(f"Shutdown completed in {(time.perf_counter() - _shutdownStart) * 1000:.0f} ms")
+        self.consoleLogger.close()
 
     @pyqtSlot()
     def gatekeeperAnalysisVariables(self):
@@ -496,27 +705,116 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def gatekeeperSweepMeasurement(self):
-        """Checks if there is a valid path to save data to. Packs the current sweep settings into an array and sends it to the measurement thread."""
+        """Checks if there is a valid path to save data to. Packs the current settings into a recipe and sends it to the measurement thread."""
+
+        if self.checkWorkingFolderPath(self.workingFolderPath):
+            _recipe = buildRecipe(self.collectProgramSettings())
+            if self.checkRecipeSettings(_recipe):
+                self.startSweepMeasurementSignal.emit(_recipe)
+
+    @pyqtSlot()
+    def gatekeeperTrackMPP(self):
+        """Checks if there is a valid path to stream the tracking data to, then starts maximum power point tracking with the current settings."""
+
+        if self.checkWorkingFolderPath(self.workingFolderPath):
+            _recipe = buildRecipe(self.collectProgramSettings())
+            if self.checkRecipeSettings(_recipe):
+                self.startTrackingSignal.emit(_recipe)
+
+    @pyqtSlot()
+    def gatekeeperRecipeQueue(self):
+        """Loads a recipe queue from a JSON file, checks every recipe has a valid path to save data to and sends the queue to the measurement thread."""
+
+        _queuePath, _ = QFileDialog.getOpenFileName(self, "Select Recipe Queue", "", "JSON Files (*.json)")
+        if not _queuePath:
+            return
+
+        try:
+            _recipes = loadRecipeQueue(_queuePath)
+        except (OSError, ValueError) as error:
+            self.displayAlertBox(f"The recipe queue could not be loaded:\n{error}")
+            return
+
+        for _recipe in _recipes:
+            _fileSettings = _recipe["File I/O Settings"]
+
+            # Recipes without a folder or cell name save like a normal measurement, to the current working folder
+            if not _fileSettings["Working Folder Path"]:
+                _fileSettings["Working Folder Path"] = self.workingFolderPath
+            if not self.checkWorkingFolderPath(_fileSettings["Working Folder Path"]):
+                return
+            if not self.checkRecipeSettings(_recipe):
+                return
+
+        self.updateConsole(f"Recipe queue loaded: {len(_recipes)} recipes from {_queuePath}")
+        self.startRecipeQueueSignal.emit(_recipes)
+
+    @pyqtSlot(int, dict)
+    def remoteStartMeasurement(self, request, overrides):
+        """
+        SLOT CALLED FROM: RemoteControlServer
+
+        Starts a measurement with the GUI settings, updated section by section with the overrides sent by the client. The outcome is sent back as the
+        reply to the client's START (an empty message if it started), problems are not shown in a pop-up.
+        """
+        if self.isMeasuring:
+            self.sendRemoteStartResultSignal.emit(request, "A measurement is already running.")
+            return
+
+        _settings = self.collectProgramSettings()
+        for _section, _values in overrides.items():
+            if isinstance(_values, dict):
+                _settings.setdefault(_section, {}).update(_values)
+
+        _recipe = buildRecipe(_settings)
+        try:
+            checkRecipe(_recipe, "START")
+        except ValueError as error:
+            self.sendRemoteStartResultSignal.emit(request, str(error))
+            return
+        if not os.path.isdir(_recipe["File I/O Settings"]["Working Folder Path"]):
+            self.sendRemoteStartResultSignal.emit(request, "The working folder path is not set or does not exist.")
+            return
+        try:
+            compileRecipePlan(_recipe)
+        except (ValueError, TypeError, KeyError) as error:
+            self.sendRemoteStartResultSignal.emit(request, f"Invalid sweep settings: {error}")
+            return
+
+        self.updateConsole("Measurement started by remote control")
+        self.isMeasuring = True # Set now rather than when the measurement thread reports it, so a second START straight after is refused
+        self.sendRemoteStartResultSignal.emit(request, "")
+        self.startSweepMeasurementSignal.emit(_recipe)
+
+    def checkWorkingFolderPath(self, workingFolderPath):
+        """Returns True if data can be saved to the folder, otherwise warns the user."""
 
         # Check if a folder path has been selected.
-        if self.workingFolderPath:
+        if workingFolderPath:
 
             # Check if folder path exists.
-            if os.path.isdir(self.workingFolderPath):
-                _startVoltage = self.inputStartVoltage.value() 
-                _endVoltage =  self.inputEndVoltage.value()
-                _repeats = self.inputRepeats.value()
-                _scanRate = self.inputScanRate.value()
-                self.sweepProperties = np.empty([1, 4])
-                self.sweepProperties[0, :] = [_startVoltage, _endVoltage, _repeats, _scanRate]
-
-                self.startSweepMeasurementSignal.emit(self.sweepProperties)
+            if os.path.isdir(workingFolderPath):
+                return True
             else:
                 self.displayAlertBox("A folder path is selected but it is not valid for this computer.\nDid you load the configuration file from another machine?")
         else:
             self.displayAlertBox("The working folder path not selected! A working folder path must be set before starting a measurement!")
+        return False
 
-    def displayAlertBox(text):
+    def checkRecipeSettings(self, recipe):
+        """
+        Returns True if every value of the recipe is valid (see recipe_queue.checkRecipe) and its sweep plan compiles, otherwise warns the user.
+        The plan is cached, so the measurement does not compile it again.
+        """
+        try:
+            checkRecipe(recipe, recipe["File I/O Settings"]["Cell Name"] or "The measurement")
+            compileRecipePlan(recipe)
+            return True
+        except (ValueError, TypeError, KeyError) as error:
+            self.displayAlertBox(f"The measurement settings are not valid:\n{error}")
+            return False
+
+    def displayAlertBox(self, text):
         """Display a pop-up warning box"""
         self.AlertBox = QMessageBox()
         self.AlertBox.setWindowTitle("Warning!")
@@ -527,6 +825,7 @@ class MainWindow(QMainWindow):
     def folderBrowse(self):
         self.workingFolderPath = QFileDialog.getExistingDirectory(self, "Select Folder")
         self.displayWorkingFolderPath.setPlainText(self.workingFolderPath)
+        self.sweepBrowserTab.setFolder(self.workingFolderPath)
 
 def main():
     app = QApplication(sys.argv)
@@ -534,4 +833,5 @@ def main():
     app.aboutToQuit.connect(window.shutdown, Qt.DirectConnection) # Direct connection to ensure the shutdown method is ran immediately.
     app.exec()
 
-main()
\ No newline at end of file
+if __name__ == "__main__": # The acquisition process imports this module when it starts, it must not open a second window
+    main()
\ No newline at end of file
@@ -0,0 +1,389 @@
+"""
+Out of process acquisition: the MeasurementHandler loop and the instrument library run in a child process, so the timing of a sweep does not
+depend on what the GUI process is doing (matplotlib, NumPy and Python's GIL).
+
+Child process   AcquisitionEngine runs an ordinary MeasurementHandler. Sweep points and tracking samples are written to a SampleRing in shared
+                memory, every other signal is sent over a pipe as an event, tagged with the number of samples written before it.
+GUI process     AcquisitionProcessProxy has the signals and slots of MeasurementHandler and stands in for it. It polls the ring and the pipe, and
+                emits every event only after the samples written before it, so the Data Handler sees exactly the order of the child.
+
+Commands go to the child over the same pipe. A thread in the child reads them, so an abort reaches the measurement loop straight away.
+"""
+import time
+import queue
+import signal
+import threading
+import multiprocessing
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from PyQt5.QtCore import *
+
+SEPARATE_PROCESS_SETTING = "Separate Acquisition Process" # Top level key of programSettings.json, edited in the file only
+
+# Ring records: [kind, time, voltage, current, power]
+RECORD_FIELDS = 5
+KIND_SWEEP_POINT = 0   # time is the acquisition time (time.perf_counter(), which is comparable between processes), power unused
+KIND_TRACKING_SAMPLE = 1 # time in s since the epoch, as sendTrackingSamplesSignal
+
+# MeasurementHandler signals sent as events, everything except the samples
+FORWARDED_SIGNALS = (
+    "sendVocValueSignal", "sweepSetStartedSingal", "finaliseSweepArraySignal", "sweepSetFinishedSignal", "abortMeasurementSignal",
+    "recipeStartedSignal", "trackingStartedSignal", "measurementVOCStartedSignal", "measurementVOCFinishedSignal", "sendConsoleUpdateSignal",
+    "sendStatusUpdateSignal", "shutdownAcknowledgedSignal",
+)
+
+class SampleRing():
+    """
+    Single producer, single consumer ring of float64 records in shared memory.
+
+    The header holds two counters, records written and records read. Each is only ever increased by one side, the writer fills the record before
+    it increases its counter, so the reader never sees a record that is half written. A full ring makes the writer wait, samples are never dropped.
+    """
+    HEADER_BYTES = 16
+
+    def __init__(self, name=None, capacity=65536, create=False):
+        self.capacity = capacity
+        self.create = create
+        self.memory = SharedMemory(name=name, create=create, size=self.HEADER_BYTES + capacity * RECORD_FIELDS * 8)
+        self.counters = np.ndarray((2,), dtype=np.int64, buffer=self.memory.buf) # [written, read]
+        self.records = np.ndarray((capacity, RECORD_FIELDS), dtype=np.float64, buffer=self.memory.buf, offset=self.HEADER_BYTES)
+        if create:
+            self.counters[:] = 0
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def written(self):
+        return int(self.counters[0])
+
+    def write(self, records, abortEvent=None):
+        """
+        Writes rows of RECORD_FIELDS, waiting while the ring is full.
+
+        Returns:
+        _written: (bool) False if abortEvent was set while waiting for space, the remaining records are not written.
+        """
+        for _record in records:
+            while self.counters[0] - self.counters[1] >= self.capacity:
+                if abortEvent is not None and abortEvent.wait(0.001):
+                    return False
+                if abortEvent is None:
+                    time.sleep(0.001)
+            self.records[self.counters[0] % self.capacity] = _record
+            self.counters[0] += 1 # Published only once the record is complete
+        return True
+
+    def read(self, upTo=None):
+        """Returns a copy of the unread records, only up to record number upTo if given, oldest first."""
+        _start = int(self.counters[1])
+        _end = int(self.counters[0]) if upTo is None else min(int(self.counters[0]), upTo)
+        if _end <= _start:
+            return np.empty((0, RECORD_FIELDS))
+        _indexes = np.arange(_start, _end) % self.capacity
+        _records = self.records[_indexes] # Fancy indexing copies, so the writer can reuse the slots straight away
+        self.counters[1] = _end
+        return _records
+
+    def close(self):
+        del self.counters, self.records # The numpy views hold the buffer, it cannot be closed while they exist
+        self.memory.close()
+        if self.create:
+            self.memory.unlink()
+
+def runAcquisitionEngine(connection, ringName, ringCapacity, simulationSettings=None):
+    """Entry point of the child process."""
+    # Ctrl+C in a terminal reaches the whole process group. Only the parent handles it, and aborts the measurement through the pipe.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from .measurement_handler import inst
+
+    if simulationSettings is not None:
+        inst.configureSimulation(settings=simulationSettings)
+
+    _ring = SampleRing(ringName, ringCapacity)
+    try:
+        AcquisitionEngine(connection, _ring).run()
+    finally:
+        _ring.close()
+        connection.close()
+
+class AcquisitionEngine():
+    """
+    Runs a MeasurementHandler in the child process, without an event loop: its signals are connected directly to the ring and the pipe, and
+    commands are called on it one at a time in the order they arrive, as the queued connections of the measurement thread would.
+    """
+    def __init__(self, connection, ring):
+        from .measurement_handler import MeasurementHandler
+
+        self.connection = connection
+        self.ring = ring
+        self.mutexSend = threading.Lock() # Events come from the command loop and, for aborts, from the listener thread
+        self.commands = queue.Queue()
+        self.mutexMeasurement = QMutex()
+        self.handler = MeasurementHandler(self.mutexMeasurement)
+
+        self.handler.sendSweepPointSignal.connect(self.writeSweepPoint, Qt.DirectConnection)
+        self.handler.sendTrackingSamplesSignal.connect(self.writeTrackingSamples, Qt.DirectConnection)
+        for _signalName in FORWARDED_SIGNALS:
+            getattr(self.handler, _signalName).connect(partial(self.sendEvent, _signalName), Qt.DirectConnection)
+
+        self.send(("ready", self.handler.initialisationMessage, self.handler.validState))
+
+    def send(self, message):
+        with self.mutexSend:
+            try:
+                self.connection.send(message)
+            except (OSError, ValueError):
+                pass # The GUI process has gone, the listener thread stops the engine
+
+    def sendEvent(self, signalName, *arguments):
+        # Tagged with the samples written so far, the proxy emits it after them
+        self.send(("event", signalName, arguments, self.ring.written))
+
+    def writeSweepPoint(self, sweepPoint, acquisitionTime):
+        self.ring.write(((KIND_SWEEP_POINT, acquisitionTime, sweepPoint[0, 0], sweepPoint[0, 1], 0.0),), self.handler.abortEvent)
+
+    def writeTrackingSamples(self, samples):
+        _records = np.column_stack((np.full(len(samples), KIND_TRACKING_SAMPLE), samples))
+        self.ring.write(_records, self.handler.abortEvent)
+
+    def listen(self):
+        """Listener thread: aborts are handled at once, every other command is queued for the command loop."""
+        while True:
+            try:
+                _command, _arguments = self.connection.recv()
+            except (EOFError, OSError):
+                _command, _arguments = "stop", () # The GUI process has gone, nothing would receive the data
+
+            if _command == "abortMeasurement":
+                self.handler.abortMeasurement()
+            elif _command == "stop":
+                self.handler.abortMeasurement()
+                self.commands.put(None)
+                return
+            else:
+                self.commands.put((_command, _arguments))
+
+    def run(self):
+        threading.Thread(target=self.listen, name="Acquisition Commands", daemon=True).start()
+        while True:
+            _command = self.commands.get()
+            if _command is None:
+                return
+            _name, _arguments = _command
+            getattr(self.handler, _name)(*_arguments)
+
+class AcquisitionProcessProxy(QObject):
+    """
+    Stands in for MeasurementHandler in the GUI process (or the headless runner) when acquisition runs in a separate process: same signals,
+    same slots. Lives in the measurement thread, startPolling() must be connected to the thread's started signal and stop() called on shutdown.
+
+    The child process is started by startPolling() and reports once it has initialised the instrument, so neither the GUI thread nor the
+    measurement thread waits for it. Commands sent in the meantime wait in the pipe.
+    """
+    initialisedSignal = pyqtSignal(str, bool) # Start up message and validState, once the child is ready or has failed to start.
+
+    sendVocValueSignal = pyqtSignal(float)
+    sendSweepPointSignal = pyqtSignal(np.ndarray, float)
+    sweepSetStartedSingal = pyqtSignal()
+    finaliseSweepArraySignal = pyqtSignal()
+    sweepSetFinishedSignal = pyqtSignal()
+    abortMeasurementSignal = pyqtSignal()
+    recipeStartedSignal = pyqtSignal(dict)
+    trackingStartedSignal = pyqtSignal(dict)
+    sendTrackingSamplesSignal = pyqtSignal(np.ndarray)
+    measurementVOCStartedSignal = pyqtSignal()
+    measurementVOCFinishedSignal = pyqtSignal()
+    sendConsoleUpdateSignal = pyqtSignal(str)
+    sendStatusUpdateSignal = pyqtSignal(str)
+    shutdownAcknowledgedSignal = pyqtSignal()
+
+    def __init__(self, telemetry=None, simulationSettings=None, ringCapacity=65536, startTimeout=30, pollInterval=5):
+        super().__init__()
+        self.telemetry = telemetry
+        self.pollInterval = pollInterval # (ms)
+        self.mutexSend = threading.Lock() # Aborts are sent from the GUI thread over a DirectConnection, everything else from the measurement thread
+        self.startTimeout = startTimeout # (s)
+
+        # Spawned, not forked: a forked copy of a process running Qt threads is not safe to use
+        _context = multiprocessing.get_context("spawn")
+        self.ring = SampleRing(capacity=ringCapacity, create=True)
+        self.connection, self.childConnection = _context.Pipe()
+        self.process = _context.Process(target=runAcquisitionEngine, args=(self.childConnection, self.ring.name, ringCapacity, simulationSettings),
+                                        name="Acquisition Engine", daemon=True)
+
+        # Until the child reports ready. The owner shows initialisationMessage once connected, and the final one arrives with initialisedSignal.
+        self.starting = True
+        self.startFailed = False
+        self.startDeadline = None
+        self.measurementRequested = False # A measurement was asked for during start up, it is aborted if the start fails
+        self.validState = False
+        self.initialisationMessage = "Starting the acquisition process..."
+
+        self.pollTimer = None
+
+    @pyqtSlot()
+    def startPolling(self):
+        """
+        SLOT CALLED FROM: the measurement thread's started signal, so the timer belongs to that thread.
+
+        Starts the child process, pollTransport() picks up its ready message (or notices it failed) without blocking the thread.
+        """
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setTimerType(Qt.PreciseTimer)
+        self.pollTimer.timeout.connect(self.pollTransport)
+
+        try:
+            self.process.start()
+        except OSError as error:
+            self.respondStartFailed(f"Acquisition process could not be started: {error}")
+            return
+        finally:
+            self.childConnection.close() # Only the child holds its end, so the pipe reports EOF if the child dies
+        self.startDeadline = time.monotonic() + self.startTimeout
+        self.pollTimer.start(self.pollInterval)
+
+    def pollStartUp(self):
+        """
+        Waits for the ready message of the child, which initialises the instrument first.
+
+        Returns:
+        _started: (bool) True once the child is ready, the transport can then be polled.
+        """
+        try:
+            if not self.connection.poll():
+                if time.monotonic() > self.startDeadline:
+                    self.respondStartFailed(f"Acquisition process did not start within {self.startTimeout} s.")
+                return False
+            _, _message, self.validState = self.connection.recv()
+        except (EOFError, OSError):
+            self.respondStartFailed("Acquisition process stopped during start up.")
+            return False
+
+        self.starting = False
+        self.initialisationMessage = _message + f"\nAcquisition running in a separate process (PID {self.process.pid})."
+        self.initialisedSignal.emit(self.initialisationMessage, self.validState)
+        return True
+
+    def respondStartFailed(self, message):
+        self.pollTimer.stop()
+        self.starting = False
+        self.startFailed = True
+        self.validState = False
+        self.initialisationMessage = message
+        if self.process.is_alive():
+            self.process.terminate() # Hung in start up, stop() joins it
+        self.initialisedSignal.emit(message, False)
+        if self.measurementRequested:
+            self.reportNotInitialised()
+
+    def reportNotInitialised(self):
+        # As MeasurementHandler does, so the GUI (or headless runner) returns to idle
+        self.sendConsoleUpdateSignal.emit("Instrument is not initialised, measurement not started.")
+        self.abortMeasurementSignal.emit()
+
+    def sendCommand(self, name, *arguments):
+        with self.mutexSend:
+            try:
+                self.connection.send((name, arguments))
+            except (OSError, ValueError):
+                pass # The child has gone, pollTransport() reports it
+
+    # MeasurementHandler slots
+    @pyqtSlot()
+    def abortMeasurement(self):
+        """CALLED FROM: MainWindow, over a DirectConnection, as for MeasurementHandler."""
+        self.sendCommand("abortMeasurement")
+
+    @pyqtSlot()
+    def acknowledgeShutdown(self):
+        self.validState = False
+        self.sendCommand("acknowledgeShutdown")
+
+    @pyqtSlot()
+    def measureVOC(self):
+        self.sendMeasurementCommand("measureVOC")
+
+    @pyqtSlot(dict)
+    def measureSweep(self, recipe):
+        self.sendMeasurementCommand("measureSweep", recipe)
+
+    @pyqtSlot(list)
+    def runRecipeQueue(self, recipes):
+        self.sendMeasurementCommand("runRecipeQueue", recipes)
+
+    @pyqtSlot(dict)
+    def trackMPP(self, recipe):
+        self.sendMeasurementCommand("trackMPP", recipe)
+
+    def sendMeasurementCommand(self, name, *arguments):
+        if self.startFailed:
+            self.reportNotInitialised() # Nothing would answer
+            return
+        if self.starting:
+            self.measurementRequested = True
+        self.sendCommand(name, *arguments)
+
+    # Transport
+    @pyqtSlot()
+    def pollTransport(self):
+        """Emits the events from the pipe, each after the samples written before it, then the samples written before the poll started."""
+        if self.starting and not self.pollStartUp():
+            return
+
+        # Any event sent before one of these samples was written is already in the pipe, so it is emitted first
+        _samplesWritten = self.ring.written
+        try:
+            while self.connection.poll():
+                _, _signalName, _arguments, _samplesBefore = self.connection.recv()
+                self.emitSamples(self.ring.read(_samplesBefore))
+                getattr(self, _signalName).emit(*_arguments)
+        except (EOFError, OSError):
+            self.respondProcessLost()
+            return
+        self.emitSamples(self.ring.read(_samplesWritten))
+
+    def emitSamples(self, records):
+        if not len(records):
+            return
+        _isTracking = records[:, 0] == KIND_TRACKING_SAMPLE
+        if _isTracking.any():
+            self.sendTrackingSamplesSignal.emit(records[_isTracking, 1:]) # Tracking and sweep samples never interleave, a run is one or the other
+        for _record in records[~_isTracking]:
+            if self.telemetry is not None:
+                self.telemetry.pointSent() # Counted as it leaves the ring, the ring itself is not part of the queue depth
+            self.sendSweepPointSignal.emit(np.array([[_record[2], _record[3]]]), float(_record[1]))
+
+    def respondProcessLost(self):
+        self.pollTimer.stop()
+        self.emitSamples(self.ring.read())
+        if self.validState:
+            self.validState = False
+            self.process.join(1) # The pipe closes as the child exits, give it a moment so the exit code is known
+            self.sendConsoleUpdateSignal.emit(f"ERROR: The acquisition process stopped unexpectedly (exit code {self.process.exitcode}), restart the program to measure again.")
+            self.abortMeasurementSignal.emit() # Returns the GUI and the Data Handler to idle
+
+    @pyqtSlot()
+    def stop(self, timeout=5):
+        """
+        CALLED FROM: MainWindow (shutdown) or the headless runner, once the shutdown has been acknowledged.
+
+        Stops the child process, forcibly if it does not exit within timeout s, and releases the shared memory.
+        """
+        if self.pollTimer is not None:
+            self.pollTimer.stop()
+        self.validState = False
+        self.sendCommand("stop")
+        if self.process.pid is None:
+            self.connection.close() # Never started
+            self.ring.close()
+            return
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.connection.close()
+        self.ring.close()
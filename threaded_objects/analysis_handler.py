@@ -1,6 +1,49 @@
 import numpy as np
 from PyQt5.QtCore import *
 
+def calculateFiguresOfMerit(dataArray, cellArea, power):
+    """
+    Calculates the figures of merit of a JV sweep.
+
+    Works for either sweep direction and either current sign convention, the sign of the short circuit current decides which quadrant is the power generating one.
+
+    Returns:
+    _figuresOfMerit: (np.ndarray) [Voc (V), Jsc (mAcm-2), FF, Efficiency (%)]. Values that cannot be found (e.g. the sweep never crosses zero current) are NaN.
+    """
+    _figuresOfMerit = np.full(4, np.nan)
+
+    # np.interp needs increasing x values
+    _order = np.argsort(dataArray[:, 0])
+    _voltage = dataArray[_order, 0]
+    _current = dataArray[_order, 1]
+
+    if _voltage.size < 2 or not (_voltage[0] <= 0 <= _voltage[-1]):
+        return _figuresOfMerit
+
+    _iSC = np.interp(0, _voltage, _current)
+    _sign = -1 if _iSC < 0 else 1
+    _current = _sign * _current # Generated current is now positive, whatever the instrument convention
+
+    # Voc, linear interpolation at the first positive to negative crossing above 0 V
+    _crossings = np.nonzero((_current[:-1] > 0) & (_current[1:] <= 0) & (_voltage[1:] > 0))[0]
+    if _crossings.size == 0:
+        return _figuresOfMerit
+    _i = _crossings[0]
+    _vOC = _voltage[_i] + (_voltage[_i+1]-_voltage[_i]) * _current[_i] / (_current[_i] - _current[_i+1])
+
+    _power = _voltage * _current
+    _generating = (_voltage >= 0) & (_voltage <= _vOC)
+    _pMax = _power[_generating].max() if np.any(_generating) else np.nan
+
+    _figuresOfMerit[0] = _vOC
+    if cellArea > 0:
+        _figuresOfMerit[1] = abs(_iSC) * 1000 / cellArea
+    if _vOC > 0 and _iSC != 0:
+        _figuresOfMerit[2] = _pMax / (_vOC * abs(_iSC))
+    if cellArea > 0 and power > 0:
+        _figuresOfMerit[3] = 100 * (_pMax * 1000 / cellArea) / power # Power input in mWcm-2
+    return _figuresOfMerit
+
 class AnalysisHandler(QObject):
     def __init__(self):
         super().__init__()
@@ -9,4 +52,4 @@ class AnalysisHandler(QObject):
     
     @pyqtSlot(np.ndarray)
     def updateAnalysisValues(self):
-        pass
\ No newline at end of file
+        pass
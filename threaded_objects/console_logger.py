@@ -0,0 +1,75 @@
+import queue
+import logging
+import logging.handlers
+from datetime import datetime
+from PyQt5.QtCore import *
+
+LOG_FILE_NAME = "programLog.log"
+
+class ConsoleLogger(QObject):
+    """
+    Batches console messages for the GUI console and writes the full history to a rotating log file.
+
+    Lives in the Main GUI Thread. Messages are collected and appended to the console in one go every flushInterval ms, and the console only keeps the
+    last maximumBlockCount lines, so a long run can never make the console the bottleneck of the GUI.
+    The log file is written by a logging.handlers.QueueListener on its own background thread, so the GUI thread only ever puts messages on a queue.
+    """
+    def __init__(self, console, logFilePath=LOG_FILE_NAME, flushInterval=200, maximumBlockCount=5000, maximumFileSize=5_000_000, backupCount=5):
+        super().__init__()
+
+        self.console = console
+        self.console.setMaximumBlockCount(maximumBlockCount) # Oldest lines are dropped once the limit is reached, the log file keeps everything
+
+        self.pendingMessages = []
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True) # Only started when there is something to flush, no idle wake-ups
+        self.timer.setInterval(flushInterval)
+        self.timer.timeout.connect(self.flush)
+
+        # File logging, the GUI thread only enqueues records, the listener thread formats and writes them
+        self.logQueue = queue.SimpleQueue()
+        self.fileHandler = None
+        self.listener = None
+        self.logger = logging.getLogger("dummySweep.console")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+        try:
+            # Opened here rather than on the first record (no delay=True), so an unwritable log file is caught below instead of on the listener thread
+            self.fileHandler = logging.handlers.RotatingFileHandler(logFilePath, maxBytes=maximumFileSize, backupCount=backupCount, encoding="utf-8")
+            self.fileHandler.setFormatter(logging.Formatter("[%(asctime)s]: %(message)s", "%Y-%m-%d %H:%M:%S"))
+            self.queueHandler = logging.handlers.QueueHandler(self.logQueue)
+            self.logger.addHandler(self.queueHandler)
+            self.listener = logging.handlers.QueueListener(self.logQueue, self.fileHandler)
+            self.listener.start()
+        except OSError:
+            self.fileHandler = None # No log file (e.g. read-only folder), the console still works
+
+    @pyqtSlot(str)
+    def log(self, message):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.pendingMessages.append(f"[{timestamp}]:\n{message}\n")
+
+        if self.listener is not None:
+            self.logger.info(message)
+
+        if not self.timer.isActive():
+            self.timer.start()
+
+    @pyqtSlot()
+    def flush(self):
+        """Appends every pending message to the console in a single call, so the console lays out once per batch instead of once per message."""
+        self.timer.stop()
+        if self.pendingMessages:
+            self.console.appendPlainText("\n".join(self.pendingMessages))
+            self.pendingMessages = []
+
+    def close(self):
+        """Flushes the console and waits for the log file writer to finish. Call once, on shutdown."""
+        self.flush()
+        if self.listener is not None:
+            self.listener.stop() # Processes every queued record before returning
+            self.logger.removeHandler(self.queueHandler)
+            self.fileHandler.close()
+            self.listener = None
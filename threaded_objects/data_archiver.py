@@ -0,0 +1,190 @@
+import io
+import os
+import threading
+import re
+import zipfile
+import sqlite3
+import numpy as np
+from PyQt5.QtCore import *
+
+ARCHIVE_EXTENSION = ".zip"
+ARCHIVE_COMPRESSION = zipfile.ZIP_LZMA # Text sweeps compress several-fold with LZMA, and every member is compressed on its own so single sweeps can be read without touching the rest.
+
+def splitArchivePath(path):
+    """
+    Splits a sweep path into the archive path and the member name.
+
+    Archived sweeps are addressed as if the archive were a folder, e.g. "C:/Data/CellA_1-20.zip/CellA_7.csv".
+
+    Returns:
+    _archivePath: (str) path of the .zip file, or None if the path does not point into an archive.
+    _memberName: (str) name of the sweep inside the archive, or None.
+    """
+    _head, _memberName = os.path.split(path)
+    if _head.lower().endswith(ARCHIVE_EXTENSION) and os.path.isfile(_head):
+        return _head, _memberName
+    return None, None
+
+def readSweepFile(path):
+    """
+    Reads a sweep saved by DataSaver, either from a loose .csv file or straight from an archive.
+
+    Only the requested member is decompressed, the zip central directory acts as the index for the archive.
+
+    Returns:
+    _settings: (dict) the "Key: value" pairs of the file header, numeric values converted to float.
+    _dataArray: (np.ndarray) the voltage and current columns.
+    """
+    _archivePath, _memberName = splitArchivePath(path)
+
+    if _archivePath:
+        with zipfile.ZipFile(_archivePath, "r") as _archive:
+            with _archive.open(_memberName, "r") as _member:
+                _lines = io.TextIOWrapper(_member, encoding="utf-8").read().splitlines()
+    else:
+        with open(path, "r") as file:
+            _lines = file.read().splitlines()
+
+    # The header ends with the column titles, everything after is data
+    _settings = {}
+    _dataStart = len(_lines)
+    for _index, _line in enumerate(_lines):
+        if _line.startswith("Voltage(V)"):
+            _dataStart = _index + 1
+            break
+
+        _key, _separator, _value = _line.partition(": ")
+        if _separator:
+            try:
+                _settings[_key] = float(_value)
+            except ValueError:
+                _settings[_key] = _value
+
+    _dataArray = np.loadtxt(_lines[_dataStart:], ndmin=2)
+    return _settings, _dataArray
+
+def listArchivedSweeps(archivePath):
+    """Returns the member names of an archive, read from the zip central directory only."""
+    with zipfile.ZipFile(archivePath, "r") as _archive:
+        return _archive.namelist()
+
+class DataArchiverSignals(QObject):
+    sendConsoleUpdateSignal = pyqtSignal(str) # Archives that could not be written, catalogue rows that could not be moved, and loose files that could not be removed.
+
+class DataArchiver(QRunnable):
+    """
+    Packs the finished sweep files of a run into a single compressed archive, "cellName_first-last.zip", in the working folder.
+
+    The archive is written under a temporary name and only renamed once it has been read back and checked, the loose .csv files are deleted after that.
+    At every point a sweep number exists either as a loose file or inside a finished archive, so DataSaver never reuses a number.
+    A failure (full disk, a file deleted or locked by another program) is reported through signals and never leaves the runnable: whatever could not
+    be archived or removed stays as loose files.
+    """
+    def __init__(self, fileNames, cellName, dataSavePath, cataloguePath=None):
+        super().__init__()
+
+        self.fileNames = fileNames
+        self.cellName = cellName
+        self.dataSavePath = dataSavePath
+        self.cataloguePath = cataloguePath # If set, catalogue rows are moved to the archived paths
+        self.cancelEvent = threading.Event()
+        self.finished = False
+        self.signals = DataArchiverSignals() # See DataSaver
+
+        if not self.cellName:
+            self.cellName = "DEFAULT"
+
+    def cancel(self):
+        """Stops the archive between files, e.g. on shutdown. The partial archive is removed and the loose files are kept."""
+        self.cancelEvent.set()
+
+    def run(self):
+
+        # Archiving is housekeeping, it should never compete with saving or the GUI. Pool threads are reused, so the priority is restored at the end.
+        _thread = QThread.currentThread()
+        _previousPriority = _thread.priority()
+        if _previousPriority == QThread.InheritPriority:
+            _previousPriority = QThread.NormalPriority # InheritPriority can only be used when starting a thread, not set afterwards
+        _thread.setPriority(QThread.LowestPriority)
+
+        try:
+            self.archiveFiles()
+        finally:
+            _thread.setPriority(_previousPriority)
+            self.finished = True
+
+    def archiveFiles(self):
+        _pattern = re.compile(rf"{re.escape(self.cellName)}_(\d+)\.csv$")
+
+        # Only archive files that still exist and belong to this cell
+        _sweepFiles = []
+        for _fileName in self.fileNames:
+            _match = _pattern.match(_fileName)
+            if _match and os.path.isfile(os.path.join(self.dataSavePath, _fileName)):
+                _sweepFiles.append((int(_match.group(1)), _fileName))
+        _sweepFiles.sort()
+
+        if not _sweepFiles:
+            return
+
+        _archiveName = f"{self.cellName}_{_sweepFiles[0][0]}-{_sweepFiles[-1][0]}{ARCHIVE_EXTENSION}"
+        _archivePath = os.path.join(self.dataSavePath, _archiveName)
+        if os.path.exists(_archivePath):
+            return # Should not happen as sweep numbers are never reused, but never overwrite an archive
+
+        _partialPath = _archivePath + ".partial"
+        try:
+            _archived = self.writeArchive(_sweepFiles, _partialPath)
+            if _archived:
+                os.replace(_partialPath, _archivePath)
+        except (OSError, zipfile.BadZipFile) as error:
+            _archived = False
+            self.signals.sendConsoleUpdateSignal.emit(f"WARNING: The sweeps of {self.cellName} could not be archived, they are kept as loose files: {error}")
+
+        if not _archived:
+            try:
+                if os.path.exists(_partialPath):
+                    os.remove(_partialPath)
+            except OSError:
+                pass # Only a leftover, DataSaver and later archives ignore .partial files
+            return
+
+        if self.cataloguePath:
+            from .sweep_catalogue import SweepCatalogue # Imported here, the catalogue itself imports this module to read archives
+            try:
+                SweepCatalogue(self.cataloguePath).updateFilePaths(
+                    [(os.path.join(self.dataSavePath, _fileName), os.path.join(_archivePath, _fileName)) for _number, _fileName in _sweepFiles])
+            except (OSError, sqlite3.Error) as error:
+                # The archive is complete either way, so the loose files still go, the catalogue is fixed by a rebuild
+                self.signals.sendConsoleUpdateSignal.emit(f"WARNING: {_archiveName} was written, but the sweep catalogue could not be updated and still points to the "
+                                                          f"loose files: {error}. Run \"python -m threaded_objects.sweep_catalogue rebuild {self.dataSavePath}\" to fix it.")
+
+        # Each sweep is safe in the archive now, a file that cannot be removed (e.g. open in another program) is simply kept
+        _keptFileNames = []
+        for _number, _fileName in _sweepFiles:
+            try:
+                os.remove(os.path.join(self.dataSavePath, _fileName))
+            except OSError:
+                _keptFileNames.append(_fileName)
+        if _keptFileNames:
+            self.signals.sendConsoleUpdateSignal.emit(f"WARNING: {_archiveName} was written, but these files could not be removed and are kept as well: {', '.join(_keptFileNames)}")
+
+    def writeArchive(self, sweepFiles, partialPath):
+        """
+        Writes the sweep files to the archive under its temporary name and reads it back.
+
+        Returns:
+        _archived: (bool) False if cancelled or the archive did not read back correctly.
+        """
+        with zipfile.ZipFile(partialPath, "w", compression=ARCHIVE_COMPRESSION) as _archive:
+            for _number, _fileName in sweepFiles:
+                if self.cancelEvent.is_set():
+                    return False
+                _archive.write(os.path.join(self.dataSavePath, _fileName), arcname=_fileName)
+
+        # Read the archive back before deleting anything, testzip() decompresses every member and checks the CRCs
+        with zipfile.ZipFile(partialPath, "r") as _archive:
+            _archiveValid = _archive.testzip() is None and sorted(_archive.namelist()) == sorted(_fileName for _number, _fileName in sweepFiles)
+        if not _archiveValid:
+            self.signals.sendConsoleUpdateSignal.emit(f"WARNING: The archive of {self.cellName} did not read back correctly, the sweeps are kept as loose files.")
+        return _archiveValid
@@ -1,46 +1,132 @@
+import time
 import numpy as np
 from PyQt5.QtCore import *
 
+from .voltage_sampler import sortAlongSweep
+from .mpp_tracking import TrackingRollups, TrackingRecorder
+
 class DataHandler(QObject):
-    updateGraphSignal = pyqtSignal(np.ndarray)
+    updateGraphSignal = pyqtSignal(np.ndarray, float) # Array to plot and the acquisition time of its newest point.
     sendConsoleUpdateSignal = pyqtSignal(str)
     sendStatusUpdateSignal = pyqtSignal(str)
-    sendDataArrayForSavingSingal = pyqtSignal(np.ndarray)
+    sendDataArrayForSavingSingal = pyqtSignal(np.ndarray, dict) # Sweep array and the recipe it was measured with.
+    shutdownAcknowledgedSignal = pyqtSignal() # Every array received before the shutdown has been sent for saving.
+    runFinishedSignal = pyqtSignal() # Emitted after the last array of a sweep set has been sent for saving, whether the set finished or was aborted.
+    updateTrackingSignal = pyqtSignal(np.ndarray) # Tracking rollup rows to plot, see mpp_tracking.RollupLevel.
 
-    def __init__(self):
+    def __init__(self, livePreview=True, telemetry=None):
         super().__init__()
+        self.livePreview = livePreview # Without a GUI (headless) there is nothing to draw, so partial arrays are not built every 333 ms
+        self.telemetry = telemetry
         
         self.workingArray = []
+        self.latestAcquisitionTime = 0.0
+        self.recipe = {}
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.sendUpdateGraphSignal, Qt.QueuedConnection)
 
-    @pyqtSlot(np.ndarray)
-    def buildArrayFromSweepPoints(self, receivedSweepPoint):
-        if not self.timer.isActive():
+        # Maximum power point tracking, the raw samples go straight to disk and only the bounded rollups are kept in memory
+        self.trackingRollups = None
+        self.trackingRecorder = None
+        self.trackingTimer = QTimer(self)
+        self.trackingTimer.timeout.connect(self.flushTracking, Qt.QueuedConnection)
+
+    @pyqtSlot(dict)
+    def setRecipe(self, recipe):
+        self.recipe = recipe
+
+    @pyqtSlot(np.ndarray, float)
+    def buildArrayFromSweepPoints(self, receivedSweepPoint, acquisitionTime):
+        if self.telemetry is not None:
+            self.telemetry.pointReceived(acquisitionTime)
+
+        if self.livePreview and not self.timer.isActive():
             self.timer.start(333)
         
         self.workingArray.append(receivedSweepPoint)
+        self.latestAcquisitionTime = acquisitionTime
     
     @pyqtSlot()
     def finaliseArray(self):
         self.timer.stop()
 
-        _measurementArray = np.vstack(self.workingArray)
+        _measurementArray = sortAlongSweep(np.vstack(self.workingArray), self.recipe) # Adaptive sweeps measure out of voltage order
         
-        self.updateGraphSignal.emit(_measurementArray)
-        self.sendDataArrayForSavingSingal.emit(_measurementArray)
+        self.emitUpdateGraph(_measurementArray)
+        self.sendDataArrayForSavingSingal.emit(_measurementArray, self.recipe)
 
         self.workingArray = []
         self.sendConsoleUpdateSignal.emit("Sweep Data Finalised")
     
+    @pyqtSlot(dict)
+    def startTracking(self, recipe):
+        """
+        CALLED FROM: MeasurementHandler (trackMPP), before the first sample.
+        """
+        self.trackingRollups = TrackingRollups()
+        try:
+            self.trackingRecorder = TrackingRecorder(recipe)
+            self.sendConsoleUpdateSignal.emit(f"Tracking data is streamed to {self.trackingRecorder.filePath}")
+        except OSError as error:
+            self.trackingRecorder = None
+            self.sendConsoleUpdateSignal.emit(f"WARNING: The tracking data file could not be created, the raw samples will not be saved. {error}")
+        self.trackingTimer.start(1000) # Flushes the file and updates the plot once a second, however fast the samples arrive
+
+    @pyqtSlot(np.ndarray)
+    def addTrackingSamples(self, samples):
+        if self.trackingRollups is None:
+            return # Queued before a stop (e.g. the shutdown), nothing to add them to
+        self.trackingRollups.add(samples)
+        if self.trackingRecorder is not None:
+            self.trackingRecorder.write(samples)
+
+    @pyqtSlot()
+    def flushTracking(self):
+        if self.trackingRecorder is not None:
+            self.trackingRecorder.flush()
+        if self.livePreview and self.trackingRollups is not None:
+            self.updateTrackingSignal.emit(self.trackingRollups.plotArray(time.time()))
+
+    def stopTracking(self):
+        """Closes the tracking data file, if tracking was running. Every sample of the run has arrived, the stop is queued behind them."""
+        if self.trackingRollups is None:
+            return
+        self.trackingTimer.stop()
+        self.flushTracking()
+        if self.trackingRecorder is not None:
+            self.trackingRecorder.close()
+            self.sendConsoleUpdateSignal.emit(f"Tracking data saved ({self.trackingRecorder.samplesWritten} samples): {self.trackingRecorder.filePath}")
+        self.trackingRollups = None
+        self.trackingRecorder = None
+
     @pyqtSlot()
     def abortMeasurement(self):
         self.workingArray = []
+        self.stopTracking()
 
         # The console and status are updated from "aborting" to "aborted" ONLY once the measurement thread has cleared the working array, which only happens if the main sweep loop in the meausrement thread is exited.
         self.sendConsoleUpdateSignal.emit("Measurement Aborted Successfully")
         self.sendStatusUpdateSignal.emit("Measurement Aborted. Ready to measure.")
+        self.runFinishedSignal.emit()
+
+    @pyqtSlot()
+    def acknowledgeShutdown(self):
+        """
+        CALLED FROM: MeasurementHandler (acknowledgeShutdown)
+
+        Signals from the measurement thread arrive in order, so when this runs every point, finalise and abort of the last run has already been handled.
+        """
+        self.timer.stop()
+        self.workingArray = []
+        self.stopTracking()
+        self.shutdownAcknowledgedSignal.emit()
+
+    @pyqtSlot()
+    def finaliseRun(self):
+        # Queued behind every finaliseArray() call of the set, so all arrays of the run have already been sent for saving.
+        self.stopTracking()
+        self.runFinishedSignal.emit()
 
     @pyqtSlot()
     def sendUpdateGraphSignal(self):
@@ -48,5 +134,10 @@ class DataHandler(QObject):
         # We can never be sure there isn't a signal emission already in the event queue waiting to be processed which will call a method to access self.workingArray AFTER it has been cleared by finaliseArray().
         # Hence, we check if there is valid data to display, before sending it to the Main GUI Thread.
         if self.workingArray:
-            _workingArray = np.vstack(self.workingArray)
-            self.updateGraphSignal.emit(_workingArray)
+            _workingArray = sortAlongSweep(np.vstack(self.workingArray), self.recipe)
+            self.emitUpdateGraph(_workingArray)
+
+    def emitUpdateGraph(self, dataArray):
+        if self.telemetry is not None:
+            self.telemetry.frameSent()
+        self.updateGraphSignal.emit(dataArray, self.latestAcquisitionTime)
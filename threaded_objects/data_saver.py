@@ -1,10 +1,21 @@
 import re
 import os
+import zipfile
+import sqlite3
 import numpy as np
+from datetime import datetime
 from PyQt5.QtCore import *
 
+from .data_archiver import ARCHIVE_EXTENSION, listArchivedSweeps
+from .analysis_handler import calculateFiguresOfMerit
+from .sweep_catalogue import SweepCatalogue
+
+class DataSaverSignals(QObject):
+    saveFinishedSignal = pyqtSignal(str, str) # File name of the saved sweep relative to the working folder ("" if it was not saved), and an error message ("" if none). Always emitted, once.
+    figuresOfMeritSignal = pyqtSignal(str, np.ndarray) # Cell name and [Voc, Jsc, FF, Efficiency] of the saved sweep.
+
 class DataSaver(QRunnable):
-    def __init__(self, mutex, dataArray, sweepSettings, analysisSettings, cellName, dataSavePath):
+    def __init__(self, mutex, dataArray, sweepSettings, analysisSettings, cellName, dataSavePath, cataloguePath=None):
         super().__init__()
         self.mutexFileSaving = mutex
 
@@ -13,10 +24,12 @@ class DataSaver(QRunnable):
         self.analysisSettings = analysisSettings
         self.cellName = cellName
         self.dataSavePath = dataSavePath
+        self.cataloguePath = cataloguePath # If set, every saved sweep is also added to the SQLite catalogue
+        self.signals = DataSaverSignals() # QRunnable is not a QObject, so signals live on a helper object
 
         self.startVoltage = self.sweepSettings[0, 0]
         self.endVoltage = self.sweepSettings[0, 1]
-        self.scanRate = self.sweepSettings[0, 2]
+        self.scanRate = self.sweepSettings[0, 3] # Sweep settings are packed as [start, end, repeats, scan rate]
 
         self.cellArea = self.analysisSettings[0, 0]
         self.power = self.analysisSettings[0, 1]
@@ -25,37 +38,81 @@ class DataSaver(QRunnable):
             self.cellName = "DEFAULT"
 
     def run(self):
+        _fileName = ""
+        _errorMessage = ""
+        try:
+            _fileName, _path, _sweepNumber, _timestamp = self.writeSweepFile()
+        except (OSError, ValueError) as error:
+            _errorMessage = f"WARNING: {self.cellName} could not be saved to {self.dataSavePath}: {error}"
+        else:
+            _figuresOfMerit = calculateFiguresOfMerit(self.dataArray, self.cellArea, self.power)
+            if self.cataloguePath:
+                # The sweep is saved either way, a catalogue that cannot be written is only reported
+                try:
+                    _sweepSettings = np.array([[self.startVoltage, self.endVoltage, self.scanRate]])
+                    SweepCatalogue(self.cataloguePath).addSweep(self.cellName, _sweepNumber, _timestamp.timestamp(), _sweepSettings, self.analysisSettings, _path, _figuresOfMerit)
+                except (OSError, sqlite3.Error) as error:
+                    _errorMessage = f"WARNING: {_fileName} was saved but could not be added to the sweep catalogue: {error}"
+            self.signals.figuresOfMeritSignal.emit(self.cellName, _figuresOfMerit)
+        finally:
+            self.signals.saveFinishedSignal.emit(_fileName, _errorMessage) # Also after an unexpected error, the save service counts the saves still pending
 
+    def writeSweepFile(self):
+        """
+        Writes the sweep to the next free "cellName_N.csv" in the working folder.
+
+        Returns:
+        _fileName: (str) File name of the saved sweep, relative to the working folder.
+        _path: (str) Full path of the saved sweep.
+        _sweepNumber: (int) N.
+        _timestamp: (datetime) Time written to the file header.
+        """
         self.mutexFileSaving.lock() # Theoretically possible for multiple DataSaver QRunnables to operate at once, to prevent duplicate increments and therefore file overwrites, use a mutex
+        try:
+            _timestamp = datetime.now()
+            _header = f"Timestamp: {_timestamp.isoformat(timespec='seconds')}\nSweep Settings:\nStart Voltage (V): {self.startVoltage}\nEnd Voltage (V): {self.endVoltage}\nScan Rate (mV/s): {self.scanRate}\n\nAnalysis Variables:\nCell Area(cm2): {self.cellArea}\nPower (mWcm-2): {self.power}\n\nVoltage(V)   Current (A)"
+            _cellName = self.cellName
 
-        _header = f"Sweep Settings:\nStart Voltage (V): {self.startVoltage}\nEnd Voltage (V): {self.endVoltage}\nScan Rate (mV/s): {self.scanRate}\n\nAnalysis Variables:\nCell Area(cm2): {self.cellArea}\nPower (mWcm-2): {self.power}\n\nVoltage(V)   Current (A)"
-        _cellName = self.cellName
-
-        _pattern = re.compile(rf"{re.escape(_cellName)}(?:_(\d+))?.*$")
-        _workingFolderPath = self.dataSavePath
-
-        # Check if files saved with same name
-        _highestNumFound = 0
-        for _fileName in os.listdir(_workingFolderPath):
-            _match = _pattern.match(_fileName)
-
-            # If files with same name, check for number
-            if _match:
-                _matchedNumber = _match.group(1)
-
-                # If it has a number, keep track of the highest number found
-                if _matchedNumber:
-                    _num = int(_matchedNumber)
-                    _highestNumFound = max(_highestNumFound, _num)
-        
-        # If no number found, save file as "file number 1", otherwise increment
-        if _highestNumFound == 0:
-            _cellName = _cellName + "_1"
-        else:
-            _nextNum = _highestNumFound + 1
-            _cellName = _cellName + "_" + str(_nextNum)
+            _pattern = re.compile(rf"{re.escape(_cellName)}(?:_(\d+))?.*$")
+            _workingFolderPath = self.dataSavePath
+
+            # Check if files saved with same name
+            _highestNumFound = 0
+            for _fileName in os.listdir(_workingFolderPath):
+                _match = _pattern.match(_fileName)
+
+                # If files with same name, check for number
+                if _match:
+                    _matchedNumber = _match.group(1)
+
+                    # If it has a number, keep track of the highest number found
+                    if _matchedNumber:
+                        _num = int(_matchedNumber)
+                        _highestNumFound = max(_highestNumFound, _num)
+
+                    # Archived sweeps keep their numbers, so check inside archives of this cell as well (only the zip index is read)
+                    if _fileName.endswith(ARCHIVE_EXTENSION):
+                        try:
+                            _memberNames = listArchivedSweeps(os.path.join(_workingFolderPath, _fileName))
+                        except (OSError, zipfile.BadZipFile):
+                            continue # Half written or foreign archive, its name has already been counted
+                        for _memberName in _memberNames:
+                            _memberMatch = _pattern.match(_memberName)
+                            if _memberMatch and _memberMatch.group(1):
+                                _highestNumFound = max(_highestNumFound, int(_memberMatch.group(1)))
+
+            # If no number found, save file as "file number 1", otherwise increment
+            if _highestNumFound == 0:
+                _cellName = _cellName + "_1"
+            else:
+                _nextNum = _highestNumFound + 1
+                _cellName = _cellName + "_" + str(_nextNum)
+            _sweepNumber = _highestNumFound + 1
 
-        _path = self.dataSavePath+f"\\{_cellName}.csv"
-        np.savetxt(_path, self.dataArray, delimiter='   ', header=_header, comments='', fmt='%.5e')
+            _fileName = f"{_cellName}.csv"
+            _path = os.path.join(self.dataSavePath, _fileName)
+            np.savetxt(_path, self.dataArray, delimiter='   ', header=_header, comments='', fmt='%.5e')
+        finally:
+            self.mutexFileSaving.unlock() # Released on errors too, otherwise every later save would wait forever
 
-        self.mutexFileSaving.unlock()
\ No newline at end of file
+        return _fileName, _path, _sweepNumber, _timestamp
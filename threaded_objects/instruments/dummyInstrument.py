@@ -5,6 +5,29 @@ import time
 import yaml
 import os
 
+from .dummy_simulation import Simulation
+
+# Simulated source of the dummy instrument (latency, noise, failures, replayed recordings), see configureSimulation()
+_simulation = Simulation()
+
+def configureSimulation(zeroLatency=False, seed=None, settings=None):
+    """
+    Configures the dummy instrument for benchmarking, load tests and reproducible runs. Not part of the instrument interface, real instrument libraries do not need it.
+
+    zeroLatency: (bool) skip the emulated instrument response time, so the software is the only thing being timed.
+    seed: (int or None) seed for the noise, latency and failure random numbers, the same seed gives the same sweeps.
+    settings: (dict or None) simulation settings, see dummy_simulation.DEFAULT_SIMULATION. zeroLatency and seed override them.
+
+    Raises ValueError for invalid settings.
+    """
+    global _simulation
+    _settings = dict(settings or {})
+    if zeroLatency:
+        _settings["Latency"] = {**_settings.get("Latency", {}), "Distribution": "zero"}
+    if seed is not None:
+        _settings["Seed"] = seed
+    _simulation = Simulation(_settings)
+
 def getConfigData():
     """
     Creates or reads the configuration file for the instrument.
@@ -163,7 +186,22 @@ def initilise(configSettings):
     
     return _initialized, _message
 
-def measureVOC():
+def interruptibleWait(seconds, abortEvent=None):
+    """
+    Waits for the instrument, returning early if the measurement is aborted.
+
+    Use this in place of time.sleep() for settle times and polling loops, so that an abort never has to wait for them to finish.
+    For blocking VISA reads, keep the instrument timeout short and poll (e.g. *OPC? or the status byte) with this function in between.
+
+    Returns:
+    _completed: (bool) True if the full time passed, False if the wait was interrupted by the abort event.
+    """
+    if abortEvent is None:
+        time.sleep(seconds)
+        return True
+    return not abortEvent.wait(seconds)
+
+def measureVOC(abortEvent=None):
     """
     Measure the VOC of the cell
 
@@ -176,21 +214,21 @@ def measureVOC():
     Insert the VISA commands between "### VISA COMMANDS HERE ###" and "### END ###"
     
     _valueVOC is set to None by default and should only be set to a value once this value has been checked (i.e. the instrument did not return an error and gave a sensible float back).
+
+    abortEvent (threading.Event or None) is set when the user aborts the measurement. Any wait longer than a few milliseconds should use interruptibleWait() and return None if it was interrupted.
     """
 
     _valueVOC = None
 
     ### VISA COMMANDS HERE ###
-    _lowerLimit = 0.6
-    _upperLimit = 1.05
-    _valueVOC = _lowerLimit+((_upperLimit-_lowerLimit)*np.random.rand())
+    _valueVOC = _simulation.voc()
     _valueVOC = np.round(_valueVOC, 3)
     ### END ###
 
     if _valueVOC is not None:
         return _valueVOC
 
-def measurePoint(voltagePoint = 0):    
+def measurePoint(voltagePoint = 0, abortEvent = None):    
     """
     Measures the current at a given voltage.
 
@@ -206,33 +244,43 @@ def measurePoint(voltagePoint = 0):
     
     If your instrument does not allow this, set _voltage = voltagePoint to return the requested voltage, but be aware of this in your error analysis!
     _current is set to None by default and should only be set to a value once this value has been checked (i.e. the instrument did not return an error and gave a sensible float back).
+
+    abortEvent (threading.Event or None) is set when the user aborts the measurement. Any wait longer than a few milliseconds should use interruptibleWait() and return None if it was
+    interrupted, this is what keeps the time from pressing "Stop Measurement" to the program being idle in milliseconds.
     """
 
     _current = None
 
     ### VISA COMMANDS HERE ###
-    _n = 1.5
-    _k = 1.38e-23
-    _T = 300
-    _I0 = 1e-12
-    _q = 1.6e-19
-
-    _lowerLimit = 0.045
-    _upperLimit = 0.055
-    _sleepTime = _lowerLimit+(_upperLimit-_lowerLimit)*np.random.rand()
-    time.sleep(_sleepTime)                                                  # Wait some time to emulate instrument response
-
-    _voltage = voltagePoint
-    _current = _I0*(np.exp((_q * voltagePoint)/(_n*_k*_T)) - 1)             # Get current point using ideal diode equation
-    
-    _lowerLimit = -0.005
-    _upperLimit = 0.005
-    _currentError = _lowerLimit+(_upperLimit-_lowerLimit)*np.random.rand()  # Add some error into the current
-    
-    _current = _current + _currentError - 0.2
+    _sleepTime = _simulation.pointDelay(voltagePoint)
+    if not interruptibleWait(_sleepTime, abortEvent):                       # Wait some time to emulate instrument response
+        return None
+
+    _point = _simulation.point(voltagePoint)                                # Ideal diode equation with noise, or the next recorded point. None for an injected failure.
+    if _point is not None:
+        _voltage, _current = _point
     ### END ###
 
     if _current is not None:
         return _voltage, _current
 
+def loadSweepPlan(sweepPlan, repeats):
+    """
+    Optional: receives the whole run before the first sweep point is measured (after any pre-bias hold).
+
+    sweepPlan is a read-only (np.ndarray) of rows [voltage (V), nominal time (s), leg index], every leg of one repeat in measurement order, and the run
+    measures it repeats times (see threaded_objects/sweep_plan.py). It is not called for adaptive sweeps, whose voltages are chosen as they are measured.
+
+    Instruments with list sweeps can upload the voltage column here (e.g. a source list, with the repeats as the trigger count) in one transfer, so
+    there is no setup between sweeps or repeats, and pace the points from the time column. The points are still requested one at a time with
+    measurePoint(), in the same order. Delete this function if your instrument has no use for it.
+
+    Insert the VISA commands between "### VISA COMMANDS HERE ###" and "### END ###"
+    """
+
+    ### VISA COMMANDS HERE ###
+    # With "List Sweep" in the simulation settings, points are paced by the time column instead of the latency distribution
+    _simulation.loadSweepList(sweepPlan, repeats)
+    ### END ###
+
 print(getConfigData())
\ No newline at end of file
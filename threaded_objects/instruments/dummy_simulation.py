@@ -0,0 +1,272 @@
+"""
+Simulation behind the dummy instrument, for load testing and reproducing field problems without hardware.
+
+Two sources of points:
+synthetic  the ideal diode curve with uniform current noise, as the dummy instrument has always produced.
+replay     recorded sweep files (loose .csv files, archive members, whole archives or folders), point by point in the order they were recorded.
+
+Every point waits a delay first. For synthetic points it is drawn from the latency distribution, replayed points keep the timing of the
+recording (the recorded scan rate), divided by "Replay Speed". With "List Sweep" on, the points of a loaded sweep plan are instead paced by the
+nominal times of the plan, like an instrument running an uploaded source list at the scan rate. Failures are injected at random: a failed point returns None, exactly like an
+instrument error, and a stall adds a long (but abortable) delay. All random numbers come from one generator, so a seed reproduces a run.
+
+Settings are a dict shaped like DEFAULT_SIMULATION, usually loaded from a JSON file, see loadSimulationSettings().
+"""
+import os
+import copy
+import json
+import time
+import numpy as np
+
+DEFAULT_SIMULATION = {
+    "Seed": None,                 # (int or None) Seed for every random number, the same seed gives the same run
+    "Latency": {                  # (ms) Response time of the instrument for each synthetic point
+        "Distribution": "uniform", # "zero", "fixed", "uniform", "normal", "lognormal" or "exponential"
+        "Low": 45.0,              # uniform
+        "High": 55.0,             # uniform
+        "Mean": 50.0,             # fixed, normal, exponential
+        "Standard Deviation": 5.0, # normal
+        "Median": 50.0,           # lognormal
+        "Sigma": 0.5              # lognormal, of the underlying normal distribution
+    },
+    "Noise": 0.005,               # (A) Synthetic current noise, uniform in +/- this value
+    "Failure Rate": 0.0,          # Probability that a point fails (the instrument returns None)
+    "Stall Rate": 0.0,            # Probability that a point takes "Stall Time" longer
+    "Stall Time": 1000.0,         # (ms)
+    "Replay Files": [],           # Recorded sweeps to replay instead of the synthetic curve, played in order and looped
+    "Replay Speed": 1.0,          # 1 = recorded timing, 10 = ten times faster, 0 = as fast as possible
+    "List Sweep": False           # (bool) Pace the points of a loaded sweep plan by its nominal times (the scan rate) instead of the delays above
+}
+
+SIMULATION_SETTING = "Simulation" # Top level key of programSettings.json for the GUI, read at start up. headless.py and the benchmark take a --simulation file.
+
+LATENCY_DISTRIBUTIONS = ("zero", "fixed", "uniform", "normal", "lognormal", "exponential")
+
+def buildSimulationSettings(settings=None):
+    """Returns complete simulation settings, DEFAULT_SIMULATION updated with settings (the "Latency" section key by key). Raises ValueError for invalid values."""
+    _settings = copy.deepcopy(DEFAULT_SIMULATION)
+    for _key, _value in (settings or {}).items():
+        if _key not in _settings:
+            raise ValueError(f"Unknown simulation setting \"{_key}\".")
+        if _key == "Latency":
+            _settings["Latency"].update(_value)
+        else:
+            _settings[_key] = copy.deepcopy(_value)
+
+    if _settings["Latency"]["Distribution"] not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Latency distribution must be one of {', '.join(LATENCY_DISTRIBUTIONS)}.")
+    for _key in ("Failure Rate", "Stall Rate"):
+        if not 0 <= _settings[_key] <= 1:
+            raise ValueError(f"\"{_key}\" is a probability, between 0 and 1.")
+    if _settings["Replay Speed"] < 0:
+        raise ValueError("\"Replay Speed\" cannot be negative.")
+    return _settings
+
+def loadSimulationSettings(path):
+    """Loads simulation settings from a JSON file, see DEFAULT_SIMULATION. Raises OSError or ValueError."""
+    with open(path, "r") as file:
+        _loaded = json.load(file)
+    if not isinstance(_loaded, dict):
+        raise ValueError(f"{path} does not contain simulation settings.")
+    return buildSimulationSettings(_loaded)
+
+def expandReplayPaths(paths):
+    """
+    Expands folders and archives into the sweep files they hold, sorted by name, so the recording is replayed in the order it was saved.
+    Paths into an archive (archive.zip/member.csv) are kept as they are.
+    """
+    from ..data_archiver import ARCHIVE_EXTENSION, listArchivedSweeps
+
+    _sweepPaths = []
+    for _path in paths:
+        if os.path.isdir(_path):
+            for _entry in sorted(os.listdir(_path)):
+                if _entry.endswith(".csv") or _entry.endswith(ARCHIVE_EXTENSION):
+                    _sweepPaths += expandReplayPaths([os.path.join(_path, _entry)])
+        elif _path.endswith(ARCHIVE_EXTENSION) and os.path.isfile(_path):
+            _sweepPaths += [f"{_path}/{_member}" for _member in sorted(listArchivedSweeps(_path))]
+        else:
+            _sweepPaths.append(_path)
+    return _sweepPaths
+
+def syntheticCurrent(voltage):
+    """Ideal diode equation, offset by the 0.2 A photocurrent."""
+    _n = 1.5
+    _k = 1.38e-23
+    _T = 300
+    _I0 = 1e-12
+    _q = 1.6e-19
+    return _I0*(np.exp((_q * voltage)/(_n*_k*_T)) - 1) - 0.2
+
+class Simulation():
+    """
+    State of one simulated instrument: the random generator and the position in the replayed recording.
+
+    Only ever used from the measurement thread (the instrument functions), so it needs no locking.
+    """
+    def __init__(self, settings=None):
+        self.settings = buildSimulationSettings(settings)
+        self.rng = np.random.default_rng(self.settings["Seed"])
+
+        # Recorded sweeps are read one at a time when replay reaches them, an overnight recording is never held in memory at once
+        self.replayPaths = expandReplayPaths(self.settings["Replay Files"])
+        self.replayIndex = -1
+        self.replayPoints = np.empty((0, 2))
+        self.replayIntervals = np.empty(0)
+        self.replayPosition = 0
+        if self.replaying:
+            self.loadNextRecording() # Raises ValueError now, rather than in the middle of a measurement, if nothing can be replayed
+
+        # Sweep plan of the run, see loadSweepList()
+        self.listTable = None
+        self.listLength = 0
+        self.listPosition = 0
+        self.listStartTime = None
+        self.listRepeatDuration = 0.0
+
+    @property
+    def replaying(self):
+        return bool(self.replayPaths)
+
+    def latency(self):
+        """(s) Response time for a synthetic point, drawn from the latency distribution."""
+        _latency = self.settings["Latency"]
+        _distribution = _latency["Distribution"]
+
+        if _distribution == "zero":
+            _milliseconds = 0.0
+        elif _distribution == "fixed":
+            _milliseconds = _latency["Mean"]
+        elif _distribution == "uniform":
+            _milliseconds = self.rng.uniform(_latency["Low"], _latency["High"])
+        elif _distribution == "normal":
+            _milliseconds = self.rng.normal(_latency["Mean"], _latency["Standard Deviation"])
+        elif _distribution == "lognormal":
+            _milliseconds = _latency["Median"] * np.exp(self.rng.normal(0, _latency["Sigma"]))
+        else:
+            _milliseconds = self.rng.exponential(_latency["Mean"])
+        return max(_milliseconds, 0.0) / 1000
+
+    def injectStall(self):
+        """(s) Extra delay, "Stall Time" with probability "Stall Rate", otherwise 0."""
+        if self.settings["Stall Rate"] and self.rng.random() < self.settings["Stall Rate"]:
+            return self.settings["Stall Time"] / 1000
+        return 0.0
+
+    def injectFailure(self):
+        """True with probability "Failure Rate"."""
+        return bool(self.settings["Failure Rate"]) and self.rng.random() < self.settings["Failure Rate"]
+
+    def loadNextRecording(self):
+        """Moves on to the next recorded sweep, looping back to the first after the last. Unreadable files are skipped."""
+        from ..data_archiver import readSweepFile
+
+        for _ in range(len(self.replayPaths)):
+            self.replayIndex = (self.replayIndex + 1) % len(self.replayPaths)
+            try:
+                _recordedSettings, _recordedPoints = readSweepFile(self.replayPaths[self.replayIndex])
+            except (OSError, ValueError, KeyError):
+                continue
+            if _recordedPoints.shape[0] == 0 or _recordedPoints.shape[1] < 2:
+                continue
+
+            # Time between recorded points from the voltage step and the recorded scan rate. Without a scan rate the latency distribution is used.
+            _scanRate = _recordedSettings.get("Scan Rate (mV/s)")
+            if isinstance(_scanRate, float) and _scanRate > 0:
+                _steps = np.abs(np.diff(_recordedPoints[:, 0], prepend=_recordedPoints[0, 0]))
+                if len(_steps) > 1:
+                    _steps[0] = _steps[1] # The first point is one step after the previous sweep, as for the others
+                self.replayIntervals = _steps / (_scanRate / 1000)
+            else:
+                self.replayIntervals = np.full(len(_recordedPoints), np.nan)
+
+            self.replayPoints = _recordedPoints[:, :2]
+            self.replayPosition = 0
+            return
+        raise ValueError("None of the replay files could be read.")
+
+    def loadSweepList(self, table, repeats):
+        """
+        Takes the sweep plan of a run, see the dummy instrument's loadSweepPlan(). The clock of the list starts at its first point.
+
+        table: (np.ndarray) rows of [voltage, nominal time, leg index] of one repeat, measured repeats times. A repeat starts again straight after
+        the last point of the one before, as the first point of the table has no scan time of its own.
+        """
+        self.listTable = table
+        self.listLength = len(table) * repeats
+        self.listPosition = 0
+        self.listStartTime = None
+        self.listRepeatDuration = float(table[-1, 1] - table[0, 1]) if len(table) else 0.0
+
+    def listDelay(self, voltagePoint):
+        """
+        (s) Time until the point is due in the loaded sweep list, or None if the point is not paced by the list: "List Sweep" is off, no list is
+        loaded or it is finished, or the voltage is not the next one of the list (e.g. tracking or a Voc measurement), which also ends the list.
+        """
+        if not self.settings["List Sweep"] or self.listTable is None or self.listPosition >= self.listLength:
+            return None
+        _row = self.listPosition % len(self.listTable)
+        if voltagePoint != self.listTable[_row, 0]:
+            self.listTable = None
+            return None
+
+        _dueTime = self.listTable[_row, 1] + (self.listPosition // len(self.listTable)) * self.listRepeatDuration
+        _now = time.perf_counter()
+        if self.listStartTime is None:
+            self.listStartTime = _now - _dueTime
+        self.listPosition += 1
+        return max(self.listStartTime + _dueTime - _now, 0.0)
+
+    def pointDelay(self, voltagePoint=None):
+        """(s) Time to wait before the next point is returned, including any injected stall."""
+        _listDelay = self.listDelay(voltagePoint)
+        if _listDelay is not None:
+            return _listDelay + self.injectStall()
+
+        if self.replaying:
+            if self.replayPosition >= len(self.replayPoints):
+                self.loadNextRecording()
+            _interval = self.replayIntervals[self.replayPosition]
+            if np.isnan(_interval):
+                _delay = self.latency()
+            elif self.settings["Replay Speed"] == 0:
+                _delay = 0.0
+            else:
+                _delay = _interval / self.settings["Replay Speed"]
+        else:
+            _delay = self.latency()
+        return _delay + self.injectStall()
+
+    def point(self, voltagePoint):
+        """
+        Returns:
+        _point: (voltage, current) of the next point, the recorded voltage when replaying, or None if a failure was injected.
+        """
+        if self.injectFailure():
+            if self.replaying:
+                self.replayPosition += 1 # The failed point is still used up, like a missed reading
+            return None
+
+        if self.replaying:
+            if self.replayPosition >= len(self.replayPoints):
+                self.loadNextRecording()
+            _voltage, _current = self.replayPoints[self.replayPosition]
+            self.replayPosition += 1
+            return float(_voltage), float(_current)
+
+        _noise = self.settings["Noise"]
+        return voltagePoint, syntheticCurrent(voltagePoint) + self.rng.uniform(-_noise, _noise)
+
+    def voc(self):
+        """Open circuit voltage: where the replayed sweep crosses zero current, otherwise random between 0.6 and 1.05 V."""
+        if self.replaying:
+            if self.replayPosition >= len(self.replayPoints):
+                self.loadNextRecording()
+            _voltage, _current = self.replayPoints[:, 0], self.replayPoints[:, 1]
+            _crossings = np.nonzero(np.diff(np.sign(_current)))[0]
+            if len(_crossings):
+                _index = _crossings[0]
+                _v0, _v1 = _voltage[_index:_index+2]
+                _i0, _i1 = _current[_index:_index+2]
+                return float(_v0 - _i0 * (_v1 - _v0) / (_i1 - _i0)) # Linear interpolation between the two points either side of zero
+        return 0.6 + (1.05 - 0.6) * self.rng.random()
@@ -1,47 +1,82 @@
 import time
+import threading
 import numpy as np
 from PyQt5.QtCore import *
 
 from .instruments import dummyInstrument as inst
+from .voltage_sampler import createSampler
+from .sweep_plan import compileRecipePlan, legRecipe
 
 class MeasurementHandler(QObject):
     sendVocValueSignal = pyqtSignal(float)
-    sendSweepPointSignal = pyqtSignal(np.ndarray)
+    sendSweepPointSignal = pyqtSignal(np.ndarray, float) # Point and its acquisition time (time.perf_counter()), for the stage latencies.
     
     sweepSetStartedSingal = pyqtSignal()     # Measurement is active.
     finaliseSweepArraySignal = pyqtSignal()  # A sweep has finished, array can be sent for analysis.
     sweepSetFinishedSignal = pyqtSignal()    # Measurement is no longer active.
     abortMeasurementSignal = pyqtSignal()    # When the sweep has been aborted succesfully
+    recipeStartedSignal = pyqtSignal(dict)   # A recipe of the queue is starting, the recipe travels with its data to the Data Handler.
+    trackingStartedSignal = pyqtSignal(dict) # Maximum power point tracking is starting, with its recipe.
+    sendTrackingSamplesSignal = pyqtSignal(np.ndarray) # Tracking samples, rows of [time (s since epoch), voltage, current, power].
     
     measurementVOCStartedSignal = pyqtSignal()
     measurementVOCFinishedSignal = pyqtSignal()
     sendConsoleUpdateSignal = pyqtSignal(str)
     sendStatusUpdateSignal = pyqtSignal(str)
+    shutdownAcknowledgedSignal = pyqtSignal() # No measurement is running and none will start, everything measured has been emitted.
 
-    def __init__(self, mutexMeasurement):
+    def __init__(self, mutexMeasurement, telemetry=None):
         super().__init__()
         self.mutexMeasurement = mutexMeasurement
+        self.telemetry = telemetry
         
-        _initilised, _message = inst.initilise()
+        _configSettings, _configMessage = inst.getConfigData()
+        _initilised, _message = inst.initilise(_configSettings)
+        _message = _configMessage + "\n" + _message
+        self.initialisationMessage = _message # Signals emitted here reach nobody yet, so the owner shows this once connected
+
+        # Set by abortMeasurement() from the GUI thread. Being a threading.Event, it also wakes up any wait inside the instrument library immediately.
+        self.abortEvent = threading.Event()
+        self.abortEvent.set() # No consent until a measurement starts
+        self.abortRequestedTime = None
+        self.worstAbortLatency = 0 # (ms) Slowest abort-to-idle time since the program started
 
         if _initilised:
             self.validState = True
-            self.measurementConsent = False
 
             self.sendConsoleUpdateSignal.emit(_message)
         else:
             self.validState = False
-            self.measurementConsent = False
         
             self.sendConsoleUpdateSignal.emit(_message)
 
+    @property
+    def measurementConsent(self):
+        return not self.abortEvent.is_set()
+
     @pyqtSlot()
     def abortMeasurement(self):
-        self.measurementConsent = False
+        """
+        CALLED FROM: MainWindow, over a DirectConnection, so this runs in the caller's thread while the measurement thread is busy.
+        """
+        if self.measurementConsent:
+            self.abortRequestedTime = time.perf_counter()
+        self.abortEvent.set()
 
         self.sendConsoleUpdateSignal.emit("Sweep Abort Command Registered")
         self.sendStatusUpdateSignal.emit("Aborting Measurement...")
 
+    @pyqtSlot()
+    def acknowledgeShutdown(self):
+        """
+        CALLED FROM: MainWindow (shutdown), queued after an abort.
+
+        Being queued, this only runs once the measurement loop has returned, so every point and finalise signal of the run is already on its way to the Data Handler.
+        """
+        self.validState = False # Nothing queued after this may start a measurement
+        self.abortEvent.set()
+        self.shutdownAcknowledgedSignal.emit()
+
     @pyqtSlot()
     def measureVOC(self):
         self.sendConsoleUpdateSignal.emit("Voc Measurement Started")
@@ -55,53 +90,295 @@ class MeasurementHandler(QObject):
         self.measurementVOCFinishedSignal.emit()
         self.sendConsoleUpdateSignal.emit(f"Voc Measurement Finished\nValue: {_dataPoint:.3f} V")
 
-    @pyqtSlot(np.ndarray)
-    def measureSweep(self, sweepSettings):
+    @pyqtSlot(dict)
+    def measureSweep(self, recipe):
+        """
+        CALLED FROM: MainWindow (gatekeeperSweepMeasurement)
+
+        Measures a single recipe, i.e. the sweep set for the settings currently in the GUI.
+        """
+        self.runRecipeQueue([recipe])
+
+    @pyqtSlot(list)
+    def runRecipeQueue(self, recipes):
+        """
+        CALLED FROM: MainWindow (gatekeeperRecipeQueue)
+
+        Measures every recipe back to back, without returning to the GUI between them. The GUI sees one measurement from the first sweep to the last.
+        """
         self.mutexMeasurement.lock()
 
-        _sweepSettings = sweepSettings
-        _startVoltage = _sweepSettings[0, 0]
-        _endVoltage = _sweepSettings[0, 1]
-        _repeats = int(_sweepSettings[0, 2])
-        _scanRate = _sweepSettings[0, 3]
-        
         if self.validState:
-            self.measurementConsent = True
+            self.abortRequestedTime = None
+            self.abortEvent.clear()
             self.sweepSetStartedSingal.emit()
-            
-            for _sweepNumber in range(1, _repeats+1):
-                
-                # Only send messages if measurement has consent
-                if self.measurementConsent:
-                    _consoleMessage = f"Measuring Sweep ({_sweepNumber} of {_repeats})"
+
+            for _recipeNumber, _recipe in enumerate(recipes, start=1):
+                if not self.measurementConsent:
+                    break
+
+                if len(recipes) > 1:
+                    _consoleMessage = f"Recipe {_recipeNumber} of {len(recipes)}: {_recipe['File I/O Settings']['Cell Name']}"
                     self.sendConsoleUpdateSignal.emit(_consoleMessage)
                     self.sendStatusUpdateSignal.emit(_consoleMessage)
-                
-                _sweepPoint = np.empty((1, 2))
-                
-                _measurementPoints = np.linspace(_startVoltage, _endVoltage, num=250)
-                for _voltagePoint in _measurementPoints:
-                    
-                    if self.measurementConsent:
-
-                        _voltage, _current = inst.measurePoint(_voltagePoint)
-                        _sweepPoint[0, 0] = _voltage
-                        _sweepPoint[0, 1] = _current
-                        
-                        self.sendSweepPointSignal.emit(_sweepPoint.copy()) # .copy() otherwise the for loop "catches up" with the emit signal, and you end up writing over the data being emitted.    
-                                
-                # Only send finaliseSweepArraySignal IF the program finished the loop with measurement consent
-                if self.measurementConsent: 
-                    self.sendConsoleUpdateSignal.emit(f"Sweep Finished ({_sweepNumber} of {_repeats})")
-                    self.finaliseSweepArraySignal.emit()
-            
-            # Only send measurement finished if there is measurement consent
-            if self.measurementConsent:
-                self.sweepSetFinishedSignal.emit()
-            else:
-                self.abortMeasurementSignal.emit()
-        
+
+                self.measureRecipe(_recipe)
+
+            self.finishMeasurement()
+
         else:
-            pass
-            # message about not in valid state
-        self.mutexMeasurement.unlock()
\ No newline at end of file
+            self.reportNotInitialised()
+        self.mutexMeasurement.unlock()
+
+    @pyqtSlot(dict)
+    def trackMPP(self, recipe):
+        """
+        CALLED FROM: MainWindow (gatekeeperTrackMPP) or the headless runner
+
+        Tracks the maximum power point until the tracking duration has passed or the measurement is aborted. The GUI sees it as one measurement.
+        """
+        self.mutexMeasurement.lock()
+
+        if self.validState:
+            self.abortRequestedTime = None
+            self.abortEvent.clear()
+            self.sweepSetStartedSingal.emit()
+            self.trackingStartedSignal.emit(recipe) # Queued before the first sample, so the Data Handler has its file open in time
+
+            self.measureTracking(recipe)
+            self.finishMeasurement()
+
+        else:
+            self.reportNotInitialised()
+        self.mutexMeasurement.unlock()
+
+    def finishMeasurement(self):
+        # Only send measurement finished if there is measurement consent
+        if self.measurementConsent:
+            self.abortEvent.set()
+            self.sweepSetFinishedSignal.emit()
+        else:
+            self.reportAbortLatency()
+            self.abortMeasurementSignal.emit()
+
+    def reportNotInitialised(self):
+        # Nothing was measured, report it like an abort so the GUI (or headless runner) returns to idle
+        self.sendConsoleUpdateSignal.emit("Instrument is not initialised, measurement not started.")
+        self.abortMeasurementSignal.emit()
+
+    def measureTracking(self, recipe):
+        """
+        Perturb and observe: step the voltage by "Step", keep going while the power rises and turn around when it falls, so the voltage
+        oscillates around the maximum power point and follows it as the cell changes. The voltage is kept within the sweep start and end voltages.
+
+        The sign of the generated power is taken from the short circuit current, measured once at 0 V before tracking starts.
+        """
+        _tracking = recipe["Tracking Settings"]
+        _sweep = recipe["Sweep Settings"]
+        _lowestVoltage = min(_sweep["Start Voltage"], _sweep["End Voltage"])
+        _highestVoltage = max(_sweep["Start Voltage"], _sweep["End Voltage"])
+
+        # Start at the given voltage, or near the maximum power point of a typical cell, 80 % of Voc
+        _voltagePoint = _tracking["Start Voltage"]
+        if _voltagePoint is None:
+            _valueVOC = inst.measureVOC(self.abortEvent)
+            if _valueVOC is None:
+                return # Aborted during the measurement
+            self.sendVocValueSignal.emit(_valueVOC)
+            _voltagePoint = 0.8 * _valueVOC
+        _voltagePoint = min(max(_voltagePoint, _lowestVoltage), _highestVoltage)
+
+        _startTime = time.time()
+        _lastStatusTime = 0
+        _direction = 1
+        _powerSign = None
+        _previousPower = None
+        self.sendConsoleUpdateSignal.emit(f"Maximum Power Point Tracking Started at {_voltagePoint:.3f} V")
+
+        while self.measurementConsent and (_tracking["Duration"] <= 0 or time.time() - _startTime < _tracking["Duration"]):
+            # Generated power is positive whatever the current sign convention of the instrument. Between 0 V and Voc the current has the sign of
+            # the short circuit current, a sample taken beyond Voc or in reverse bias would have the opposite sign and track the minimum power instead.
+            if _powerSign is None:
+                _shortCircuitPoint = self.measurePointWithRetries(0.0, _sweep["Point Retries"])
+                if not self.measurementConsent:
+                    break
+                if _shortCircuitPoint is None:
+                    if not self.respondFailedPoint(0.0, recipe):
+                        break
+                    self.waitWithConsent(_tracking["Interval"])
+                    continue
+                _powerSign = -1 if _shortCircuitPoint[1] < 0 else 1
+
+            _measuredPoint = self.measurePointWithRetries(_voltagePoint, _sweep["Point Retries"])
+            if not self.measurementConsent:
+                break
+            if _measuredPoint is None:
+                if not self.respondFailedPoint(_voltagePoint, recipe):
+                    break
+                self.waitWithConsent(_tracking["Interval"]) # Skipped, the next sample is taken at the same voltage
+                continue
+
+            _voltage, _current = _measuredPoint
+            _sampleTime = time.time()
+
+            _power = _powerSign * _voltage * _current
+            self.sendTrackingSamplesSignal.emit(np.array([[_sampleTime, _voltage, _current, _power]]))
+
+            if _previousPower is not None and _power < _previousPower:
+                _direction = -_direction
+            _previousPower = _power
+            _voltagePoint = min(max(_voltagePoint + _direction * _tracking["Step"], _lowestVoltage), _highestVoltage)
+
+            if _sampleTime - _lastStatusTime >= 1:
+                _lastStatusTime = _sampleTime
+                _elapsed = int(_sampleTime - _startTime)
+                self.sendStatusUpdateSignal.emit(f"Tracking MPP: {_power * 1000:.3f} mW at {_voltage:.3f} V ({_elapsed // 3600} h {_elapsed % 3600 // 60:02d} min {_elapsed % 60:02d} s)")
+
+            self.waitWithConsent(_tracking["Interval"])
+
+    def measureRecipe(self, recipe):
+        """Runs one recipe: optional Voc pre-check, delay before, the sweep set, delay after."""
+        _recipeSettings = recipe["Recipe Settings"]
+
+        # The Data Handler attaches the recipe to every array it sends for saving. Signals from this thread arrive in order, so the recipe always reaches it before the sweep points.
+        self.recipeStartedSignal.emit(recipe)
+
+        if _recipeSettings["Voc Pre-Check"]:
+            _valueVOC = inst.measureVOC(self.abortEvent)
+            if _valueVOC is None:
+                return # Aborted during the measurement
+            self.sendVocValueSignal.emit(_valueVOC)
+            if _valueVOC < _recipeSettings["Minimum Voc"]:
+                self.sendConsoleUpdateSignal.emit(f"Voc Pre-Check Failed ({_valueVOC:.3f} V < {_recipeSettings['Minimum Voc']:.3f} V), skipping {recipe['File I/O Settings']['Cell Name']}")
+                return
+
+        self.waitWithConsent(_recipeSettings["Delay Before"])
+        self.measureSweepSet(recipe)
+        self.waitWithConsent(_recipeSettings["Delay After"])
+
+    def measurePointWithRetries(self, voltagePoint, retries):
+        """
+        Measures a point, asking the instrument again up to retries times while it returns None (an instrument error, or a failure injected by the
+        dummy instrument's simulation). An abort is never retried.
+
+        Returns:
+        _measuredPoint: (voltage, current), or None if every attempt failed or the measurement was aborted.
+        """
+        for _attempt in range(int(retries) + 1):
+            _measuredPoint = inst.measurePoint(voltagePoint, self.abortEvent)
+            if _measuredPoint is not None or not self.measurementConsent:
+                return _measuredPoint
+        return None
+
+    def respondFailedPoint(self, voltagePoint, recipe):
+        """
+        Applies the "Failed Points" policy of the recipe to a point that failed every retry, with measurement consent.
+
+        Returns:
+        _skipped: (bool) True if the measurement goes on without the point, False if it has been aborted.
+        """
+        if recipe["Sweep Settings"]["Failed Points"] == "Skip":
+            self.sendConsoleUpdateSignal.emit(f"WARNING: The instrument did not return a point at {voltagePoint:.3f} V, skipping it.")
+            return True
+        self.sendConsoleUpdateSignal.emit(f"WARNING: The instrument did not return a point at {voltagePoint:.3f} V, aborting measurement.")
+        self.abortMeasurement()
+        return False
+
+    def waitWithConsent(self, seconds):
+        """Waits for the given time, returning as soon as the measurement is aborted."""
+        if seconds > 0:
+            self.abortEvent.wait(seconds)
+
+    def reportAbortLatency(self):
+        """Reports the time from the abort request to the measurement loop being exited."""
+        if self.abortRequestedTime is None:
+            return
+        _latency = (time.perf_counter() - self.abortRequestedTime) * 1000
+        self.worstAbortLatency = max(self.worstAbortLatency, _latency)
+        self.sendConsoleUpdateSignal.emit(f"Measurement stopped {_latency:.1f} ms after the abort request (worst so far: {self.worstAbortLatency:.1f} ms)")
+
+    def measureSweepSet(self, recipe):
+        """
+        Measures every sweep of the recipe's compiled sweep plan (see sweep_plan.py) back to back: all repeats and, for hysteresis and multi-segment
+        sweeps, every leg, as one continuous waveform. Each leg is finalised and saved as a sweep of its own.
+        """
+        try:
+            _plan = compileRecipePlan(recipe) # Cached, a recipe measured again does not rebuild it
+        except (ValueError, TypeError, KeyError) as error:
+            self.sendConsoleUpdateSignal.emit(f"WARNING: Invalid sweep settings, {error}")
+            self.abortMeasurement()
+            return
+        _adaptive = recipe["Sweep Settings"]["Sampling"] == "Adaptive"
+
+        if _plan.holdTime > 0:
+            _consoleMessage = f"Pre-Bias Hold at {_plan.holdVoltage:.3f} V for {_plan.holdTime:g} s"
+            self.sendConsoleUpdateSignal.emit(_consoleMessage)
+            self.sendStatusUpdateSignal.emit(_consoleMessage)
+            if self.measurePointWithRetries(_plan.holdVoltage, recipe["Sweep Settings"]["Point Retries"]) is None:
+                if not self.measurementConsent or not self.respondFailedPoint(_plan.holdVoltage, recipe):
+                    return
+            self.waitWithConsent(_plan.holdTime)
+
+        # Instruments with list sweeps can take the whole plan at once (one repeat and the repeat count), adaptive sweeps choose their voltages as they go.
+        # Loaded after the hold, so the next point the instrument is asked for is the first of the list.
+        _loadSweepPlan = getattr(inst, "loadSweepPlan", None)
+        if _loadSweepPlan is not None and not _adaptive:
+            _loadSweepPlan(_plan.table, _plan.repeats)
+
+        _sweepCount = _plan.sweepCount
+        _recipeLeg = (recipe["Sweep Settings"]["Start Voltage"], recipe["Sweep Settings"]["End Voltage"])
+        _currentLeg = _recipeLeg
+        for _sweepIndex in range(_sweepCount):
+            _sweepNumber = _sweepIndex + 1
+            _leg = _plan.leg(_sweepIndex)
+
+            # An abort ends the whole set, not just the current sweep
+            if not self.measurementConsent:
+                break
+
+            # A leg in another direction is saved with its own start and end voltage. Queued before its points, like the recipe itself.
+            if _leg != _currentLeg:
+                _currentLeg = _leg
+                self.recipeStartedSignal.emit(recipe if _leg == _recipeLeg else legRecipe(recipe, *_leg))
+
+            _consoleMessage = f"Measuring Sweep ({_sweepNumber} of {_sweepCount})"
+            self.sendConsoleUpdateSignal.emit(_consoleMessage)
+            self.sendStatusUpdateSignal.emit(_consoleMessage)
+
+            _sweepPoint = np.empty((1, 2))
+            _pointsMeasured = 0
+            _pointsSkipped = 0
+
+            # The planned voltages, or an adaptive sweep over the leg choosing each voltage from the points measured so far
+            _sampler = createSampler(legRecipe(recipe, *_leg) if _adaptive else recipe, _plan.sweepVoltages(_sweepIndex))
+            _voltagePoint = _sampler.nextVoltage()
+            while _voltagePoint is not None:
+
+                # The instrument returns None if it was interrupted by the abort event, or if it failed. A failed point is retried, then skipped or aborts.
+                _measuredPoint = self.measurePointWithRetries(_voltagePoint, recipe["Sweep Settings"]["Point Retries"])
+                if not self.measurementConsent:
+                    break
+                if _measuredPoint is None:
+                    if not self.respondFailedPoint(_voltagePoint, recipe):
+                        break
+                    _pointsSkipped += 1
+                    _voltagePoint = _sampler.nextVoltage()
+                    continue
+
+                _sweepPoint[0, 0], _sweepPoint[0, 1] = _measuredPoint
+                if self.telemetry is not None:
+                    self.telemetry.pointSent()
+                self.sendSweepPointSignal.emit(_sweepPoint.copy(), time.perf_counter()) # .copy() otherwise the for loop "catches up" with the emit signal, and you end up writing over the data being emitted.
+
+                _sampler.addPoint(*_measuredPoint)
+                _pointsMeasured += 1
+                _voltagePoint = _sampler.nextVoltage()
+
+            # Only send finaliseSweepArraySignal IF the program finished the loop with measurement consent
+            if self.measurementConsent:
+                _skippedMessage = f", {_pointsSkipped} failed point{'s' if _pointsSkipped > 1 else ''} skipped" if _pointsSkipped else ""
+                if _pointsMeasured == 0:
+                    self.sendConsoleUpdateSignal.emit(f"WARNING: Sweep {_sweepNumber} of {_sweepCount} has no points, it is not saved{_skippedMessage}.")
+                    continue # Nothing for the Data Handler to finalise
+                self.sendConsoleUpdateSignal.emit(f"Sweep Finished ({_sweepNumber} of {_sweepCount}){_skippedMessage}")
+                self.finaliseSweepArraySignal.emit()
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+from datetime import datetime
+
+# Columns of a tracking sample, as emitted by MeasurementHandler.trackMPP() and written to the raw data file
+TRACKING_COLUMNS = ("Time (s)", "Voltage (V)", "Current (A)", "Power (W)")
+ROLLUP_CHANNELS = ("Voltage (V)", "Current (A)", "Power (W)")
+
+# (seconds per bucket, buckets kept): an hour of seconds, a week of minutes and a year of hours, about 2 MB whatever the length of the run
+ROLLUP_LEVELS = ((1, 3600), (60, 10080), (3600, 8760))
+
+class RingBuffer():
+    """Fixed size table of rows, the oldest row is overwritten once it is full."""
+    def __init__(self, capacity, columns):
+        self.data = np.empty((capacity, columns))
+        self.capacity = capacity
+        self.size = 0
+        self.nextRow = 0
+
+    def append(self, row):
+        self.data[self.nextRow] = row
+        self.nextRow = (self.nextRow + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def array(self):
+        """Returns a copy of the rows, oldest first."""
+        if self.size < self.capacity:
+            return self.data[:self.size].copy()
+        return np.concatenate((self.data[self.nextRow:], self.data[:self.nextRow]))
+
+class RollupLevel():
+    """
+    Min, mean and max of every channel over consecutive buckets of the same length, the finished buckets kept in a ring buffer.
+
+    Rows are [bucket start time, min, mean, max of the first channel, min, mean, max of the second, ...].
+    """
+    def __init__(self, period, capacity, channels=len(ROLLUP_CHANNELS)):
+        self.period = period
+        self.buffer = RingBuffer(capacity, 1 + 3 * channels)
+        self.bucketStart = None
+        self.count = 0
+        self.total = np.zeros(channels)
+        self.minimum = np.zeros(channels)
+        self.maximum = np.zeros(channels)
+
+    def add(self, timestamp, values):
+        _bucketStart = timestamp - timestamp % self.period
+        if self.count and _bucketStart != self.bucketStart:
+            self.closeBucket()
+
+        if not self.count:
+            self.bucketStart = _bucketStart
+            self.total[:] = 0
+            self.minimum[:] = values
+            self.maximum[:] = values
+        self.count += 1
+        self.total += values
+        np.minimum(self.minimum, values, out=self.minimum)
+        np.maximum(self.maximum, values, out=self.maximum)
+
+    def currentRow(self):
+        return np.concatenate(([self.bucketStart], np.column_stack((self.minimum, self.total / self.count, self.maximum)).ravel()))
+
+    def closeBucket(self):
+        self.buffer.append(self.currentRow())
+        self.count = 0
+
+    def array(self):
+        """Returns the finished buckets and the bucket still filling, so a plot is always up to date."""
+        _rows = self.buffer.array()
+        if self.count:
+            _rows = np.vstack((_rows, self.currentRow()))
+        return _rows
+
+    def span(self):
+        """(s) Time covered by a full ring buffer."""
+        return self.period * self.buffer.capacity
+
+class TrackingRollups():
+    """Every tracking sample is added to each level, so each keeps its own exact min/mean/max. Memory and the size of a plot stay constant."""
+    def __init__(self, levels=ROLLUP_LEVELS):
+        self.levels = [RollupLevel(_period, _capacity) for _period, _capacity in levels]
+        self.startTime = None
+
+    def add(self, samples):
+        """samples: (np.ndarray) rows of TRACKING_COLUMNS."""
+        for _sample in samples:
+            if self.startTime is None:
+                self.startTime = _sample[0]
+            for _level in self.levels:
+                _level.add(_sample[0], _sample[1:])
+
+    def levelForDuration(self, duration):
+        """Returns the finest level that still holds the whole run, or the coarsest one."""
+        for _level in self.levels:
+            if duration <= _level.span():
+                return _level
+        return self.levels[-1]
+
+    def plotArray(self, now):
+        """Rollup rows to plot, at the finest resolution that covers the run so far."""
+        _duration = 0 if self.startTime is None else now - self.startTime
+        return self.levelForDuration(_duration).array()
+
+class TrackingRecorder():
+    """
+    Streams the raw tracking samples to a text file as they arrive, in the same layout as the sweep files.
+
+    Writes go through the file buffer and flush() is called about once a second, so a crash loses at most the last second of a run of any length.
+    """
+    def __init__(self, recipe):
+        _fileSettings = recipe["File I/O Settings"]
+        _tracking = recipe["Tracking Settings"]
+        self.startTime = datetime.now()
+        _cellName = _fileSettings["Cell Name"] or "DEFAULT" # Same as DataSaver
+        _fileName = f"{_cellName}_MPP_{self.startTime.strftime('%Y%m%d-%H%M%S')}.csv"
+        self.filePath = os.path.join(_fileSettings["Working Folder Path"], _fileName)
+
+        _header = (f"Timestamp: {self.startTime.isoformat(timespec='seconds')}\nTracking Settings:\nStep (V): {_tracking['Step']}\nInterval (s): {_tracking['Interval']}\n"
+                   f"Duration (s): {_tracking['Duration']}\n\nAnalysis Variables:\nCell Area(cm2): {recipe['Analysis Settings']['Cell Area']}\nPower (mWcm-2): {recipe['Analysis Settings']['Power']}\n\n"
+                   + "   ".join(TRACKING_COLUMNS) + "\n")
+        self.file = open(self.filePath, "w")
+        self.file.write(_header)
+        self.samplesWritten = 0
+
+    def write(self, samples):
+        np.savetxt(self.file, samples, delimiter="   ", fmt=("%.3f", "%.5e", "%.5e", "%.5e"))
+        self.samplesWritten += len(samples)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,211 @@
+import math
+import json
+import time
+import platform
+import numpy as np
+from datetime import datetime
+
+# Latency stages, in pipeline order. Times are time.perf_counter() values, which are comparable between threads.
+STAGE_ACQUISITION_TO_DATA = "Acquisition -> Data Thread"   # Point measured -> received by the Data Handler
+STAGE_ACQUISITION_TO_PLOT = "Acquisition -> Plot Shown"   # Newest point of a plotted array measured -> frame shown by the GUI
+STAGE_PLOT_RENDER = "Plot Render"                          # Drawing a frame on the render thread alone
+STAGE_SAVE = "Save Request -> Saved"                       # Array handed to the save service -> file written (pool queue and disk)
+LATENCY_STAGES = (STAGE_ACQUISITION_TO_DATA, STAGE_ACQUISITION_TO_PLOT, STAGE_PLOT_RENDER, STAGE_SAVE)
+
+# Queue depths, sampled every time an item leaves (or joins) the queue
+QUEUE_POINTS = "Points Queued for Data Thread"
+QUEUE_PLOT_FRAMES = "Plot Frames Queued"
+QUEUE_SAVES = "Saves Pending"
+QUEUE_DEPTHS = (QUEUE_POINTS, QUEUE_PLOT_FRAMES, QUEUE_SAVES)
+
+class LogHistogram():
+    """
+    Histogram with logarithmic buckets: fixed memory, and recording is a log10 and an increment, cheap enough for every point.
+
+    Bucket 0 holds values up to the minimum (e.g. an empty queue), the last bucket everything above the maximum.
+    Each histogram is written by one thread only (the thread of its stage) and read by the GUI, a snapshot can be a record behind, never corrupt.
+    For the same reason the GUI does not clear a histogram itself: reset() only asks for it, and the writing thread clears it before its next record.
+    Until then the histogram reads as empty.
+    """
+    def __init__(self, unit, minimum, maximum, bucketsPerDecade=10):
+        self.unit = unit
+        self.minimum = minimum
+        self.logMinimum = math.log10(minimum)
+        self.bucketsPerDecade = bucketsPerDecade
+        self.bucketCount = int(math.ceil(math.log10(maximum / minimum) * bucketsPerDecade)) + 2
+        self.resetsRequested = 0 # Written by the reading thread
+        self.resetsDone = 0      # Written by the recording thread
+        self.clear()
+
+    def clear(self):
+        self.counts = np.zeros(self.bucketCount, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.maximumValue = 0.0
+
+    def reset(self):
+        """Asks the recording thread to clear the histogram, see the class docstring."""
+        self.resetsRequested += 1
+
+    def resetPending(self):
+        return self.resetsDone != self.resetsRequested
+
+    def record(self, value):
+        if self.resetsDone != self.resetsRequested:
+            _resetsRequested = self.resetsRequested
+            self.clear()
+            self.resetsDone = _resetsRequested # Only after clearing, so a reader never sees the reset done with the old counts
+
+        if value <= self.minimum:
+            _bucket = 0
+        else:
+            _bucket = min(int((math.log10(value) - self.logMinimum) * self.bucketsPerDecade) + 1, self.bucketCount - 1)
+        self.counts[_bucket] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximumValue:
+            self.maximumValue = value
+
+    def upperEdges(self):
+        """Upper edge of every bucket, inf for the overflow bucket."""
+        _edges = self.minimum * 10 ** (np.arange(self.bucketCount) / self.bucketsPerDecade)
+        _edges[-1] = np.inf
+        return _edges
+
+    def snapshot(self):
+        """Returns a copy of the counts, all zero while a reset is pending."""
+        if self.resetPending():
+            return np.zeros(self.bucketCount, dtype=np.int64)
+        return self.counts.copy()
+
+    def percentile(self, fraction, counts=None):
+        """
+        Upper edge of the bucket holding the given fraction of the records (never more than the largest value recorded), NaN if empty.
+        Bucket 0 is reported as 0, it is below the resolution of the histogram (an empty queue, or under 1 us).
+        """
+        _counts = self.counts if counts is None else counts
+        _total = _counts.sum()
+        if _total == 0:
+            return np.nan
+        _bucket = int(np.searchsorted(np.cumsum(_counts), fraction * _total))
+        if _bucket == 0:
+            return 0.0
+        return min(self.upperEdges()[_bucket], self.maximumValue)
+
+    def summary(self):
+        """
+        Returns:
+        _summary: (dict) count, mean, p50, p90, p99 and max, in the unit of the histogram.
+        """
+        _counts = self.snapshot() # One copy, so the percentiles agree with each other while the stage keeps recording
+        _count = int(_counts.sum())
+        return {
+            "unit": self.unit,
+            "count": _count,
+            "mean": self.total / self.count if _count and self.count else np.nan,
+            "p50": self.percentile(0.50, _counts),
+            "p90": self.percentile(0.90, _counts),
+            "p99": self.percentile(0.99, _counts),
+            "max": self.maximumValue if _count else np.nan,
+        }
+
+class PipelineTelemetry():
+    """
+    Stage latency and queue depth histograms for the measurement pipeline, shared by the Measurement Handler, Data Handler, save service and GUI.
+
+    Every stage records into its own histogram from its own thread, so recording takes no locks. Likewise every counter below is written by one
+    thread only, and reset() leaves the clearing to the recording threads (see LogHistogram). Every component takes telemetry=None instead when
+    telemetry is not wanted (headless runs, benchmarks) and skips recording altogether.
+    """
+    def __init__(self):
+        self.latencies = {_stage: LogHistogram("ms", 1e-3, 1e5) for _stage in LATENCY_STAGES}   # 1 us to 100 s
+        self.queueDepths = {_queue: LogHistogram("items", 0.5, 1e6) for _queue in QUEUE_DEPTHS} # Bucket 0 is an empty queue
+        self.startTime = datetime.now()
+
+        # Counters for the queue depths, each written by one thread only. Not cleared by reset(), the difference is what is still queued.
+        self.pointsSent = 0     # Measurement thread
+        self.pointsReceived = 0 # Data thread
+        self.framesSent = 0     # Data thread
+        self.framesRendered = 0 # Render thread
+        self.framesDropped = 0  # Render thread, replaced by a newer frame before they were rendered
+
+    def reset(self):
+        """
+        CALLED FROM: MainWindow (Diagnostics tab)
+
+        Safe during a measurement: every histogram is cleared by its own thread before its next record, and reads as empty until then.
+        """
+        for _histogram in list(self.latencies.values()) + list(self.queueDepths.values()):
+            _histogram.reset()
+        self.startTime = datetime.now()
+
+    def recordLatency(self, stage, startTime, endTime=None):
+        _endTime = time.perf_counter() if endTime is None else endTime
+        self.latencies[stage].record((_endTime - startTime) * 1000)
+
+    def recordQueueDepth(self, queue, depth):
+        self.queueDepths[queue].record(depth)
+
+    def pointSent(self):
+        """CALLED FROM: MeasurementHandler, before emitting a point."""
+        self.pointsSent += 1
+
+    def pointReceived(self, acquisitionTime):
+        """CALLED FROM: DataHandler, for every point."""
+        self.pointsReceived += 1
+        self.recordLatency(STAGE_ACQUISITION_TO_DATA, acquisitionTime)
+        self.recordQueueDepth(QUEUE_POINTS, self.pointsSent - self.pointsReceived)
+
+    def frameSent(self):
+        """CALLED FROM: DataHandler, before emitting an array to plot."""
+        self.framesSent += 1
+
+    def frameDropped(self, count=1):
+        """CALLED FROM: PlotRenderer (in the render thread), with the frames replaced by newer ones since its last render."""
+        self.framesDropped += count
+
+    def frameRendered(self, renderStartTime):
+        """CALLED FROM: PlotRenderer, once a frame has been drawn."""
+        self.framesRendered += 1
+        self.recordLatency(STAGE_PLOT_RENDER, renderStartTime)
+        self.recordQueueDepth(QUEUE_PLOT_FRAMES, self.framesSent - self.framesRendered - self.framesDropped)
+
+    def frameShown(self, acquisitionTime):
+        """CALLED FROM: MainWindow, once a rendered frame has been handed to the plot."""
+        if acquisitionTime > 0:
+            self.recordLatency(STAGE_ACQUISITION_TO_PLOT, acquisitionTime)
+
+    def histograms(self):
+        """Returns (name, histogram) pairs, latencies first, in pipeline order."""
+        return list(self.latencies.items()) + list(self.queueDepths.items())
+
+    def export(self, path):
+        """
+        CALLED FROM: MainWindow (Diagnostics tab)
+
+        Writes every histogram to a JSON file: summary, bucket upper edges (null for the overflow bucket) and counts.
+        """
+        _histograms = {}
+        for _name, _histogram in self.histograms():
+            _summary = _histogram.summary()
+            _histograms[_name] = {
+                **{_key: (None if isinstance(_value, float) and math.isnan(_value) else _value) for _key, _value in _summary.items()},
+                "bucketUpperEdges": [None if math.isinf(_edge) else float(_edge) for _edge in _histogram.upperEdges()],
+                "counts": _histogram.snapshot().tolist(),
+            }
+
+        _report = {
+            "meta": {
+                "since": self.startTime.isoformat(timespec="seconds"),
+                "exported": datetime.now().isoformat(timespec="seconds"),
+                "platform": platform.platform(),
+                "pointsSent": self.pointsSent,
+                "pointsReceived": self.pointsReceived,
+                "framesSent": self.framesSent,
+                "framesRendered": self.framesRendered,
+                "framesDropped": self.framesDropped,
+            },
+            "histograms": _histograms,
+        }
+        with open(path, "w") as file:
+            json.dump(_report, file, indent=4)
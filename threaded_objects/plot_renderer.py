@@ -0,0 +1,172 @@
+import time
+import numpy as np
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QImage
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+def drawSweep(figure, dataToPlot):
+    """Draws a JV sweep (rows of voltage, current)."""
+    figure.clear()
+    ax = figure.add_subplot(111)
+    ax.plot(dataToPlot[:,0], dataToPlot[:,1], "kx-")
+    ax.grid()
+    ax.set_xlabel("Voltage (V)")
+    ax.set_ylabel("Current (A)")
+
+def drawTracking(figure, rollupRows):
+    """
+    Draws the mean power of each tracking rollup bucket, with its min/max as a band. The rows are at the finest resolution covering the run
+    (see mpp_tracking.TrackingRollups.plotArray), so the number of points drawn stays bounded however long the run is.
+    """
+    _hours = (rollupRows[:, 0] - rollupRows[0, 0]) / 3600
+    _powerMinimum, _powerMean, _powerMaximum = rollupRows[:, 7] * 1000, rollupRows[:, 8] * 1000, rollupRows[:, 9] * 1000
+
+    figure.clear()
+    ax = figure.add_subplot(111)
+    ax.fill_between(_hours, _powerMinimum, _powerMaximum, color="0.8", step="post")
+    ax.plot(_hours, _powerMean, "k-", drawstyle="steps-post")
+    ax.grid()
+    ax.set_xlabel("Time (h)")
+    ax.set_ylabel("Power at MPP (mW)")
+
+def drawLatencies(figure, latencyCurves):
+    """Draws latency histograms as steps on a log axis, latencyCurves is a list of (stage, bucket edges (ms), counts)."""
+    figure.clear()
+    ax = figure.add_subplot(111)
+    for _stage, _edges, _counts in latencyCurves:
+        ax.step(_edges, _counts, where="pre", label=_stage)
+    ax.set_xscale("log")
+    ax.set_xlabel("Latency (ms)")
+    ax.set_ylabel("Count")
+    ax.grid()
+    if latencyCurves:
+        ax.legend(fontsize="small")
+
+class PlotRenderer(QObject):
+    """
+    Renders the graph with matplotlib's Agg backend on its own thread, into a QImage the GUI thread only has to copy to the screen.
+
+    Arrays are handed over with submitSweep()/submitTracking() over a DirectConnection, so they are stored straight away by the sender's thread
+    instead of queueing up behind a render. Only the newest array is kept: arrays that arrive while a render is in progress replace each other and
+    only the last one is drawn, the rest are dropped. The final array of a sweep is always the last to arrive, so it is never dropped.
+    """
+    frameRenderedSignal = pyqtSignal(QImage, float) # Finished frame and the acquisition time of its newest point (0 if not a sweep).
+
+    def __init__(self, telemetry=None, dotsPerInch=100):
+        super().__init__()
+        self.telemetry = telemetry
+        self.dotsPerInch = dotsPerInch
+
+        # Object oriented matplotlib only (no pyplot), so the figure belongs to this object and can be drawn outside the GUI thread
+        self.figure = Figure()
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.frameWidth = 640
+        self.frameHeight = 480
+        self.devicePixelRatio = 1.0
+
+        # Newest array waiting to be drawn, shared between the submitting thread and the render thread
+        self.mutexPending = QMutex()
+        self.pendingFrame = None
+        self.renderScheduled = False
+        self.framesDropped = 0 # Sweep frames replaced before they were drawn, handed to the telemetry by the render thread
+        self.lastFrame = None # Redrawn when the plot is resized
+
+    @pyqtSlot(np.ndarray, float)
+    def submitSweep(self, dataToPlot, acquisitionTime):
+        """SLOT CALLED FROM: DataHandler over a DirectConnection, runs in the data thread."""
+        self.submitFrame(("sweep", dataToPlot, acquisitionTime))
+
+    @pyqtSlot(np.ndarray)
+    def submitTracking(self, rollupRows):
+        """SLOT CALLED FROM: DataHandler over a DirectConnection, runs in the data thread."""
+        if len(rollupRows):
+            self.submitFrame(("tracking", rollupRows, 0.0))
+
+    @pyqtSlot(list)
+    def submitLatencies(self, latencyCurves):
+        """SLOT CALLED FROM: DiagnosticsView over a DirectConnection, runs in the GUI thread. See drawLatencies()."""
+        self.submitFrame(("latencies", latencyCurves, 0.0))
+
+    def submitFrame(self, frame):
+        self.mutexPending.lock()
+        _replaced = self.pendingFrame
+        self.pendingFrame = frame
+        _schedule = not self.renderScheduled
+        self.renderScheduled = True
+        # Sweep frames are counted by the telemetry when they are sent, so a dropped one has to be counted as well.
+        # This runs in the data thread or the render thread (setFrameSize), so the drop is only noted here and recorded by renderPending().
+        if _replaced is not None and _replaced[0] == "sweep" and _replaced[2] > 0:
+            self.framesDropped += 1
+        self.mutexPending.unlock()
+
+        if _schedule:
+            QMetaObject.invokeMethod(self, "renderPending", Qt.QueuedConnection)
+
+    @pyqtSlot(int, int, float)
+    def setFrameSize(self, width, height, devicePixelRatio):
+        """SLOT CALLED FROM: PlotView, when the plot is resized. The last frame is drawn again at the new size."""
+        self.frameWidth = max(width, 1)
+        self.frameHeight = max(height, 1)
+        self.devicePixelRatio = devicePixelRatio
+        if self.lastFrame is not None:
+            _kind, _data, _ = self.lastFrame
+            self.submitFrame((_kind, _data, 0.0)) # Not a new acquisition, so no latency is recorded for it
+
+    @pyqtSlot()
+    def renderPending(self):
+        """
+        Draws the newest submitted array. If another one arrived during the render, this is queued again instead of looping, so resize requests
+        are still handled between frames.
+        """
+        self.mutexPending.lock()
+        _frame = self.pendingFrame
+        self.pendingFrame = None
+        if _frame is None:
+            self.renderScheduled = False
+        _framesDropped = self.framesDropped
+        self.framesDropped = 0
+        self.mutexPending.unlock()
+
+        if _framesDropped and self.telemetry is not None:
+            self.telemetry.frameDropped(_framesDropped)
+        if _frame is None:
+            return
+
+        self.render(_frame)
+
+        self.mutexPending.lock()
+        if self.pendingFrame is None:
+            self.renderScheduled = False
+        else:
+            QMetaObject.invokeMethod(self, "renderPending", Qt.QueuedConnection)
+        self.mutexPending.unlock()
+
+    def render(self, frame):
+        _renderStartTime = time.perf_counter()
+        _kind, _data, _acquisitionTime = frame
+        self.lastFrame = frame
+
+        # Pixel size of the frame on screen, so the GUI draws it 1:1 without scaling
+        _dotsPerInch = self.dotsPerInch * self.devicePixelRatio
+        _pixelWidth = int(round(self.frameWidth * self.devicePixelRatio))
+        _pixelHeight = int(round(self.frameHeight * self.devicePixelRatio))
+        self.figure.set_dpi(_dotsPerInch)
+        self.figure.set_size_inches(_pixelWidth / _dotsPerInch, _pixelHeight / _dotsPerInch)
+
+        if _kind == "sweep":
+            drawSweep(self.figure, _data)
+        elif _kind == "latencies":
+            drawLatencies(self.figure, _data)
+        else:
+            drawTracking(self.figure, _data)
+        self.canvas.draw()
+
+        # The Agg buffer is reused by the next draw, so the image gets its own copy of the pixels
+        _buffer = self.canvas.buffer_rgba()
+        _image = QImage(_buffer, _buffer.shape[1], _buffer.shape[0], QImage.Format_RGBA8888).copy()
+        _image.setDevicePixelRatio(self.devicePixelRatio)
+
+        if _kind == "sweep" and _acquisitionTime > 0 and self.telemetry is not None:
+            self.telemetry.frameRendered(_renderStartTime)
+        self.frameRenderedSignal.emit(_image, _acquisitionTime)
@@ -0,0 +1,178 @@
+import copy
+import json
+import math
+import numpy as np
+
+from .voltage_sampler import SAMPLING_MODES
+from .sweep_plan import SWEEP_TYPES
+
+# What happens to a point the instrument still does not return after its retries: the measurement is aborted, or the point is left out
+FAILED_POINT_POLICIES = ("Abort", "Skip")
+
+# A recipe has the same shape as programSettings.json, plus the optional "Recipe Settings" section. Missing values are taken from here.
+DEFAULT_RECIPE = {
+    "Sweep Settings": {
+        "Start Voltage": 1.05,
+        "End Voltage": -0.05,
+        "Scan Rate": 10.0,
+        "Repeats": 1,
+        "Sweep Type": "Standard",      # "Standard", "Reverse", "Hysteresis" or "Multi-Segment", see sweep_plan.SWEEP_TYPES
+        "Segment Voltages": [],        # Multi-Segment: (V) the sweep runs through each voltage in turn, each leg saved as a sweep
+        "Pre-Bias Voltage": None,      # (V) Held before the first sweep of the recipe, None for no hold
+        "Pre-Bias Time": 0.0,          # (s) Length of the pre-bias hold
+        "Points": 250,                 # Uniform: points per sweep. Adaptive: the most points a sweep may take
+        "Sampling": "Uniform",         # "Uniform" or "Adaptive", see voltage_sampler.AdaptiveSampler
+        "Coarse Points": 25,           # Adaptive: evenly spaced points of the first pass
+        "Tolerance": 0.002,            # Adaptive: largest straight-line error between points, as a fraction of the current span
+        "Maximum Current Step": 0.05,  # Adaptive: largest current change between points, as a fraction of the current span
+        "Point Retries": 0,            # Times a point the instrument did not return is measured again
+        "Failed Points": "Abort"       # "Abort" or "Skip", for a point that failed every retry, see FAILED_POINT_POLICIES
+    },
+    "Analysis Settings": {
+        "Cell Area": 0.05,
+        "Power": 0.05
+    },
+    "File I/O Settings": {
+        "Cell Name": "",
+        "Working Folder Path": ""
+    },
+    "Tracking Settings": {
+        "Start Voltage": None,   # (V) Where maximum power point tracking starts, None to start at 80 % of the measured Voc
+        "Step": 0.005,           # (V) Perturb and observe step
+        "Interval": 0.1,         # (s) Wait between tracking samples
+        "Duration": 0.0          # (s) Length of the run, 0 to track until stopped
+    },
+    "Recipe Settings": {
+        "Voc Pre-Check": False,  # Measure Voc before the sweeps
+        "Minimum Voc": 0.0,      # (V) If the pre-check reads lower than this, the recipe is skipped (e.g. no cell connected)
+        "Delay Before": 0.0,     # (s) Wait before the first sweep, e.g. light soaking
+        "Delay After": 0.0       # (s) Wait after the last sweep, e.g. to change cells on a multiplexer
+    }
+}
+
+# Type and limits of every known recipe value, checked by checkRecipe(): (section, key, kind, minimum, minimum allowed). Kinds are "number", "integer",
+# "optional number" (None allowed), "number list", "boolean", "text" or a tuple of the allowed text values. Keys not listed here are not checked.
+RECIPE_LIMITS = (
+    ("Sweep Settings", "Start Voltage", "number", None, True),
+    ("Sweep Settings", "End Voltage", "number", None, True),
+    ("Sweep Settings", "Scan Rate", "number", 0, False),
+    ("Sweep Settings", "Repeats", "integer", 1, True),
+    ("Sweep Settings", "Sweep Type", SWEEP_TYPES, None, True),
+    ("Sweep Settings", "Segment Voltages", "number list", None, True),
+    ("Sweep Settings", "Pre-Bias Voltage", "optional number", None, True),
+    ("Sweep Settings", "Pre-Bias Time", "number", 0, True),
+    ("Sweep Settings", "Points", "integer", 2, True),
+    ("Sweep Settings", "Sampling", SAMPLING_MODES, None, True),
+    ("Sweep Settings", "Coarse Points", "integer", 2, True),
+    ("Sweep Settings", "Tolerance", "number", 0, False),
+    ("Sweep Settings", "Maximum Current Step", "number", 0, False),
+    ("Sweep Settings", "Point Retries", "integer", 0, True),
+    ("Sweep Settings", "Failed Points", FAILED_POINT_POLICIES, None, True),
+    ("Analysis Settings", "Cell Area", "number", 0, True), # 0 only leaves Jsc and the efficiency undefined
+    ("Analysis Settings", "Power", "number", 0, True),
+    ("File I/O Settings", "Cell Name", "text", None, True),
+    ("File I/O Settings", "Working Folder Path", "text", None, True),
+    ("Tracking Settings", "Start Voltage", "optional number", None, True),
+    ("Tracking Settings", "Step", "number", 0, False),
+    ("Tracking Settings", "Interval", "number", 0, True),
+    ("Tracking Settings", "Duration", "number", 0, True),
+    ("Recipe Settings", "Voc Pre-Check", "boolean", None, True),
+    ("Recipe Settings", "Minimum Voc", "number", None, True),
+    ("Recipe Settings", "Delay Before", "number", 0, True),
+    ("Recipe Settings", "Delay After", "number", 0, True),
+)
+
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def checkRecipe(recipe, recipeName="Recipe"):
+    """
+    Checks the type and range of every value listed in RECIPE_LIMITS, so a bad value is reported when the recipe is loaded rather than stopping the
+    measurement thread part way through a queue.
+
+    Raises ValueError naming the recipe, section and key of the first invalid value.
+    """
+    for _section, _key, _kind, _minimum, _minimumAllowed in RECIPE_LIMITS:
+        _values = recipe.get(_section)
+        if not isinstance(_values, dict):
+            raise ValueError(f"{recipeName}: \"{_section}\" must be a JSON object.")
+        _value = _values.get(_key)
+        _name = f"{recipeName}: \"{_section}\" \"{_key}\""
+
+        if isinstance(_kind, tuple):
+            if _value not in _kind:
+                raise ValueError(f"{_name} must be one of {', '.join(_kind)}, not {_value!r}.")
+            continue
+        if _kind == "text":
+            if not isinstance(_value, str):
+                raise ValueError(f"{_name} must be text, not {_value!r}.")
+            continue
+        if _kind == "boolean":
+            if not isinstance(_value, bool):
+                raise ValueError(f"{_name} must be true or false, not {_value!r}.")
+            continue
+        if _kind == "number list":
+            if not isinstance(_value, list) or not all(isNumber(_item) for _item in _value):
+                raise ValueError(f"{_name} must be a list of numbers, not {_value!r}.")
+            continue
+        if _kind == "optional number" and _value is None:
+            continue
+
+        if _kind == "integer" and not (isNumber(_value) and float(_value).is_integer()):
+            raise ValueError(f"{_name} must be a whole number, not {_value!r}.")
+        if not isNumber(_value):
+            raise ValueError(f"{_name} must be a number, not {_value!r}.")
+        if _minimum is not None and (_value < _minimum or (_value == _minimum and not _minimumAllowed)):
+            raise ValueError(f"{_name} must be {'at least' if _minimumAllowed else 'more than'} {_minimum}, not {_value!r}.")
+
+def buildRecipe(settings):
+    """Returns a complete recipe, DEFAULT_RECIPE updated section by section with settings. Unknown sections (e.g. "Instrument Settings") are kept as they are."""
+    _recipe = copy.deepcopy(DEFAULT_RECIPE)
+    for _section, _values in settings.items():
+        if isinstance(_values, dict) and _section in _recipe:
+            _recipe[_section].update(_values)
+        else:
+            _recipe[_section] = copy.deepcopy(_values)
+    return _recipe
+
+def loadRecipeQueue(path):
+    """
+    Loads a measurement recipe queue from a JSON file.
+
+    The file can hold a single recipe (e.g. a copy of programSettings.json), a list of recipes, or {"Recipes": [...]}.
+
+    Returns:
+    _recipes: (list) of complete recipes, see buildRecipe().
+
+    Raises ValueError if the file does not describe any recipes, or a recipe has an invalid value (see checkRecipe()).
+    """
+    with open(path, "r") as file:
+        _loaded = json.load(file)
+
+    if isinstance(_loaded, dict) and "Recipes" in _loaded:
+        _loaded = _loaded["Recipes"]
+    if isinstance(_loaded, dict):
+        _loaded = [_loaded]
+
+    if not isinstance(_loaded, list) or not _loaded or not all(isinstance(_settings, dict) for _settings in _loaded):
+        raise ValueError(f"{path} does not contain a recipe or a list of recipes.")
+
+    _recipes = [buildRecipe(_settings) for _settings in _loaded]
+    for _recipeNumber, _recipe in enumerate(_recipes, start=1):
+        _cellName = _recipe["File I/O Settings"].get("Cell Name") if isinstance(_recipe.get("File I/O Settings"), dict) else None
+        checkRecipe(_recipe, f"Recipe {_recipeNumber}" + (f" ({_cellName})" if isinstance(_cellName, str) and _cellName else ""))
+    return _recipes
+
+def sweepSettingsArray(recipe):
+    """Packs the sweep settings of a recipe the way the measurement code expects them, [[start voltage, end voltage, repeats, scan rate]]."""
+    _sweep = recipe["Sweep Settings"]
+    _sweepSettings = np.empty([1, 4])
+    _sweepSettings[0, :] = [_sweep["Start Voltage"], _sweep["End Voltage"], _sweep["Repeats"], _sweep["Scan Rate"]]
+    return _sweepSettings
+
+def analysisSettingsArray(recipe):
+    """Packs the analysis settings of a recipe, [[cell area, power]]."""
+    _analysis = recipe["Analysis Settings"]
+    _analysisSettings = np.empty([1, 2])
+    _analysisSettings[0, :] = [_analysis["Cell Area"], _analysis["Power"]]
+    return _analysisSettings
@@ -0,0 +1,95 @@
+"""
+Loopback client for the remote control API, see RemoteControlServer.
+
+python -m threaded_objects.remote_control_client status
+python -m threaded_objects.remote_control_client start '{"File I/O Settings": {"Cell Name": "CellA"}}'
+python -m threaded_objects.remote_control_client stream
+"""
+import sys
+import json
+import socket
+import argparse
+import numpy as np
+
+from .remote_control_server import DEFAULT_PORT, FRAME_HEADER, FRAME_REPLY, FRAME_EVENT, FRAME_POINTS, POINTS_HEADER
+
+class RemoteControlClient():
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, timeout=5):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.frames = [] # Event and point frames that arrived while waiting for a reply
+
+    def close(self):
+        self.socket.close()
+
+    def readExactly(self, size):
+        _chunks = []
+        while size:
+            _chunk = self.socket.recv(size)
+            if not _chunk:
+                raise ConnectionError("Remote control server closed the connection.")
+            _chunks.append(_chunk)
+            size -= len(_chunk)
+        return b"".join(_chunks)
+
+    def readFrame(self):
+        """
+        Returns the next frame from the server.
+
+        Returns:
+        _frameType: (int) FRAME_REPLY, FRAME_EVENT or FRAME_POINTS.
+        _content: (dict) for replies and events, or (sequence number, np.ndarray of (voltage, current) rows) for points.
+        """
+        _frameType, _length = FRAME_HEADER.unpack(self.readExactly(FRAME_HEADER.size))
+        _payload = self.readExactly(_length)
+
+        if _frameType == FRAME_POINTS:
+            _sequence, = POINTS_HEADER.unpack_from(_payload)
+            _points = np.frombuffer(_payload, dtype="<f8", offset=POINTS_HEADER.size).reshape(-1, 2)
+            return _frameType, (_sequence, _points)
+        return _frameType, json.loads(_payload)
+
+    def command(self, command, argument=None):
+        """Sends a command and returns the reply. Frames received before the reply are kept in self.frames."""
+        _line = command if argument is None else f"{command} {json.dumps(argument)}"
+        self.socket.sendall(_line.encode("utf-8") + b"\n")
+        while True:
+            _frameType, _content = self.readFrame()
+            if _frameType == FRAME_REPLY:
+                return _content
+            self.frames.append((_frameType, _content))
+
+    def nextFrame(self):
+        """Returns the next event or point frame, kept frames first."""
+        if self.frames:
+            return self.frames.pop(0)
+        return self.readFrame()
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description="Remote control client.")
+    _parser.add_argument("command", choices=["start", "abort", "voc", "status", "stream"])
+    _parser.add_argument("settings", nargs="?", help="JSON settings for start.")
+    _parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    _arguments = _parser.parse_args(argv)
+
+    _client = RemoteControlClient(port=_arguments.port, timeout=None if _arguments.command == "stream" else 5)
+    try:
+        if _arguments.command == "stream":
+            print(_client.command("SUBSCRIBE"))
+            while True:
+                _frameType, _content = _client.nextFrame()
+                if _frameType == FRAME_POINTS:
+                    _sequence, _points = _content
+                    for _offset, (_voltage, _current) in enumerate(_points):
+                        print(f"{_sequence + _offset}   {_voltage:.5e}   {_current:.5e}")
+                else:
+                    print(_content)
+        else:
+            _argument = json.loads(_arguments.settings) if _arguments.settings else None
+            print(_client.command(_arguments.command.upper(), _argument))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _client.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import json
+import struct
+import numpy as np
+from PyQt5.QtCore import *
+from PyQt5.QtNetwork import QTcpServer, QHostAddress
+
+DEFAULT_PORT = 50505
+
+# Top level key of programSettings.json, edited in the file only and read at start up. Off unless enabled: the server has no authentication, so any
+# local process could start or abort a measurement.
+REMOTE_CONTROL_SETTING = "Remote Control"
+DEFAULT_REMOTE_CONTROL = {"Enabled": False, "Port": DEFAULT_PORT}
+
+# Every message from the server is a frame: 1 byte frame type, 4 byte payload length (little endian), then the payload.
+FRAME_HEADER = struct.Struct("<BI")
+FRAME_REPLY = 1   # Payload: UTF-8 JSON, the answer to a command
+FRAME_EVENT = 2   # Payload: UTF-8 JSON, measurement state changes, sent to subscribers
+FRAME_POINTS = 3  # Payload: uint64 sequence number of the first point, then (voltage, current) float64 pairs, sent to subscribers
+POINTS_HEADER = struct.Struct("<Q")
+
+MAXIMUM_PENDING_BYTES = 4_000_000 # A subscriber that falls this far behind is disconnected, rather than buffering without limit
+MAXIMUM_COMMAND_BYTES = 65_536     # A client sending a longer line is disconnected, rather than buffering its input without limit
+
+class RemoteControlServer(QObject):
+    """
+    Local remote control and live data API, on a localhost TCP socket.
+
+    Clients send one command per line:
+    START [json]   Start a measurement with the GUI settings, optionally updated with a programSettings.json style JSON object. Replied to once the
+                   GUI has checked the settings and started (or refused) the measurement.
+    ABORT          Abort the measurement.
+    VOC            Measure Voc, the value is sent as a "voc" event.
+    STATUS         Reply with the measurement state.
+    SUBSCRIBE      Receive events and the live point stream.
+    UNSUBSCRIBE    Stop receiving them.
+
+    Runs on its own thread. Points are collected and sent to subscribers as one binary frame every flushInterval ms, so the stream costs a few
+    socket writes per second however fast the points arrive.
+    """
+    startRequestedSignal = pyqtSignal(int, dict) # Request number and the settings overrides, answered with respondStartResult()
+    abortRequestedSignal = pyqtSignal()
+    measureVocRequestedSignal = pyqtSignal()
+    sendConsoleUpdateSignal = pyqtSignal(str)
+
+    def __init__(self, port=DEFAULT_PORT, flushInterval=50):
+        super().__init__()
+        self.port = port
+        self.flushInterval = flushInterval
+
+        self.isMeasuring = False
+        self.lastVoc = None
+        self.pointSequence = 0   # Number of points streamed since the server started
+        self.pendingPoints = []
+        self.clients = {}        # Socket -> receive buffer
+        self.pendingStarts = {}  # START request number -> socket waiting for the reply
+        self.startRequestCount = 0
+        self.subscribers = set()
+
+    @pyqtSlot()
+    def start(self):
+        """CALLED FROM: QThread.started, the server and its timer must be created in the server thread."""
+        self.flushTimer = QTimer(self)
+        self.flushTimer.setInterval(self.flushInterval)
+        self.flushTimer.timeout.connect(self.flushPoints)
+
+        self.tcpServer = QTcpServer(self)
+        self.tcpServer.newConnection.connect(self.acceptConnections)
+        if self.tcpServer.listen(QHostAddress.LocalHost, self.port):
+            self.sendConsoleUpdateSignal.emit(f"Remote control listening on 127.0.0.1:{self.port}")
+        else:
+            self.sendConsoleUpdateSignal.emit(f"WARNING: Remote control could not listen on 127.0.0.1:{self.port}: {self.tcpServer.errorString()}")
+
+    @pyqtSlot()
+    def stop(self):
+        for _socket in list(self.clients):
+            _socket.disconnectFromHost()
+        if hasattr(self, "tcpServer"):
+            self.tcpServer.close()
+
+    # Connections and commands
+    @pyqtSlot()
+    def acceptConnections(self):
+        while self.tcpServer.hasPendingConnections():
+            _socket = self.tcpServer.nextPendingConnection()
+            self.clients[_socket] = b""
+            _socket.readyRead.connect(lambda socket=_socket: self.readCommands(socket))
+            _socket.disconnected.connect(lambda socket=_socket: self.dropClient(socket))
+
+    def dropClient(self, socket):
+        self.clients.pop(socket, None)
+        self.subscribers.discard(socket)
+        self.pendingStarts = {_request: _socket for _request, _socket in self.pendingStarts.items() if _socket is not socket}
+        socket.deleteLater()
+
+    def readCommands(self, socket):
+        if socket not in self.clients:
+            return
+        _buffer = self.clients[socket] + bytes(socket.readAll())
+        *_lines, self.clients[socket] = _buffer.split(b"\n")
+        if len(self.clients[socket]) > MAXIMUM_COMMAND_BYTES or any(len(_line) > MAXIMUM_COMMAND_BYTES for _line in _lines):
+            self.reply(socket, {"ok": False, "error": f"Command longer than {MAXIMUM_COMMAND_BYTES} bytes, disconnecting."})
+            socket.flush()
+            socket.abort() # Emits disconnected, which drops the client
+            return
+        for _line in _lines:
+            self.runCommand(socket, _line.decode("utf-8", "replace").strip())
+
+    def runCommand(self, socket, line):
+        _command, _, _argument = line.partition(" ")
+        _command = _command.upper()
+
+        if _command == "START":
+            if self.isMeasuring:
+                self.reply(socket, {"ok": False, "error": "A measurement is already running."})
+                return
+            try:
+                _overrides = json.loads(_argument) if _argument else {}
+            except ValueError as error:
+                self.reply(socket, {"ok": False, "error": f"Invalid JSON: {error}"})
+                return
+            if not isinstance(_overrides, dict):
+                self.reply(socket, {"ok": False, "error": "START takes a JSON object."})
+                return
+            self.startRequestCount += 1
+            self.pendingStarts[self.startRequestCount] = socket
+            self.startRequestedSignal.emit(self.startRequestCount, _overrides) # Replied to in respondStartResult(), the checks are made by the GUI
+        elif _command == "ABORT":
+            self.abortRequestedSignal.emit()
+            self.reply(socket, {"ok": True})
+        elif _command == "VOC":
+            if self.isMeasuring:
+                self.reply(socket, {"ok": False, "error": "A measurement is already running."})
+                return
+            self.measureVocRequestedSignal.emit()
+            self.reply(socket, {"ok": True})
+        elif _command == "STATUS":
+            self.reply(socket, {"ok": True, "measuring": self.isMeasuring, "lastVoc": self.lastVoc,
+                                "pointsStreamed": self.pointSequence, "subscribers": len(self.subscribers)})
+        elif _command == "SUBSCRIBE":
+            self.subscribers.add(socket)
+            self.reply(socket, {"ok": True, "nextPoint": self.pointSequence + len(self.pendingPoints)})
+        elif _command == "UNSUBSCRIBE":
+            self.subscribers.discard(socket)
+            self.reply(socket, {"ok": True})
+        elif _command:
+            self.reply(socket, {"ok": False, "error": f"Unknown command {_command}."})
+
+    def reply(self, socket, message):
+        self.writeFrame(socket, FRAME_REPLY, json.dumps(message).encode("utf-8"))
+
+    def writeFrame(self, socket, frameType, payload):
+        socket.write(FRAME_HEADER.pack(frameType, len(payload)) + payload)
+        if socket.bytesToWrite() > MAXIMUM_PENDING_BYTES:
+            socket.abort() # Slow subscriber, see MAXIMUM_PENDING_BYTES
+
+    # Publishing
+    def publishEvent(self, message):
+        self.flushPoints() # Points before the event are sent before it
+        _payload = json.dumps(message).encode("utf-8")
+        for _socket in list(self.subscribers):
+            self.writeFrame(_socket, FRAME_EVENT, _payload)
+
+    @pyqtSlot(np.ndarray, float)
+    def publishPoint(self, sweepPoint, acquisitionTime):
+        """SLOT CALLED FROM: MeasurementHandler, every measured point."""
+        if not self.subscribers:
+            self.pointSequence += len(sweepPoint)
+            return
+        self.pendingPoints.append(sweepPoint)
+        if not self.flushTimer.isActive():
+            self.flushTimer.start()
+
+    @pyqtSlot()
+    def flushPoints(self):
+        if not self.pendingPoints:
+            self.flushTimer.stop()
+            return
+
+        _points = np.ascontiguousarray(np.vstack(self.pendingPoints)[:, :2], dtype="<f8")
+        _payload = POINTS_HEADER.pack(self.pointSequence) + _points.tobytes()
+        self.pointSequence += len(_points)
+        self.pendingPoints = []
+
+        for _socket in list(self.subscribers):
+            self.writeFrame(_socket, FRAME_POINTS, _payload)
+
+    @pyqtSlot()
+    def respondMeasurementStarted(self):
+        self.isMeasuring = True
+        self.publishEvent({"event": "started"})
+
+    @pyqtSlot()
+    def respondSweepFinished(self):
+        self.publishEvent({"event": "sweepFinished"})
+
+    @pyqtSlot()
+    def respondMeasurementFinished(self):
+        self.isMeasuring = False
+        self.publishEvent({"event": "finished"})
+
+    @pyqtSlot()
+    def respondMeasurementAborted(self):
+        self.isMeasuring = False
+        self.publishEvent({"event": "aborted"})
+
+    @pyqtSlot(float)
+    def respondVocValue(self, value):
+        self.lastVoc = value
+        self.publishEvent({"event": "voc", "value": value})
+
+    @pyqtSlot(int, str)
+    def respondStartResult(self, request, errorMessage):
+        """
+        SLOT CALLED FROM: MainWindow (remoteStartMeasurement), with an empty errorMessage if the measurement was started.
+
+        Replies to the client that sent the START, if it is still connected. Refusals are also published to subscribers as an "error" event.
+        """
+        _socket = self.pendingStarts.pop(request, None)
+        if _socket is not None:
+            self.reply(_socket, {"ok": True} if not errorMessage else {"ok": False, "error": errorMessage})
+        if errorMessage:
+            self.publishEvent({"event": "error", "message": errorMessage})
@@ -0,0 +1,125 @@
+import time
+import numpy as np
+from PyQt5.QtCore import *
+
+from .data_saver import DataSaver
+from .data_archiver import DataArchiver
+from .recipe_queue import sweepSettingsArray, analysisSettingsArray
+from .pipeline_telemetry import STAGE_SAVE, QUEUE_SAVES
+
+class SaveService(QObject):
+    """
+    Saves finished sweep arrays with DataSaver and archives the files of a run with DataArchiver once the run is over.
+
+    Lives in the thread that owns it (the Main GUI Thread, or the main thread of the headless runner), the file writing itself runs on thread pools.
+    """
+    figuresOfMeritSignal = pyqtSignal(str, np.ndarray) # Relayed from DataSaver, cell name and [Voc, Jsc, FF, Efficiency] of each saved sweep.
+    runSavedSignal = pyqtSignal()                      # Every sweep of the finished run is saved and its archiving has been started.
+    sendConsoleUpdateSignal = pyqtSignal(str)          # Saves that failed, sweeps that could not be catalogued, and archiving problems.
+
+    def __init__(self, mutex, cataloguePath=None, telemetry=None):
+        super().__init__()
+        self.mutexFileSaving = mutex
+        self.cataloguePath = cataloguePath
+        self.telemetry = telemetry
+
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(1) # Saves run one at a time in the order they arrive, so file numbers follow the measurement order
+
+        # Archiving, the files saved during a run are packed once the run has finished and every save has completed
+        self.archivePool = QThreadPool() # Separate pool so waiting for saves never waits on a running archive
+        self.archivePool.setMaxThreadCount(1)
+        self.runSavedFiles = {} # (working folder, cell name) -> saved file names, a recipe queue can save several cells in one run
+        self.pendingSaves = 0
+        self.archiveRequested = False
+        self.runningArchives = []
+        self.acceptingArchives = True
+
+    @pyqtSlot(np.ndarray, dict)
+    def saveData(self, dataArray, recipe):
+        """
+        CALLED FROM: DataHandler
+        CALL PATH: MainWindow (gatekeeperSweepMeasurement / gatekeeperRecipeQueue) -> MeasurementHandler (runRecipeQueue) -> DataHandler (finaliseArray) -> Here
+
+        The settings are taken from the recipe the sweep was measured with, not from the GUI, as a recipe queue measures many cells with different settings.
+        """
+        _cellName = recipe["File I/O Settings"]["Cell Name"]
+        _workingFolderPath = recipe["File I/O Settings"]["Working Folder Path"]
+
+        _requestTime = time.perf_counter()
+
+        saveDataTask = DataSaver(self.mutexFileSaving, dataArray, sweepSettingsArray(recipe), analysisSettingsArray(recipe), _cellName, _workingFolderPath, self.cataloguePath)
+        saveDataTask.signals.saveFinishedSignal.connect(lambda fileName, errorMessage: self.respondSaveFinished(_workingFolderPath, _cellName, fileName, errorMessage, _requestTime), Qt.QueuedConnection)
+        saveDataTask.signals.figuresOfMeritSignal.connect(self.figuresOfMeritSignal, Qt.QueuedConnection)
+        self.pendingSaves += 1
+        if self.telemetry is not None:
+            self.telemetry.recordQueueDepth(QUEUE_SAVES, self.pendingSaves)
+        self.threadpool.start(saveDataTask) # Not waited for here, the shutdown flushes any save still running
+
+    def respondSaveFinished(self, workingFolderPath, cellName, fileName, errorMessage, requestTime):
+        """
+        CALLED FROM: DataSaver, for every save whether it succeeded or not, so a failed save never holds back the archiving of the run.
+        """
+        if self.telemetry is not None:
+            self.telemetry.recordLatency(STAGE_SAVE, requestTime)
+        self.pendingSaves -= 1
+        if errorMessage:
+            self.sendConsoleUpdateSignal.emit(errorMessage)
+        if fileName:
+            self.runSavedFiles.setdefault((workingFolderPath, cellName), []).append(fileName)
+        self.startArchiveThread()
+
+    @pyqtSlot()
+    def requestArchive(self):
+        """
+        SLOT CALLED FROM: DataHandler, once the last sweep of a run has been sent for saving.
+        """
+        self.archiveRequested = True
+        self.startArchiveThread()
+
+    def startArchiveThread(self):
+        """Packs the sweep files of the finished run into a compressed archive, on a low priority thread, once all of its saves have completed."""
+        if not self.archiveRequested or self.pendingSaves > 0:
+            return
+
+        self.runningArchives = [_archiveTask for _archiveTask in self.runningArchives if not _archiveTask.finished]
+        for (_workingFolderPath, _cellName), _fileNames in self.runSavedFiles.items():
+            if not self.acceptingArchives:
+                break # Shutting down, the files stay as loose .csv files
+            archiveTask = DataArchiver(_fileNames, _cellName, _workingFolderPath, self.cataloguePath)
+            archiveTask.setAutoDelete(False) # Kept in self.runningArchives so it can be cancelled
+            archiveTask.signals.sendConsoleUpdateSignal.connect(self.sendConsoleUpdateSignal, Qt.QueuedConnection)
+            self.runningArchives.append(archiveTask)
+            self.archivePool.start(archiveTask)
+
+        self.runSavedFiles = {}
+        self.archiveRequested = False
+        self.runSavedSignal.emit()
+
+    def waitForDone(self):
+        """Blocks until every started save and archive has finished."""
+        self.threadpool.waitForDone()
+        self.archivePool.waitForDone()
+        self.runningArchives = []
+
+    def flush(self, timeout=10000):
+        """
+        CALLED FROM: MainWindow (shutdown)
+
+        Waits for every started save to be written (and catalogued). Archiving is only housekeeping: archives that have not started are dropped and a
+        running one is cancelled, the sweeps stay as loose files. Only waits as long as there is work to finish.
+
+        Returns:
+        _flushed: (bool) False if the saves did not finish within timeout ms.
+        """
+        self.acceptingArchives = False
+        for _archiveTask in self.runningArchives:
+            _archiveTask.cancel()
+        self.archivePool.clear() # Removes archives that have not started yet
+
+        _deadline = time.perf_counter() + timeout / 1000
+        _flushed = self.threadpool.waitForDone(timeout)
+        _remaining = max(0, int((_deadline - time.perf_counter()) * 1000))
+        _flushed = self.archivePool.waitForDone(_remaining) and _flushed
+        self.runningArchives = []
+        return _flushed
@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import zipfile
+import argparse
+import threading
+import numpy as np
+from datetime import datetime
+
+from .analysis_handler import calculateFiguresOfMerit
+from .data_archiver import ARCHIVE_EXTENSION, readSweepFile
+
+CATALOGUE_FILE_NAME = "sweepCatalogue.sqlite"
+SCAN_RATE_TOLERANCE = 1e-9 # (mV/s) Scan rates are stored as floats, query() matches within this
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY,
+    cellName TEXT NOT NULL,
+    sweepNumber INTEGER,
+    timestamp REAL NOT NULL,
+    startVoltage REAL,
+    endVoltage REAL,
+    scanRate REAL,
+    cellArea REAL,
+    power REAL,
+    filePath TEXT NOT NULL UNIQUE,
+    voc REAL,
+    jsc REAL,
+    ff REAL,
+    efficiency REAL
+);
+CREATE INDEX IF NOT EXISTS indexCellTime ON sweeps (cellName, timestamp);
+CREATE INDEX IF NOT EXISTS indexScanRate ON sweeps (scanRate, timestamp);
+CREATE INDEX IF NOT EXISTS indexTime ON sweeps (timestamp);
+CREATE INDEX IF NOT EXISTS indexFF ON sweeps (ff);
+CREATE INDEX IF NOT EXISTS indexEfficiency ON sweeps (efficiency);
+"""
+
+_SWEEP_NAME_PATTERN = re.compile(r"(.+)_(\d+)\.csv$")
+
+# Catalogue files whose schema has been created by this process, so it is not run again for every saved sweep
+_schemaCreated = set()
+_mutexSchema = threading.Lock()
+
+class SweepCatalogue():
+    """
+    SQLite catalogue of every saved sweep, one row per file, so past data can be found without opening the files.
+
+    A connection is opened per call, so the catalogue can be written from DataSaver and DataArchiver runnables on any pool thread.
+    WAL journaling lets the GUI query while a save is writing.
+    """
+    def __init__(self, databasePath=CATALOGUE_FILE_NAME):
+        self.databasePath = databasePath
+
+    def connect(self):
+        _connection = sqlite3.connect(self.databasePath, timeout=10)
+        _connection.row_factory = sqlite3.Row
+
+        # WAL is kept in the file, and the schema only needs creating once, the first connection of the process does both
+        _path = os.path.abspath(self.databasePath)
+        with _mutexSchema:
+            if _path not in _schemaCreated:
+                try:
+                    _connection.execute("PRAGMA journal_mode=WAL")
+                    _connection.executescript(_SCHEMA)
+                except sqlite3.Error:
+                    _connection.close()
+                    raise
+                _schemaCreated.add(_path)
+        return _connection
+
+    def addSweep(self, cellName, sweepNumber, timestamp, sweepSettings, analysisSettings, filePath, figuresOfMerit, connection=None):
+        """
+        Adds (or replaces) the row of a sweep file.
+
+        sweepSettings: (np.ndarray) [start voltage, end voltage, scan rate] in the first row, as in the DataSaver header.
+        analysisSettings: (np.ndarray) [cell area, power].
+        figuresOfMerit: (np.ndarray) [Voc, Jsc, FF, Efficiency], see calculateFiguresOfMerit().
+        """
+        _row = (
+            cellName, sweepNumber, timestamp,
+            float(sweepSettings[0, 0]), float(sweepSettings[0, 1]), float(sweepSettings[0, 2]),
+            float(analysisSettings[0, 0]), float(analysisSettings[0, 1]),
+            os.path.abspath(filePath),
+            *(None if value != value else float(value) for value in figuresOfMerit) # NaN stored as NULL
+        )
+
+        _connection = connection or self.connect()
+        try:
+            with _connection:
+                _connection.execute(
+                    "INSERT OR REPLACE INTO sweeps (cellName, sweepNumber, timestamp, startVoltage, endVoltage, scanRate, cellArea, power, filePath, voc, jsc, ff, efficiency) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _row)
+        finally:
+            if connection is None:
+                _connection.close()
+
+    def updateFilePaths(self, pathPairs):
+        """Moves rows to new file paths, e.g. when DataArchiver packs loose files into an archive. pathPairs: iterable of (oldPath, newPath)."""
+        _connection = self.connect()
+        try:
+            with _connection:
+                _connection.executemany("UPDATE sweeps SET filePath = ? WHERE filePath = ?",
+                                        [(os.path.abspath(_new), os.path.abspath(_old)) for _old, _new in pathPairs])
+        finally:
+            _connection.close()
+
+    def query(self, cellName=None, scanRate=None, since=None, until=None, minFF=None, minEfficiency=None):
+        """
+        Returns the matching rows (sqlite3.Row) ordered by time. Every argument is optional and only narrows the search.
+
+        since/until: (datetime or float) unix timestamps or datetimes.
+        """
+        _conditions = []
+        _values = []
+        if cellName is not None:
+            _conditions.append("cellName = ?")
+            _values.append(cellName)
+        if scanRate is not None:
+            _conditions.append("scanRate BETWEEN ? AND ?") # A range on the column itself, so indexScanRate is used
+            _values += [scanRate - SCAN_RATE_TOLERANCE, scanRate + SCAN_RATE_TOLERANCE]
+        if since is not None:
+            _conditions.append("timestamp >= ?")
+            _values.append(since.timestamp() if isinstance(since, datetime) else since)
+        if until is not None:
+            _conditions.append("timestamp < ?")
+            _values.append(until.timestamp() if isinstance(until, datetime) else until)
+        if minFF is not None:
+            _conditions.append("ff > ?")
+            _values.append(minFF)
+        if minEfficiency is not None:
+            _conditions.append("efficiency > ?")
+            _values.append(minEfficiency)
+
+        _sql = "SELECT * FROM sweeps"
+        if _conditions:
+            _sql += " WHERE " + " AND ".join(_conditions)
+        _sql += " ORDER BY timestamp"
+
+        _connection = self.connect()
+        try:
+            return _connection.execute(_sql, _values).fetchall()
+        finally:
+            _connection.close()
+
+    def rebuild(self, folderPaths, progress=None):
+        """
+        Backfills the catalogue from existing working folders, loose .csv files and archives alike.
+
+        Files written before the header carried a timestamp use the file (or archive member) modification time. Archives that cannot be read
+        (half written, corrupt or foreign zip files) are skipped, the rest of the folder is still catalogued.
+
+        Returns:
+        _added: (int) number of sweeps catalogued.
+        _skippedArchives: (int) number of archives that could not be read.
+        """
+        _added = 0
+        _skippedArchives = 0
+        _connection = self.connect()
+        try:
+            for _folderPath in folderPaths:
+                for _fileName in sorted(os.listdir(_folderPath)):
+                    _path = os.path.join(_folderPath, _fileName)
+
+                    if _fileName.endswith(ARCHIVE_EXTENSION):
+                        try:
+                            with zipfile.ZipFile(_path, "r") as _archive:
+                                _members = [(_info.filename, time.mktime(_info.date_time + (0, 0, -1))) for _info in _archive.infolist()]
+                        except (OSError, zipfile.BadZipFile) as error:
+                            _skippedArchives += 1
+                            if progress:
+                                progress(f"Skipped archive {_path}: {error}")
+                            continue
+                        _sweeps = [(os.path.join(_path, _memberName), _memberName, _modified) for _memberName, _modified in _members]
+                    else:
+                        _sweeps = [(_path, _fileName, os.path.getmtime(_path))]
+
+                    for _sweepPath, _sweepName, _modified in _sweeps:
+                        _match = _SWEEP_NAME_PATTERN.match(_sweepName)
+                        if not _match:
+                            continue
+                        try:
+                            self.addFile(_sweepPath, _match.group(1), int(_match.group(2)), _modified, _connection)
+                        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as error: # BadZipFile for a corrupt archive member
+                            if progress:
+                                progress(f"Skipped {_sweepPath}: {error}")
+                            continue
+                        _added += 1
+                        if progress:
+                            progress(_sweepPath)
+        finally:
+            _connection.close()
+        return _added, _skippedArchives
+
+    def addFile(self, path, cellName, sweepNumber, modifiedTime, connection=None):
+        """Catalogues an existing sweep file from its header and data."""
+        _settings, _dataArray = readSweepFile(path)
+
+        _timestamp = modifiedTime
+        if "Timestamp" in _settings:
+            _timestamp = datetime.fromisoformat(_settings["Timestamp"]).timestamp()
+
+        _sweepSettings = np.array([[_settings["Start Voltage (V)"], _settings["End Voltage (V)"], _settings["Scan Rate (mV/s)"]]])
+        _analysisSettings = np.array([[_settings["Cell Area(cm2)"], _settings["Power (mWcm-2)"]]])
+        _figuresOfMerit = calculateFiguresOfMerit(_dataArray, _analysisSettings[0, 0], _analysisSettings[0, 1])
+
+        self.addSweep(cellName, sweepNumber, _timestamp, _sweepSettings, _analysisSettings, path, _figuresOfMerit, connection)
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description="Sweep catalogue maintenance.")
+    _subparsers = _parser.add_subparsers(dest="command", required=True)
+    _rebuildParser = _subparsers.add_parser("rebuild", help="Backfill the catalogue from existing working folders.")
+    _rebuildParser.add_argument("folders", nargs="+", help="Working folders to scan.")
+    _rebuildParser.add_argument("--database", default=CATALOGUE_FILE_NAME, help=f"Catalogue file (default: {CATALOGUE_FILE_NAME}).")
+    _arguments = _parser.parse_args(argv)
+
+    _catalogue = SweepCatalogue(_arguments.database)
+    _added, _skippedArchives = _catalogue.rebuild(_arguments.folders, progress=print)
+    print(f"{_added} sweeps catalogued in {_arguments.database}" + (f", {_skippedArchives} unreadable archives skipped" if _skippedArchives else ""))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import os
+import re
+import hashlib
+import zipfile
+from collections import namedtuple
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QImage, QPainter, QPen, QColor, QPolygonF
+
+from .data_archiver import ARCHIVE_EXTENSION, readSweepFile
+
+THUMBNAIL_CACHE_FOLDER = "thumbnailCache" # Next to programSettings.json, like the sweep catalogue
+THUMBNAIL_WIDTH = 96
+THUMBNAIL_HEIGHT = 48
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024 # Tens of thousands of thumbnails, the least recently used are deleted beyond this
+
+SWEEP_FILE_PATTERN = re.compile(r".+_\d+\.csv$") # DataSaver file names, tracking files (..._MPP_<date-time>.csv) are left out
+
+# One sweep file. path is the archive path joined with the member name for archived sweeps (see data_archiver.splitArchivePath),
+# container the archive name or "" for a loose file. cacheStamp identifies the version of the file for the thumbnail cache.
+SweepEntry = namedtuple("SweepEntry", ("name", "path", "modified", "size", "container", "cacheStamp"))
+
+def listSweepFiles(folderPath):
+    """
+    Lists the sweeps of a folder from file metadata only: os.scandir for loose files, the zip central directory for archives.
+    No sweep is opened or decompressed.
+
+    Returns:
+    _entries: (list) SweepEntry per sweep, unsorted.
+    """
+    _entries = []
+    with os.scandir(folderPath) as _scan:
+        for _dirEntry in _scan:
+            if not _dirEntry.is_file():
+                continue
+            if SWEEP_FILE_PATTERN.match(_dirEntry.name):
+                _stat = _dirEntry.stat()
+                _entries.append(SweepEntry(_dirEntry.name, _dirEntry.path, _stat.st_mtime, _stat.st_size, "", f"{_stat.st_mtime_ns}:{_stat.st_size}"))
+            elif _dirEntry.name.endswith(ARCHIVE_EXTENSION):
+                _stat = _dirEntry.stat()
+                try:
+                    with zipfile.ZipFile(_dirEntry.path, "r") as _archive:
+                        _members = _archive.infolist()
+                except (OSError, zipfile.BadZipFile):
+                    continue # Half written or foreign archive, skipped rather than stopping the listing
+
+                # Archives are never rewritten, so the archive's own mtime is enough to tell versions apart
+                for _member in _members:
+                    _modified = QDateTime(QDate(*_member.date_time[:3]), QTime(*_member.date_time[3:])).toSecsSinceEpoch()
+                    _entries.append(SweepEntry(_member.filename, f"{_dirEntry.path}/{_member.filename}", float(_modified), _member.file_size,
+                                               _dirEntry.name, f"{_stat.st_mtime_ns}:{_stat.st_size}"))
+    return _entries
+
+def thumbnailCachePath(cacheFolder, entry):
+    """Cache file of a sweep's thumbnail, keyed by its path and version, so a changed file never shows a stale thumbnail."""
+    _key = hashlib.sha1(f"{os.path.abspath(entry.path)}|{entry.cacheStamp}|{THUMBNAIL_WIDTH}x{THUMBNAIL_HEIGHT}".encode("utf-8")).hexdigest()
+    return os.path.join(cacheFolder, _key[:2], _key + ".png")
+
+def pruneThumbnailCache(cacheFolder, maximumBytes=THUMBNAIL_CACHE_BYTES):
+    """
+    Deletes the least recently used thumbnails until the cache is within maximumBytes, and any leftover .partial files. Thumbnails of files that
+    were changed, moved or deleted are never used again, so they are the first to go. ThumbnailLoader updates the mtime of every thumbnail it
+    reads, as the atime is not kept up to date on many file systems.
+
+    Returns:
+    _removedCount: (int) number of files deleted.
+    """
+    _thumbnails = []
+    _totalBytes = 0
+    _removedCount = 0
+    for _folderPath, _, _fileNames in os.walk(cacheFolder):
+        for _fileName in _fileNames:
+            _path = os.path.join(_folderPath, _fileName)
+            try:
+                if _fileName.endswith(".partial"):
+                    os.remove(_path)
+                    _removedCount += 1
+                    continue
+                _stat = os.stat(_path)
+            except OSError:
+                continue # Removed or locked by another instance, looked at again next time
+            _thumbnails.append((_stat.st_mtime, _stat.st_size, _path))
+            _totalBytes += _stat.st_size
+
+    _thumbnails.sort()
+    for _modified, _size, _path in _thumbnails:
+        if _totalBytes <= maximumBytes:
+            break
+        try:
+            os.remove(_path)
+        except OSError:
+            continue
+        _totalBytes -= _size
+        _removedCount += 1
+    return _removedCount
+
+def drawThumbnail(dataArray, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    """
+    Draws a JV curve as a plain polyline with QPainter, with the zero current line in grey. Far cheaper than a matplotlib figure and,
+    drawing on a QImage without text, safe outside the GUI thread.
+    """
+    _image = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+    _image.fill(Qt.white)
+    if dataArray.shape[0] < 2:
+        return _image
+
+    _voltage, _current = dataArray[:, 0], dataArray[:, 1]
+    _margin = 3
+    _voltageMinimum, _voltageSpan = _voltage.min(), max(float(_voltage.max() - _voltage.min()), 1e-12)
+    _currentMinimum, _currentSpan = min(_current.min(), 0.0), max(float(max(_current.max(), 0.0) - min(_current.min(), 0.0)), 1e-12)
+
+    def toPixel(v, i):
+        return QPointF(_margin + (v - _voltageMinimum) / _voltageSpan * (width - 2 * _margin),
+                       height - _margin - (i - _currentMinimum) / _currentSpan * (height - 2 * _margin))
+
+    _painter = QPainter(_image)
+    _painter.setRenderHint(QPainter.Antialiasing)
+    _painter.setPen(QPen(QColor(190, 190, 190), 1))
+    _painter.drawLine(toPixel(_voltageMinimum, 0.0), toPixel(_voltageMinimum + _voltageSpan, 0.0))
+    _painter.setPen(QPen(Qt.black, 1))
+    _painter.drawPolyline(QPolygonF([toPixel(_v, _i) for _v, _i in zip(_voltage, _current)]))
+    _painter.end()
+    return _image
+
+class FolderScannerSignals(QObject):
+    folderScannedSignal = pyqtSignal(int, list) # Scan generation and the SweepEntry list of the folder.
+
+class FolderScanner(QRunnable):
+    """Lists a folder with listSweepFiles() on a pool thread, so a slow network share never blocks the GUI."""
+    def __init__(self, folderPath, generation):
+        super().__init__()
+        self.folderPath = folderPath
+        self.generation = generation
+        self.signals = FolderScannerSignals()
+
+    def run(self):
+        try:
+            _entries = listSweepFiles(self.folderPath)
+        except OSError:
+            _entries = []
+        self.signals.folderScannedSignal.emit(self.generation, _entries)
+
+class ThumbnailCachePruner(QRunnable):
+    """Runs pruneThumbnailCache() on a pool thread, once per program run when the browser is first opened."""
+    def __init__(self, cacheFolder):
+        super().__init__()
+        self.cacheFolder = cacheFolder
+
+    def run(self):
+        pruneThumbnailCache(self.cacheFolder)
+
+class ThumbnailLoaderSignals(QObject):
+    thumbnailLoadedSignal = pyqtSignal(int, str, QImage) # Scan generation, sweep path and its thumbnail (null if the sweep could not be read).
+
+class ThumbnailLoader(QRunnable):
+    """
+    Loads one thumbnail: from the disk cache if it is there, otherwise the sweep is read, drawn and written to the cache for next time.
+    """
+    def __init__(self, entry, cacheFolder, generation):
+        super().__init__()
+        self.entry = entry
+        self.cacheFolder = cacheFolder
+        self.generation = generation
+        self.signals = ThumbnailLoaderSignals()
+
+    def run(self):
+        _cachePath = thumbnailCachePath(self.cacheFolder, self.entry)
+        _image = QImage(_cachePath)
+
+        if _image.isNull():
+            try:
+                _, _dataArray = readSweepFile(self.entry.path)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                _dataArray = None
+
+            # A file that only looks like a sweep by its name (no voltage and current columns) is unreadable too, nothing is cached for it
+            if _dataArray is None or _dataArray.ndim != 2 or _dataArray.shape[1] < 2:
+                self.signals.thumbnailLoadedSignal.emit(self.generation, self.entry.path, QImage())
+                return
+            _image = drawThumbnail(_dataArray)
+
+            # Written under a temporary name and renamed, so a reader never sees half a file. A cache that cannot be written only costs speed.
+            try:
+                os.makedirs(os.path.dirname(_cachePath), exist_ok=True)
+                _partialPath = _cachePath + ".partial"
+                if _image.save(_partialPath, "PNG"):
+                    os.replace(_partialPath, _cachePath)
+            except OSError:
+                pass
+
+        else:
+            # Marks the thumbnail as used for pruneThumbnailCache()
+            try:
+                os.utime(_cachePath)
+            except OSError:
+                pass
+
+        self.signals.thumbnailLoadedSignal.emit(self.generation, self.entry.path, _image)
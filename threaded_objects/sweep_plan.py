@@ -0,0 +1,118 @@
+import functools
+import numpy as np
+
+# "Standard" runs from the start to the end voltage, "Reverse" from the end to the start voltage, "Hysteresis" start -> end -> start as one
+# continuous waveform, "Multi-Segment" through every voltage of "Segment Voltages" in turn. Every leg is saved as a sweep of its own.
+SWEEP_TYPES = ("Standard", "Reverse", "Hysteresis", "Multi-Segment")
+
+# Sweep Settings only set in programSettings.json or a recipe file, the GUI keeps them as they were loaded
+FILE_ONLY_SETTINGS = ("Segment Voltages", "Pre-Bias Voltage", "Pre-Bias Time", "Point Retries", "Failed Points")
+
+# Columns of SweepPlan.table
+PLAN_VOLTAGE = 0 # (V)
+PLAN_TIME = 1    # (s) Nominal time from the start of the run, at the scan rate, after any pre-bias hold. Later repeats add repeatDuration per repeat.
+PLAN_SWEEP = 2   # Index of the leg the point belongs to, within the repeat
+
+class SweepPlan():
+    """
+    The voltages of a whole run, compiled once as one read-only table.
+
+    Every repeat measures the same legs, so the table only holds the first repeat: sweep n of the run is leg n % len(repeatLegs), and its times are
+    those of the leg plus repeatDuration for every repeat before it. The size of a plan does not depend on "Repeats".
+    Plans are cached by their settings (see compileSweepPlan), so a recipe measured again or a queue of identical recipes never rebuilds them.
+    They must not be modified.
+
+    table: (np.ndarray) rows of [voltage, nominal time, leg index] of one repeat, see PLAN_VOLTAGE, PLAN_TIME and PLAN_SWEEP.
+    repeatLegs: (tuple) (start voltage, end voltage) of every leg of one repeat, in order.
+    repeats: (int) number of times the table is measured.
+    legStarts: (np.ndarray) first row of every leg in table, with the row count appended, so leg n is table[legStarts[n]:legStarts[n+1]].
+    repeatDuration: (s) nominal time of one repeat, a repeat jumps back to the first voltage at once.
+    holdVoltage, holdTime: pre-bias hold before the first sweep, holdTime 0 for none.
+    """
+    def __init__(self, table, repeatLegs, repeats, holdVoltage, holdTime):
+        self.table = table
+        self.repeatLegs = repeatLegs
+        self.repeats = repeats
+        self.holdVoltage = holdVoltage
+        self.holdTime = holdTime
+        self.repeatDuration = float(table[-1, PLAN_TIME]) - holdTime
+        self.legStarts = np.searchsorted(table[:, PLAN_SWEEP], np.arange(len(repeatLegs) + 1))
+        self.table.setflags(write=False)
+        self.legStarts.setflags(write=False)
+
+    @property
+    def sweepCount(self):
+        return len(self.repeatLegs) * self.repeats
+
+    def leg(self, sweepIndex):
+        """(start voltage, end voltage) of a sweep of the run."""
+        return self.repeatLegs[sweepIndex % len(self.repeatLegs)]
+
+    def sweepVoltages(self, sweepIndex):
+        """Voltages of a sweep of the run, a read-only view of the table."""
+        _legIndex = sweepIndex % len(self.repeatLegs)
+        return self.table[self.legStarts[_legIndex]:self.legStarts[_legIndex + 1], PLAN_VOLTAGE]
+
+def sweepLegs(sweepType, startVoltage, endVoltage, segmentVoltages=()):
+    """
+    Returns:
+    _legs: (list) (start voltage, end voltage) of each sweep of one repeat.
+
+    Raises ValueError for an unknown sweep type, or a multi-segment sweep with fewer than two voltages.
+    """
+    if sweepType == "Standard":
+        return [(startVoltage, endVoltage)]
+    if sweepType == "Reverse":
+        return [(endVoltage, startVoltage)]
+    if sweepType == "Hysteresis":
+        return [(startVoltage, endVoltage), (endVoltage, startVoltage)]
+    if sweepType == "Multi-Segment":
+        if len(segmentVoltages) < 2:
+            raise ValueError("A Multi-Segment sweep needs at least two \"Segment Voltages\".")
+        return list(zip(segmentVoltages[:-1], segmentVoltages[1:]))
+    raise ValueError(f"Sweep type must be one of {', '.join(SWEEP_TYPES)}.")
+
+@functools.lru_cache(maxsize=32)
+def compileSweepPlan(sweepType, startVoltage, endVoltage, points, scanRate, repeats, segmentVoltages=(), holdVoltage=None, holdTime=0.0):
+    """
+    Compiles the plan of a run. Arguments must be hashable (segmentVoltages a tuple), use compileRecipePlan() for a recipe.
+
+    Every leg is spaced as close as it can be to the voltage step of a standard sweep of "Points" points over the longest leg, so the spacing is about
+    the same whatever the sweep type.
+    Consecutive legs share their turning voltage, which is measured at the end of one sweep and at the start of the next, so each saved sweep is
+    complete. Times advance at the scan rate. Only one repeat is built, see SweepPlan.
+
+    Raises ValueError for invalid settings.
+    """
+    _legs = sweepLegs(sweepType, startVoltage, endVoltage, segmentVoltages)
+    if int(points) < 2:
+        raise ValueError("A sweep needs at least two points.")
+    if scanRate <= 0:
+        raise ValueError("The scan rate must be positive.")
+    if any(_legStart == _legEnd for _legStart, _legEnd in _legs):
+        raise ValueError("Every sweep needs different start and end voltages.")
+
+    _longestLeg = max(abs(_legEnd - _legStart) for _legStart, _legEnd in _legs)
+    _step = _longestLeg / (int(points) - 1)
+    _legVoltages = [np.linspace(_legStart, _legEnd, num=max(int(round(abs(_legEnd - _legStart) / _step)) + 1, 2)) for _legStart, _legEnd in _legs]
+
+    _voltages = np.concatenate(_legVoltages)
+    _legIndexes = np.repeat(np.arange(len(_legVoltages)), [len(_leg) for _leg in _legVoltages])
+
+    # Time to scan each step at the scan rate, the first point of the repeat is where the run starts
+    _steps = np.abs(np.diff(_voltages, prepend=_voltages[0]))
+    _holdTime = float(holdTime) if holdVoltage is not None else 0.0
+    _times = _holdTime + np.cumsum(_steps) / (scanRate / 1000)
+
+    return SweepPlan(np.column_stack((_voltages, _times, _legIndexes)), tuple(_legs), max(int(repeats), 1), holdVoltage, _holdTime)
+
+def compileRecipePlan(recipe):
+    """Returns the (cached) SweepPlan of a recipe's sweep settings. Raises ValueError for invalid settings (TypeError for values that are not numbers)."""
+    _sweep = recipe["Sweep Settings"]
+    return compileSweepPlan(_sweep["Sweep Type"], float(_sweep["Start Voltage"]), float(_sweep["End Voltage"]), int(_sweep["Points"]),
+                            float(_sweep["Scan Rate"]), int(_sweep["Repeats"]), tuple(float(_voltage) for _voltage in _sweep["Segment Voltages"]),
+                            None if _sweep["Pre-Bias Voltage"] is None else float(_sweep["Pre-Bias Voltage"]), float(_sweep["Pre-Bias Time"]))
+
+def legRecipe(recipe, legStart, legEnd):
+    """The recipe with the start and end voltage of one leg, so the saved file header and the adaptive sampler describe that sweep."""
+    return {**recipe, "Sweep Settings": {**recipe["Sweep Settings"], "Start Voltage": legStart, "End Voltage": legEnd}}
@@ -0,0 +1,140 @@
+import numpy as np
+
+SAMPLING_MODES = ("Uniform", "Adaptive")
+
+def createSampler(recipe, plannedVoltages=None):
+    """
+    Returns the sampler for the "Sampling" mode of the recipe, which hands the measurement loop its voltages.
+
+    plannedVoltages: (np.ndarray or None) the voltages of the sweep from its compiled sweep plan, measured as they are unless sampling is adaptive.
+    """
+    _sweep = recipe["Sweep Settings"]
+    if _sweep["Sampling"] == "Adaptive":
+        return AdaptiveSampler(_sweep["Start Voltage"], _sweep["End Voltage"], _sweep["Coarse Points"], _sweep["Points"], _sweep["Tolerance"], _sweep["Maximum Current Step"])
+    if plannedVoltages is not None:
+        return PlannedSampler(plannedVoltages)
+    return UniformSampler(_sweep["Start Voltage"], _sweep["End Voltage"], _sweep["Points"])
+
+def sortAlongSweep(dataArray, recipe):
+    """Orders the points of an adaptive sweep by voltage, in the sweep direction. Uniform sweeps are measured in order already and returned as they are."""
+    _sweep = recipe.get("Sweep Settings", {})
+    if _sweep.get("Sampling") != "Adaptive":
+        return dataArray
+    _order = np.argsort(dataArray[:, 0], kind="stable")
+    if _sweep["End Voltage"] < _sweep["Start Voltage"]:
+        _order = _order[::-1]
+    return dataArray[_order]
+
+class UniformSampler():
+    """Evenly spaced voltages from the start to the end voltage, the standard sweep."""
+    def __init__(self, startVoltage, endVoltage, points=250):
+        self.pendingVoltages = list(np.linspace(startVoltage, endVoltage, num=int(points)))
+
+    def nextVoltage(self):
+        return self.pendingVoltages.pop(0) if self.pendingVoltages else None
+
+    def addPoint(self, voltage, current):
+        pass
+
+class PlannedSampler():
+    """The voltages of one sweep of a compiled sweep plan (see sweep_plan.SweepPlan), in order. Nothing is built per sweep."""
+    def __init__(self, voltages):
+        self.voltages = voltages
+        self.position = 0
+
+    def nextVoltage(self):
+        if self.position >= len(self.voltages):
+            return None
+        self.position += 1
+        return float(self.voltages[self.position - 1])
+
+    def addPoint(self, voltage, current):
+        pass
+
+class AdaptiveSampler():
+    """
+    Chooses the voltages of an adaptive sweep: a coarse, evenly spaced pass, then refinement passes that only measure where the curve needs it.
+
+    After each pass every interval between neighbouring points is checked. An interval is halved if
+    - the error of drawing it as a straight line is above the tolerance. The error is estimated from the curvature (second divided differences of the
+      neighbouring points) as h^2/8 * |I''|, so the knee and the Voc region are refined and the flat regions are not, or
+    - the current changes by more than "Maximum Current Step" across it, so steep regions are never skipped.
+    Both are fractions of the current span of the sweep. Refining stops when no interval needs it, at the point budget, or at the minimum step (the
+    spacing of an evenly spaced sweep of the maximum number of points), below which the instrument noise is larger than the error being chased.
+
+    Each pass runs in the sweep direction, so the voltage only ever steps in one direction within a pass. Points of different passes are interleaved,
+    the Data Handler sorts them along the sweep direction. Cells with strong hysteresis should be measured with uniform sampling.
+
+    Used from the measurement thread: nextVoltage() gives the next voltage to measure, addPoint() hands back the result.
+    """
+    def __init__(self, startVoltage, endVoltage, coarsePoints=25, maximumPoints=250, tolerance=0.002, maximumCurrentStep=0.05):
+        self.startVoltage = startVoltage
+        self.endVoltage = endVoltage
+        self.maximumPoints = max(int(maximumPoints), 2)
+        self.tolerance = tolerance
+        self.maximumCurrentStep = maximumCurrentStep
+        self.minimumStep = abs(endVoltage - startVoltage) / (self.maximumPoints - 1)
+
+        self.voltages = []
+        self.currents = []
+        self.passes = 1
+        self.pendingVoltages = list(np.linspace(startVoltage, endVoltage, num=min(max(int(coarsePoints), 3), self.maximumPoints)))
+
+    def nextVoltage(self):
+        """
+        Returns:
+        _voltage: (float) the next voltage to measure, or None once the sweep is complete.
+        """
+        if not self.pendingVoltages:
+            self.pendingVoltages = self.refinementPass()
+            if not self.pendingVoltages:
+                return None
+            self.passes += 1
+        return self.pendingVoltages.pop(0)
+
+    def addPoint(self, voltage, current):
+        self.voltages.append(voltage)
+        self.currents.append(current)
+
+    def intervalErrors(self):
+        """
+        Returns:
+        _voltages: (np.ndarray) measured voltages, sorted.
+        _errors: (np.ndarray) refinement criterion of each interval between them, as a multiple of its limit (> 1 means the interval needs a point).
+        """
+        _order = np.argsort(self.voltages)
+        _voltages = np.asarray(self.voltages)[_order]
+        _currents = np.asarray(self.currents)[_order]
+        _span = np.ptp(_currents)
+        if _span == 0 or len(_voltages) < 3:
+            return _voltages, np.zeros(max(len(_voltages) - 1, 0))
+
+        _steps = np.diff(_voltages)
+        _steps[_steps == 0] = np.finfo(float).eps # Repeated voltages, e.g. a replayed recording
+        _slopes = np.diff(_currents) / _steps
+        _curvatures = np.abs(2 * np.diff(_slopes) / (_steps[:-1] + _steps[1:])) # At every interior point
+
+        # Each interval takes the larger curvature of its two ends, the end intervals only have one
+        _pointCurvatures = np.concatenate(([_curvatures[0]], _curvatures, [_curvatures[-1]]))
+        _intervalCurvatures = np.maximum(_pointCurvatures[:-1], _pointCurvatures[1:])
+
+        _interpolationErrors = _steps ** 2 / 8 * _intervalCurvatures / (self.tolerance * _span)
+        _currentSteps = np.abs(np.diff(_currents)) / (self.maximumCurrentStep * _span)
+        return _voltages, np.maximum(_interpolationErrors, _currentSteps)
+
+    def refinementPass(self):
+        """Returns the midpoints of the intervals that need refining, worst first within the point budget, in sweep direction order."""
+        _budget = self.maximumPoints - len(self.voltages)
+        if _budget <= 0:
+            return []
+
+        _voltages, _errors = self.intervalErrors()
+        _steps = np.diff(_voltages)
+        _candidates = np.nonzero((_errors > 1) & (_steps / 2 >= self.minimumStep))[0]
+        _candidates = _candidates[np.argsort(_errors[_candidates])[::-1]][:_budget]
+
+        _midpoints = (_voltages[_candidates] + _voltages[_candidates + 1]) / 2
+        _midpoints = np.sort(_midpoints)
+        if self.endVoltage < self.startVoltage:
+            _midpoints = _midpoints[::-1]
+        return list(_midpoints)